@@ -0,0 +1,518 @@
+# Lockstep multiplayer for Pac Pro over asyncio streams: a server that
+# steps every session's Level, a client that mirrors one, and a load
+# generator. The game script runs these for --serve, --connect and
+# --net-load; everything else about the game lives in pac-pro-game.py.
+import asyncio
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+from typing import List, Tuple, Dict, Optional, Callable
+
+def _load_game():
+    # The game script registers itself as `pac_pro_game` when it's loaded;
+    # imported on its own, this loads it from next to this file
+    if "pac_pro_game" not in sys.modules:
+        import importlib.util
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pac-pro-game.py")
+        spec = importlib.util.spec_from_file_location("pac_pro_game", path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["pac_pro_game"] = module
+        spec.loader.exec_module(module)
+
+_load_game()
+
+import pygame
+from pac_pro_game import (DIRECTION_INDEX, DIRECTIONS, FPS, NET_PORT, SCREEN_HEIGHT, SCREEN_WIDTH,
+                          Direction, GhostState, Level, MazeLayout, Pellet, RandomAgent)
+
+# Netplay: one authoritative Level per session, stepped by the server at a
+# fixed tick rate. Clients only send direction changes. Every tick the server
+# sends one snapshot per session, holding only the actors and scores that
+# changed since the last one plus the cells of pellets eaten since. The
+# first snapshot is a keyframe: every actor and score, plus the whole
+# pellet plane.
+NET_TICK_RATE = FPS
+NET_MAX_BUFFER = 256 * 1024  # Unsent bytes before a client is dropped as too slow
+NET_MAX_FRAME = 1 << 20
+NET_JOIN, NET_WELCOME, NET_INPUT, NET_SNAPSHOT, NET_ERROR = range(5)
+NET_FRAME = struct.Struct("<IB")  # payload length, message type
+NET_WELCOME_HEADER = struct.Struct("<BBHHHI")  # player, players, level, ghosts, tick rate, seed; then the maze
+NET_INPUT_RECORD = struct.Struct("<IB")  # tick seen, direction index
+NET_SNAPSHOT_HEADER = struct.Struct("<IBBHHI")  # tick, result, flags, actors, scores, eaten pellets
+NET_ACTOR = struct.Struct("<Hhhbb")  # id, x and y in tenths of a cell, direction index, state
+NET_MAX_CELLS = 0x7FFF // 10  # Widest or tallest maze whose positions fit NET_ACTOR
+NET_SCORE = struct.Struct("<BI")  # player, score
+NET_PELLET = struct.Struct("<I")  # cell index
+NET_KEYFRAME = 1  # Snapshot flag: everything is included; the pellet plane follows, zlib-compressed
+NET_RESULTS = ("PLAYING", "LEVEL_COMPLETE", "GAME_OVER")
+NET_POWERED = 0x40  # Set in a Pac-Man's state byte while a power pellet is active
+
+def actor_records(level: Level) -> List[tuple]:
+    # What clients see of each actor: Pac-Men are ids 0..players - 1 (state
+    # is lives, plus NET_POWERED), ghosts follow (state is the GhostState).
+    # Positions are always whole tenths of a cell, so rounding is exact.
+    records = []
+    for pacman in level.players:
+        state = min(max(pacman.lives, 0), NET_POWERED - 1) | (NET_POWERED if pacman.power_pellet_active else 0)
+        records.append((round(pacman.x * 10), round(pacman.y * 10), DIRECTION_INDEX[pacman.direction], state))
+    for ghost in level.ghosts:
+        records.append((round(ghost.x * 10), round(ghost.y * 10), DIRECTION_INDEX[ghost.direction], ghost.state.value))
+    return records
+
+def net_state(level: Level) -> tuple:
+    # Everything snapshots carry, for checking a client against its session
+    return (level.ticks, actor_records(level), [pacman.score for pacman in level.players],
+            bytes(level.pellets.live))
+
+def check_net_layout(layout: Optional[MazeLayout]):
+    # Positions go out as int16 tenths of a cell, so bigger mazes can't be served
+    if layout is not None and max(layout.width, layout.height) > NET_MAX_CELLS:
+        raise ValueError(f"netplay mazes are at most {NET_MAX_CELLS} cells on a side, "
+                         f"not {layout.width}x{layout.height}")
+
+def net_frame(kind: int, payload: bytes = b"") -> bytes:
+    return NET_FRAME.pack(len(payload), kind) + payload
+
+async def read_net_frame(reader: 'asyncio.StreamReader') -> Tuple[int, bytes]:
+    length, kind = NET_FRAME.unpack(await reader.readexactly(NET_FRAME.size))
+    if length > NET_MAX_FRAME:
+        raise ConnectionError(f"frame of {length} bytes is too large")
+    return kind, await reader.readexactly(length)
+
+class NetSession:
+    # One game on the server. It starts once every player slot is filled
+    # and ends with the level; each tick's snapshot is encoded once and the
+    # same bytes are written to every client.
+    def __init__(self, name: str, players: int, level_num: int, num_ghosts: int,
+                 layout: Optional[MazeLayout], seed: int):
+        self.name = name
+        self.seed = seed
+        self.level = Level(level_num, seed=seed, num_ghosts=num_ghosts, layout=layout, num_players=players)
+        self.level.eaten_log = []
+        # Clients rebuild the level from this, whatever it was made from
+        self.maze = (layout or MazeLayout.from_level(self.level)).to_bytes()
+        self.clients: List[Optional[asyncio.StreamWriter]] = [None] * players
+        self.joined = 0
+        self.started = False
+        self.result = "PLAYING"
+        # What every client was last sent
+        self.actors: List[Optional[tuple]] = []
+        self.scores: List[Optional[int]] = [None] * players
+        
+    def join(self, writer: 'asyncio.StreamWriter') -> int:
+        player = self.clients.index(None)
+        self.clients[player] = writer
+        self.joined += 1
+        return player
+    
+    def leave(self, writer: 'asyncio.StreamWriter'):
+        if writer in self.clients:
+            self.clients[self.clients.index(writer)] = None
+            self.joined -= 1
+            
+    @property
+    def full(self) -> bool:
+        return self.joined == len(self.clients)
+    
+    @property
+    def abandoned(self) -> bool:
+        # Started, and every client has since left or been dropped
+        return self.started and not any(self.clients)
+    
+    def welcome(self, player: int, tick_rate: int) -> bytes:
+        level = self.level
+        return net_frame(NET_WELCOME, NET_WELCOME_HEADER.pack(player, len(self.clients), level.level_num,
+                                                              len(level.ghosts), tick_rate, self.seed) + self.maze)
+        
+    def steer(self, player: int, direction: Direction):
+        # Applied on the next tick, like a key press in the local game
+        self.level.players[player].next_direction = direction
+        
+    def encode(self, keyframe: bool = False) -> bytes:
+        level = self.level
+        records = actor_records(level)
+        if keyframe:
+            self.actors = [None] * len(records)
+            self.scores = [None] * len(level.players)
+        parts = []
+        for i, record in enumerate(records):
+            if record != self.actors[i]:
+                self.actors[i] = record
+                parts.append(NET_ACTOR.pack(i, *record))
+        actors = len(parts)
+        for i, pacman in enumerate(level.players):
+            if pacman.score != self.scores[i]:
+                self.scores[i] = pacman.score
+                parts.append(NET_SCORE.pack(i, pacman.score))
+        scores = len(parts) - actors
+        eaten = level.eaten_log
+        if keyframe:
+            parts.append(zlib.compress(bytes(level.pellets.live)))
+            pellets = 0
+        else:
+            parts.extend(NET_PELLET.pack(i) for i in eaten)
+            pellets = len(eaten)
+        eaten.clear()
+        header = NET_SNAPSHOT_HEADER.pack(level.ticks, NET_RESULTS.index(self.result),
+                                          NET_KEYFRAME if keyframe else 0, actors, scores, pellets)
+        return net_frame(NET_SNAPSHOT, header + b"".join(parts))
+    
+    def broadcast(self, frame: bytes) -> int:
+        # Returns the bytes queued. Clients that can't keep up are dropped;
+        # their Pac-Man carries on in its last direction.
+        sent = 0
+        for i, writer in enumerate(self.clients):
+            if writer is None:
+                continue
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > NET_MAX_BUFFER:
+                writer.close()
+                self.clients[i] = None
+                continue
+            writer.write(frame)
+            sent += len(frame)
+        return sent
+    
+    def close(self):
+        for writer in self.clients:
+            if writer is not None:
+                writer.close()
+        self.clients = [None] * len(self.clients)
+
+class NetplayServer:
+    # Hosts any number of sessions, all stepped by one fixed-rate loop. Ticks
+    # are scheduled against absolute deadlines, so time spent simulating
+    # doesn't stretch the tick; a tick that starts after its deadline is
+    # counted late, and the schedule restarts from now rather than
+    # bursting to catch up.
+    def __init__(self, host: str = "127.0.0.1", port: int = NET_PORT, players: int = 2, level_num: int = 1,
+                 num_ghosts: int = 4, layout: Optional[MazeLayout] = None, tick_rate: int = NET_TICK_RATE,
+                 seed: Optional[int] = None):
+        check_net_layout(layout)
+        self.host = host
+        self.port = port
+        self.players = players
+        self.level_num = level_num
+        self.num_ghosts = num_ghosts
+        self.layout = layout
+        self.tick_rate = tick_rate
+        self.seeds = random.Random(seed)
+        self.sessions: Dict[str, NetSession] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.ticker: Optional[asyncio.Task] = None
+        self.paused = False
+        # Load figures: session-ticks run, seconds spent in Level.update and
+        # in encoding, snapshot bytes queued and late ticks
+        self.session_ticks = 0
+        self.update_time = 0.0
+        self.encode_time = 0.0
+        self.bytes_sent = 0
+        self.snapshots_sent = 0
+        self.keyframe_bytes = 0
+        self.ticks = 0
+        self.late_ticks = 0
+        
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # In case it was 0
+        self.ticker = asyncio.create_task(self.tick_loop())
+        
+    async def close(self):
+        if self.ticker is not None:
+            self.ticker.cancel()
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            
+    async def handle_client(self, reader: 'asyncio.StreamReader', writer: 'asyncio.StreamWriter'):
+        session = None
+        try:
+            kind, payload = await read_net_frame(reader)
+            if kind != NET_JOIN:
+                raise ConnectionError("expected a join")
+            name = payload.decode("utf-8", "replace")
+            session = self.sessions.get(name)
+            if session is None:
+                session = NetSession(name, self.players, self.level_num, self.num_ghosts, self.layout,
+                                     self.seeds.randrange(2 ** 32))
+                self.sessions[name] = session
+            elif session.started:
+                writer.write(net_frame(NET_ERROR, f"session {name!r} is full".encode()))
+                await writer.drain()
+                return
+            player = session.join(writer)
+            writer.write(session.welcome(player, self.tick_rate))
+            if session.full:
+                session.started = True
+                frame = session.encode(keyframe=True)
+                self.keyframe_bytes = len(frame)
+                self.bytes_sent += session.broadcast(frame)
+                
+            while True:
+                kind, payload = await read_net_frame(reader)
+                if kind == NET_INPUT:
+                    _, direction = NET_INPUT_RECORD.unpack(payload)
+                    if direction < len(DIRECTIONS) and session.result == "PLAYING":
+                        session.steer(player, DIRECTIONS[direction])
+        except (ConnectionError, asyncio.IncompleteReadError, struct.error):
+            pass
+        finally:
+            writer.close()
+            if session is not None:
+                # Free the slot; an emptied lobby goes now, a started game
+                # on its next tick
+                session.leave(writer)
+                if not session.started and not session.joined:
+                    self.sessions.pop(session.name, None)
+                    
+    async def tick_loop(self):
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.tick_rate
+        deadline = loop.time()
+        while True:
+            deadline += interval
+            delay = deadline - loop.time()
+            if delay < 0:
+                self.late_ticks += 1
+                deadline = loop.time()
+            await asyncio.sleep(max(delay, 0.0))
+            if not self.paused:
+                self.tick()
+            
+    def tick(self):
+        self.ticks += 1
+        finished = []
+        for session in self.sessions.values():
+            if not session.started:
+                continue
+            start = time.perf_counter()
+            session.result = session.level.update()
+            now = time.perf_counter()
+            frame = session.encode()
+            self.encode_time += time.perf_counter() - now
+            self.update_time += now - start
+            self.session_ticks += 1
+            self.bytes_sent += session.broadcast(frame)
+            self.snapshots_sent += 1
+            if session.result != "PLAYING" or session.abandoned:
+                finished.append(session)
+        for session in finished:
+            session.close()
+            del self.sessions[session.name]
+
+class NetplayClient:
+    # Mirrors one session: a Level rebuilt from the welcome's maze, updated
+    # only by snapshots. `level.pacman` is this client's own Pac-Man, so
+    # agents written for the local game can steer it.
+    def __init__(self, agent: Optional[Callable[[Level], Optional[Direction]]] = None):
+        self.agent = agent
+        self.level: Optional[Level] = None
+        self.player = 0
+        self.tick_rate = NET_TICK_RATE
+        self.result = "PLAYING"
+        self.snapshots = 0
+        self.bytes_received = 0
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.sent_direction: Optional[Direction] = None
+        
+    async def connect(self, host: str, port: int, session: str = "default"):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(net_frame(NET_JOIN, session.encode()))
+        kind, payload = await read_net_frame(self.reader)
+        if kind == NET_ERROR:
+            raise ConnectionError(payload.decode("utf-8", "replace"))
+        if kind != NET_WELCOME:
+            raise ConnectionError("expected a welcome")
+        self.player, players, level_num, num_ghosts, self.tick_rate, seed = NET_WELCOME_HEADER.unpack_from(payload)
+        layout = MazeLayout.from_buffer(payload[NET_WELCOME_HEADER.size:])
+        self.level = Level(level_num, seed=seed, num_ghosts=num_ghosts, layout=layout, num_players=players)
+        self.level.pacman = self.level.players[self.player]
+        
+    def steer(self, direction: Direction):
+        # Only changes go over the wire
+        if direction != self.sent_direction and self.writer is not None and not self.writer.is_closing():
+            self.sent_direction = direction
+            self.writer.write(net_frame(NET_INPUT, NET_INPUT_RECORD.pack(self.level.ticks,
+                                                                         DIRECTION_INDEX[direction])))
+            
+    async def run(self) -> str:
+        # Applies snapshots until the session ends or the server goes away
+        try:
+            while self.result == "PLAYING":
+                kind, payload = await read_net_frame(self.reader)
+                if kind != NET_SNAPSHOT:
+                    continue
+                self.bytes_received += NET_FRAME.size + len(payload)
+                self.apply(payload)
+                if self.agent is not None:
+                    direction = self.agent(self.level)
+                    if direction is not None:
+                        self.steer(direction)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.close()
+        return self.result
+        
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        
+    def apply(self, payload: bytes):
+        level = self.level
+        tick, result, flags, actors, scores, pellets = NET_SNAPSHOT_HEADER.unpack_from(payload)
+        level.ticks = tick
+        self.result = NET_RESULTS[result]
+        self.snapshots += 1
+        players = level.players
+        for actor in level.ghosts:
+            actor.prev_x, actor.prev_y = actor.x, actor.y
+        for pacman in players:
+            pacman.prev_x, pacman.prev_y = pacman.x, pacman.y
+            # Mouths are cosmetic, so they're animated here rather than sent
+            pacman.mouth_angle += pacman.mouth_direction * pacman.mouth_speed
+            if pacman.mouth_angle <= 0 or pacman.mouth_angle >= 45:
+                pacman.mouth_direction *= -1
+                
+        offset = NET_SNAPSHOT_HEADER.size
+        for _ in range(actors):
+            i, x, y, direction, state = NET_ACTOR.unpack_from(payload, offset)
+            offset += NET_ACTOR.size
+            if i < len(players):
+                actor = players[i]
+                actor.lives = state & ~NET_POWERED
+                actor.power_pellet_active = bool(state & NET_POWERED)
+            else:
+                actor = level.ghosts[i - len(players)]
+                actor.state = GhostState(state)
+                actor.eye_direction = DIRECTIONS[direction]
+            actor.x, actor.y = x / 10, y / 10
+            actor.direction = DIRECTIONS[direction]
+            actor.update_rect()
+        for _ in range(scores):
+            i, score = NET_SCORE.unpack_from(payload, offset)
+            offset += NET_SCORE.size
+            players[i].score = score
+            
+        if flags & NET_KEYFRAME:
+            level.pellets.reset(zlib.decompress(payload[offset:]))
+            level.invalidate()
+            return
+        for _ in range(pellets):
+            (i,) = NET_PELLET.unpack_from(payload, offset)
+            offset += NET_PELLET.size
+            level.eat_pellet(Pellet(level.pellets, i))
+
+
+def net_address(text: str) -> Tuple[str, int]:
+    host, _, port = text.rpartition(":")
+    if not host:
+        return text, NET_PORT
+    return host, int(port)
+
+async def play_netplay(host: str, port: int, session: str, render_fps: int = FPS):
+    # A window onto one session: arrow keys steer, everything else is
+    # whatever the server says
+    pygame.display.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption(f"Pac Pro - {session}")
+    client = NetplayClient()
+    await client.connect(host, port, session)
+    print(f"Joined {session!r} as player {client.player + 1} of {client.level.num_players}; "
+          "waiting for the others")
+    snapshots = asyncio.create_task(client.run())
+    keys = {pygame.K_UP: Direction.UP, pygame.K_DOWN: Direction.DOWN,
+            pygame.K_LEFT: Direction.LEFT, pygame.K_RIGHT: Direction.RIGHT}
+    frames = 0
+    try:
+        while not snapshots.done():
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                    return
+                if event.type == pygame.KEYDOWN and event.key in keys:
+                    client.steer(keys[event.key])
+            if client.snapshots != frames:
+                frames = client.snapshots
+                pygame.display.update(client.level.draw(screen))
+            await asyncio.sleep(1.0 / render_fps)
+        level = client.level
+        print(f"{client.result}: tick {level.ticks}, scores " +
+              ", ".join(f"P{i + 1} {pacman.score}" for i, pacman in enumerate(level.players)))
+    finally:
+        snapshots.cancel()
+        client.close()
+        pygame.quit()
+
+async def serve_netplay(port: int, players: int, layout: Optional[MazeLayout] = None, host: str = "0.0.0.0"):
+    server = NetplayServer(host, port, players, layout=layout)
+    await server.start()
+    print(f"Serving {players}-player sessions on {host}:{server.port} at {server.tick_rate} ticks/s")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            load = server.update_time + server.encode_time
+            print(f"{len(server.sessions)} sessions, {server.session_ticks} session-ticks, "
+                  f"{load / max(server.session_ticks, 1) * 1e6:.0f}us each, {server.late_ticks} late ticks")
+    finally:
+        await server.close()
+
+async def run_netplay_load(sessions: int, players: int, seconds: float, seed: int,
+                           layout: Optional[MazeLayout] = None, tick_rate: int = NET_TICK_RATE) -> bool:
+    # Load generator: fills `sessions` sessions on a localhost server with
+    # random-agent clients, plays for `seconds`, then pauses the server and
+    # checks every client's mirror matches its session
+    server = NetplayServer(port=0, players=players, layout=layout, tick_rate=tick_rate, seed=seed)
+    await server.start()
+    clients = []
+    for s in range(sessions):
+        for p in range(players):
+            client = NetplayClient(RandomAgent(seed + s * players + p))
+            await client.connect("127.0.0.1", server.port, f"load-{s}")
+            clients.append(client)
+    tasks = [asyncio.create_task(client.run()) for client in clients]
+    
+    await asyncio.sleep(seconds)
+    server.paused = True
+    await asyncio.sleep(0.2)  # Let the last snapshots arrive
+    mismatched = 0
+    for s in range(sessions):
+        session = server.sessions.get(f"load-{s}")
+        if session is None:
+            continue  # Finished early; its clients saw the final snapshot
+        expected = net_state(session.level)
+        for client in clients[s * players:(s + 1) * players]:
+            if net_state(client.level) != expected:
+                mismatched += 1
+                
+    ticks = server.session_ticks
+    # Every actor, score and pellet cell, uncompressed: what a client would
+    # get each tick without deltas
+    level = clients[0].level
+    full = (NET_FRAME.size + NET_SNAPSHOT_HEADER.size + NET_ACTOR.size * (len(level.players) + len(level.ghosts)) +
+            NET_SCORE.size * len(level.players) + len(level.pellets.live))
+    per_tick = server.bytes_sent / max(ticks * players, 1)
+    load = server.update_time + server.encode_time
+    per_session = load / max(ticks, 1)
+    print(f"{sessions} sessions x {players} players for {seconds:.1f}s at {server.tick_rate} ticks/s: "
+          f"{ticks} session-ticks, {server.late_ticks} late of {server.ticks}")
+    print(f"  bandwidth: {per_tick:.1f} bytes/tick per client "
+          f"({per_tick * server.tick_rate / 1024:.1f} KiB/s) vs {full} for a full snapshot; "
+          f"keyframe {server.keyframe_bytes} bytes")
+    print(f"  server CPU per session-tick: {per_session * 1e6:.1f}us "
+          f"(update {server.update_time / max(ticks, 1) * 1e6:.1f}us, "
+          f"encode {server.encode_time / max(ticks, 1) * 1e6:.1f}us); "
+          f"{per_session * sessions * server.tick_rate * 100:.0f}% of one core")
+    
+    await server.close()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if mismatched:
+        print(f"{mismatched} clients out of step with the server")
+        return False
+    print("Clients match the server")
+    return True
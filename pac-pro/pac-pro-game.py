@@ -1,13 +1,43 @@
+import os
+# Importing is side-effect free: no banner, and pygame subsystems are only
+# initialised when something first needs them
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
 import pygame
+import contextlib
+import hashlib
+import json
+import platform
+import queue
 import random
 import math
+import struct
+import sys
+import threading
 import time
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from enum import Enum
-from typing import List, Tuple, Dict, Optional
+from typing import List, Tuple, Dict, Optional, Callable, Union
 
-# Initialize pygame
-pygame.init()
-pygame.mixer.init()
+# netplay.py imports the game under this name, whatever it was run as
+if __name__ in sys.modules:
+    sys.modules.setdefault("pac_pro_game", sys.modules[__name__])
+
+# Modules only some modes need (NumPy, SQLite, temp dirs, ...) are imported
+# where they're used, so starting the game doesn't pay for them
+np = None  # NumPy, once load_numpy() has imported it
+
+def load_numpy():
+    # Imports NumPy on first use and returns it, or None if it isn't installed
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        np = numpy
+    return np
 
 # Constants
 SCREEN_WIDTH = 800
@@ -15,7 +45,15 @@ SCREEN_HEIGHT = 900
 GRID_SIZE = 20
 GRID_WIDTH = SCREEN_WIDTH // GRID_SIZE
 GRID_HEIGHT = (SCREEN_HEIGHT - 100) // GRID_SIZE  # Leave space for HUD
-FPS = 60
+HUD_HEIGHT = 50  # Maze is drawn below the score line
+FPS = 60  # Simulation ticks per second; rendering runs at its own rate
+MOVE_STEP = 0.1  # Cells moved per tick at speed 1.0
+MAX_UPDATES_PER_FRAME = 5  # Catch-up ticks run before a frame must be drawn
+MAX_FRAME_SKIP = 5  # Frames that may be dropped in a row when behind
+DISTANCE_FIELD_BUDGET = 16 * 1024 * 1024  # Bytes of cached BFS fields per level
+SPATIAL_HASH_CELL = 2  # Maze cells per spatial hash bucket side, >= GHOST_COLLISION_DISTANCE
+GHOST_COLLISION_DISTANCE = 0.8  # Centre distance at which a ghost touches Pac-Man
+NET_PORT = 7664  # Default --serve port; netplay itself is in netplay.py
 
 # Colors
 BLACK = (0, 0, 0)
@@ -28,6 +66,8 @@ CYAN = (0, 255, 255)
 ORANGE = (255, 184, 82)
 GREEN = (0, 255, 0)
 GRAY = (40, 40, 40)
+FRIGHTENED_COLOR = (0, 0, 139)  # Dark blue
+EATEN_COLOR = (200, 200, 200)  # Faint gray
 
 # Game states
 class GameState(Enum):    
@@ -45,6 +85,10 @@ class Direction(Enum):
     RIGHT = (1, 0)
     NONE = (0, 0)
 
+# Stable integer codes for directions, used by array-based engines
+DIRECTIONS = [Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT, Direction.NONE]
+DIRECTION_INDEX = {direction: i for i, direction in enumerate(DIRECTIONS)}
+
 # Ghost behavior states
 class GhostState(Enum):
     CHASE = 0
@@ -52,44 +96,1247 @@ class GhostState(Enum):
     FRIGHTENED = 2
     EATEN = 3
 
+# How each ghost picks its chase target; unknown names chase like Blinky
+GHOST_PERSONALITIES = {"Blinky": 0, "Pinky": 1, "Inky": 2, "Clyde": 3}
+
+# Occupancy grid cell kinds
+CELL_EMPTY = 0
+CELL_WALL = 1
+CELL_GATE = 2
+CELL_TUNNEL = 3
+
+# Pellet kinds, as stored per cell
+PELLET_NONE = 0
+PELLET_NORMAL = 1
+PELLET_POWER = 2
+
+class OccupancyGrid:
+    # Flat per-cell map of the maze, indexed as y * width + x
+    def __init__(self, width: int, height: int, cells=None):
+        self.width = width
+        self.height = height
+        # Mazes loaded from a compiled cache pass a read-only view of the
+        # mapped file here instead of getting their own copy
+        self.cells = bytearray(width * height) if cells is None else cells
+        
+    def in_bounds(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+        
+    def get(self, x: int, y: int) -> int:
+        return self.cells[y * self.width + x]
+    
+    def set(self, x: int, y: int, kind: int):
+        self.cells[y * self.width + x] = kind
+        
+    def is_blocked(self, x: int, y: int) -> bool:
+        # Out of bounds is open, wrapping is handled by whoever moves there
+        if x < 0 or x >= self.width or y < 0 or y >= self.height:
+            return False
+        return self.cells[y * self.width + x] == CELL_WALL
+
+class DistanceFields:
+    # Shortest-path step counts to a target cell, one BFS per target, kept in
+    # an LRU capped by DISTANCE_FIELD_BUDGET. Rows wrap horizontally the same
+    # way actors do, so tunnels count as connections.
+    def __init__(self, grid: OccupancyGrid, budget: int = DISTANCE_FIELD_BUDGET):
+        self.grid = grid
+        self.width = grid.width
+        self.height = grid.height
+        self.max_fields = max(8, budget // (grid.width * grid.height * 4))
+        self.fields: 'OrderedDict[int, array]' = OrderedDict()
+        # Open neighbours of every cell, built on the first search
+        self._neighbors: Optional[List[Tuple[int, ...]]] = None
+        
+    @property
+    def neighbors(self) -> List[Tuple[int, ...]]:
+        if self._neighbors is None:
+            self._neighbors = self.build_neighbors()
+        return self._neighbors
+    
+    def build_neighbors(self) -> List[Tuple[int, ...]]:
+        width = self.width
+        open_cells = [kind != CELL_WALL for kind in self.grid.cells]
+        result = []
+        for i, is_open in enumerate(open_cells):
+            if not is_open:
+                result.append(())
+                continue
+            x = i % width
+            row = i - x
+            up, down = i - width, i + width
+            left = row + (x - 1) % width
+            right = row + (x + 1) % width
+            result.append(tuple(n for n in (up, down, left, right)
+                                if 0 <= n < len(open_cells) and open_cells[n]))
+        return result
+        
+    def open_neighbors(self, x: int, y: int) -> Tuple[int, ...]:
+        result = []
+        for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+            nx = (x + dx) % self.width
+            ny = y + dy
+            if 0 <= ny < self.height and not self.grid.is_blocked(nx, ny):
+                result.append(ny * self.width + nx)
+        return tuple(result)
+    
+    def field(self, x: int, y: int) -> array:
+        # Distances indexed as y * width + x, -1 where the target is unreachable
+        target = y * self.width + x
+        field = self.fields.get(target)
+        if field is not None:
+            self.fields.move_to_end(target)
+            return field
+        
+        field = array('i', [-1]) * (self.width * self.height)
+        field[target] = 0
+        # The target itself may be a wall (e.g. a corner), so expand it directly
+        frontier = list(self.open_neighbors(x, y))
+        for cell in frontier:
+            field[cell] = 1
+        distance = 1
+        neighbors = self.neighbors
+        while frontier:
+            distance += 1
+            next_frontier = []
+            for cell in frontier:
+                for neighbor in neighbors[cell]:
+                    if field[neighbor] < 0:
+                        field[neighbor] = distance
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+            
+        self.fields[target] = field
+        if len(self.fields) > self.max_fields:
+            self.fields.popitem(last=False)
+        return field
+
+class SpatialHash:
+    # Uniform grid of buckets over the maze. Actors are filed under the
+    # bucket holding their position and only refiled when they cross into
+    # another one, so keeping it current is O(actors moved) per tick, and a
+    # query only looks at the buckets its radius overlaps. With reach > 0
+    # actors are also filed in the buckets around their own, so "who is
+    # within a cell of this point" becomes a single lookup with at().
+    def __init__(self, width: int, height: int, cell_size: int = SPATIAL_HASH_CELL, reach: int = 0):
+        self.cell_size = cell_size
+        self.reach = reach
+        self.columns = width // cell_size + 2 * reach + 2
+        self.buckets: Dict[int, list] = {}
+        self.keys: Dict[object, int] = {}
+        
+    def key(self, x: float, y: float) -> int:
+        return int(y // self.cell_size) * self.columns + int(x // self.cell_size)
+    
+    def __len__(self) -> int:
+        return len(self.keys)
+    
+    def spread(self, key: int) -> List[int]:
+        reach = self.reach
+        return [key + row * self.columns + column
+                for row in range(-reach, reach + 1) for column in range(-reach, reach + 1)]
+        
+    def insert(self, actor, x: float, y: float):
+        key = self.key(x, y)
+        self.keys[actor] = key
+        for filed in self.spread(key) if self.reach else (key,):
+            self.buckets.setdefault(filed, []).append(actor)
+        
+    def remove(self, actor):
+        key = self.keys.pop(actor)
+        for filed in self.spread(key) if self.reach else (key,):
+            bucket = self.buckets[filed]
+            bucket.remove(actor)
+            if not bucket:
+                del self.buckets[filed]
+            
+    def move(self, actor, x: float, y: float):
+        size = self.cell_size
+        key = int(y // size) * self.columns + int(x // size)
+        if self.keys.get(actor) != key:
+            if actor in self.keys:
+                self.remove(actor)
+            self.insert(actor, x, y)
+            
+    def rebuild(self, actors):
+        self.buckets.clear()
+        self.keys.clear()
+        for actor in actors:
+            self.insert(actor, actor.x, actor.y)
+            
+    def at(self, x: float, y: float) -> list:
+        # Actors filed in the bucket holding (x, y); don't change the hash
+        # while iterating over the result
+        size = self.cell_size
+        return self.buckets.get(int(y // size) * self.columns + int(x // size), ())
+            
+    def query(self, x: float, y: float, radius: float) -> list:
+        # Everything filed in a bucket the square around (x, y) overlaps;
+        # callers do the exact distance test
+        size = self.cell_size
+        columns = self.columns
+        buckets = self.buckets
+        left, right = int((x - radius) // size), int((x + radius) // size)
+        top, bottom = int((y - radius) // size), int((y + radius) // size)
+        found = []
+        for row in range(top * columns, bottom * columns + 1, columns):
+            for key in range(row + left, row + right + 1):
+                bucket = buckets.get(key)
+                if bucket:
+                    found.extend(bucket)
+        if self.reach and found:
+            found = list(dict.fromkeys(found))
+        return found
+
+# Maze text format, one character per cell:
+#   #  wall            -  ghost house gate     T  tunnel (open, no pellet)
+#   .  pellet          o  power pellet         P  Pac-Man spawn (exactly one)
+#   G  ghost spawn     H  ghost house floor    (space) open, no pellet
+# Lines starting with ';' are comments. Short rows are padded with spaces.
+MAZE_CELLS = {"#": CELL_WALL, "-": CELL_GATE, "T": CELL_TUNNEL}
+MAZE_PELLETS = {".": PELLET_NORMAL, "o": PELLET_POWER}
+MAZE_OPEN = set(" .oPGHT")
+MAZE_EXTENSION = ".maze"
+COMPILED_MAZE_EXTENSION = ".mazec"
+
+class MazeLayout:
+    # A maze as two flat width * height planes (CELL_* kinds, and pellets as
+    # 0 none / 1 pellet / 2 power pellet) plus spawn points. Compiled caches
+    # are memory-mapped, so the planes are views of the file: switching to a
+    # cached maze does no parsing, and every process that maps the same file
+    # shares its pages.
+    MAGIC = b"PPMZ"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHHHQQ")  # magic, version, width, height, source mtime_ns, source size
+    SPAWNS = struct.Struct("<hhhhhhH")  # pacman x, y, gate x, y, house exit x, y (-1 if none), ghost count
+    POINT = struct.Struct("<hh")
+    
+    def __init__(self, width: int, height: int, cells, pellets,
+                 pacman_spawn: Tuple[int, int], gate: Optional[Tuple[int, int]],
+                 house_exit: Optional[Tuple[int, int]], ghost_spawns: List[Tuple[int, int]]):
+        self.width = width
+        self.height = height
+        self.cells = cells
+        self.pellets = pellets
+        self.pacman_spawn = pacman_spawn
+        self.gate = gate
+        self.house_exit = house_exit
+        self.ghost_spawns = ghost_spawns
+        self.buffer = None  # The mmap backing cells and pellets, if any
+        
+    @classmethod
+    def parse(cls, text: str, name: str = "<maze>") -> 'MazeLayout':
+        rows = [line for line in text.splitlines() if not line.startswith(";")]
+        while rows and not rows[-1].strip():
+            rows.pop()
+        if not rows:
+            raise ValueError(f"{name}: maze is empty")
+        width = max(len(row) for row in rows)
+        height = len(rows)
+        if width > 0x7FFF or height > 0x7FFF:
+            raise ValueError(f"{name}: maze is larger than {0x7FFF}x{0x7FFF}")
+            
+        cells = bytearray(width * height)
+        pellets = bytearray(width * height)
+        pacman_spawn = None
+        gate = None
+        ghost_spawns = []
+        house = set()
+        for y, row in enumerate(rows):
+            for x, char in enumerate(row.ljust(width)):
+                if char not in MAZE_CELLS and char not in MAZE_OPEN:
+                    raise ValueError(f"{name}:{y + 1}:{x + 1}: unknown maze character {char!r}")
+                i = y * width + x
+                cells[i] = MAZE_CELLS.get(char, CELL_EMPTY)
+                pellets[i] = MAZE_PELLETS.get(char, 0)
+                if char == "P":
+                    if pacman_spawn is not None:
+                        raise ValueError(f"{name}:{y + 1}:{x + 1}: more than one Pac-Man spawn")
+                    pacman_spawn = (x, y)
+                elif char == "-":
+                    if gate is not None:
+                        raise ValueError(f"{name}:{y + 1}:{x + 1}: more than one gate")
+                    gate = (x, y)
+                elif char == "G":
+                    ghost_spawns.append((x, y))
+                if char in "GH":
+                    house.add((x, y))
+        if pacman_spawn is None:
+            raise ValueError(f"{name}: maze has no Pac-Man spawn (P)")
+            
+        # Ghosts leave through the open cell on the far side of the gate
+        house_exit = None
+        if gate is not None:
+            for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+                x, y = gate[0] + dx, gate[1] + dy
+                if (0 <= x < width and 0 <= y < height and (x, y) not in house and
+                        cells[y * width + x] not in (CELL_WALL, CELL_GATE)):
+                    house_exit = (x, y)
+                    break
+        return cls(width, height, cells, pellets, pacman_spawn, gate, house_exit, ghost_spawns)
+    
+    @classmethod
+    def from_level(cls, level: 'Level') -> 'MazeLayout':
+        return cls(level.width, level.height, bytes(level.grid.cells), bytes(level.pellets.kinds), level.pacman_spawn,
+                   level.gate, level.house_exit, [(ghost.start_x, ghost.start_y) for ghost in level.ghosts])
+    
+    def to_bytes(self, source_mtime_ns: int = 0, source_size: int = 0) -> bytes:
+        none = (-1, -1)
+        parts = [
+            self.HEADER.pack(self.MAGIC, self.VERSION, self.width, self.height, source_mtime_ns, source_size),
+            self.SPAWNS.pack(*self.pacman_spawn, *(self.gate or none), *(self.house_exit or none),
+                             len(self.ghost_spawns))
+        ]
+        parts.extend(self.POINT.pack(x, y) for x, y in self.ghost_spawns)
+        parts.append(bytes(self.cells))
+        parts.append(bytes(self.pellets))
+        return b"".join(parts)
+    
+    def digest(self) -> str:
+        # Identifies the maze itself, whatever file or seed it came from
+        return hashlib.blake2b(self.to_bytes(), digest_size=8).hexdigest()
+    
+    @classmethod
+    def from_buffer(cls, data) -> 'MazeLayout':
+        # `data` is kept, not copied: cells and pellets are views into it
+        magic, version, width, height, _, _ = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError("not a compiled maze, or from another version")
+        offset = cls.HEADER.size
+        px, py, gx, gy, ex, ey, count = cls.SPAWNS.unpack_from(data, offset)
+        offset += cls.SPAWNS.size
+        ghost_spawns = [cls.POINT.unpack_from(data, offset + i * cls.POINT.size) for i in range(count)]
+        offset += count * cls.POINT.size
+        
+        size = width * height
+        view = memoryview(data)
+        if len(view) < offset + 2 * size:
+            raise ValueError("compiled maze is truncated")
+        cells = view[offset:offset + size].toreadonly()
+        pellets = view[offset + size:offset + 2 * size].toreadonly()
+        return cls(width, height, cells, pellets, (px, py), (gx, gy) if gx >= 0 else None,
+                   (ex, ey) if ex >= 0 else None, ghost_spawns)
+    
+    def to_text(self) -> str:
+        house = set(self.ghost_spawns)
+        rows = []
+        for y in range(self.height):
+            row = []
+            for x in range(self.width):
+                i = y * self.width + x
+                kind = self.cells[i]
+                if (x, y) == self.pacman_spawn:
+                    row.append("P")
+                elif (x, y) in house:
+                    row.append("G")
+                elif kind == CELL_WALL:
+                    row.append("#")
+                elif kind == CELL_GATE:
+                    row.append("-")
+                elif kind == CELL_TUNNEL:
+                    row.append("T")
+                else:
+                    row.append(" .o"[self.pellets[i]])
+            rows.append("".join(row).rstrip())
+        return "\n".join(rows) + "\n"
+
+def compiled_maze_path(path: str) -> str:
+    return os.path.splitext(path)[0] + COMPILED_MAZE_EXTENSION
+
+def compile_maze(path: str) -> str:
+    # Parses a maze file and writes its binary cache next to it. The cache
+    # records the source's mtime and size so edits invalidate it.
+    with open(path) as f:
+        layout = MazeLayout.parse(f.read(), path)
+    info = os.stat(path)
+    target = compiled_maze_path(path)
+    temp = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(temp, "wb") as f:
+            f.write(layout.to_bytes(info.st_mtime_ns, info.st_size))
+        os.replace(temp, target)  # Readers never see a half-written cache
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(temp)
+        raise
+    return target
+
+def map_compiled_maze(path: str) -> MazeLayout:
+    import mmap
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    layout = MazeLayout.from_buffer(buffer)
+    layout.buffer = buffer
+    return layout
+
+_mazes: Dict[str, MazeLayout] = {}
+
+def load_maze(path: str) -> MazeLayout:
+    # Maps the compiled cache for a maze file, compiling it first if it is
+    # missing or older than the source. Mazes stay mapped for the life of
+    # the process, so returning to one costs a dict lookup.
+    key = os.path.abspath(path)
+    layout = _mazes.get(key)
+    if layout is not None:
+        return layout
+    
+    if path.endswith(COMPILED_MAZE_EXTENSION):
+        layout = map_compiled_maze(path)
+    else:
+        info = os.stat(path)
+        cache = compiled_maze_path(path)
+        layout = None
+        try:
+            with open(cache, "rb") as f:
+                _, _, _, _, mtime_ns, size = MazeLayout.HEADER.unpack(f.read(MazeLayout.HEADER.size))
+            if (mtime_ns, size) == (info.st_mtime_ns, info.st_size):
+                layout = map_compiled_maze(cache)
+        except (OSError, struct.error, ValueError):
+            pass
+        if layout is None:
+            try:
+                layout = map_compiled_maze(compile_maze(path))
+            except OSError:
+                # No cache next to a read-only maze; parse it every time
+                # instead. An unreadable source still fails here.
+                with open(path) as f:
+                    layout = MazeLayout.parse(f.read(), path)
+    _mazes[key] = layout
+    return layout
+
+# Procedural mazes: a randomised spanning tree over the odd-coordinate
+# lattice, braided into loops, with a ghost house and side tunnels stamped
+# in. Difficulty leaves more dead ends and fewer power pellets.
+MAZE_GENERATOR_VERSION = 1  # Part of cache keys; bump when output changes
+MAX_MAZE_DIFFICULTY = 5
+MIN_GENERATED_SIZE = 15
+GENERATED_MEMORY_CACHE = 16  # Layouts kept in memory
+GENERATED_DISK_CACHE = 256  # Compiled files kept in the cache directory
+MAZE_CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+                              "pac-pro", "mazes")
+
+def maze_difficulty(level_num: int) -> int:
+    return min(max(level_num - 1, 0), MAX_MAZE_DIFFICULTY)
+
+def generate_maze(seed: int, difficulty: int = 0, width: int = GRID_WIDTH,
+                  height: int = GRID_HEIGHT) -> MazeLayout:
+    if width < MIN_GENERATED_SIZE or height < MIN_GENERATED_SIZE:
+        raise ValueError(f"generated mazes must be at least {MIN_GENERATED_SIZE}x{MIN_GENERATED_SIZE}")
+    rng = random.Random(f"maze:{MAZE_GENERATOR_VERSION}:{seed}:{difficulty}:{width}x{height}")
+    rows = [["#"] * width for _ in range(height)]
+    xs = range(1, width - 1, 2)
+    ys = range(1, height - 1, 2)
+    last_x, last_y = xs[-1], ys[-1]
+    
+    # Ghost house: a ring of corridor on lattice lines around a walled box
+    # with the gate in its top wall. Stamping the ring over the tree keeps
+    # the maze connected, since every tree path through the area crosses it.
+    center = width // 2 if (width // 2) % 2 else width // 2 - 1
+    left, right = center - 4, center + 4
+    top = height // 2 - 3 if (height // 2 - 3) % 2 else height // 2 - 4
+    bottom = top + 6
+    
+    def inside_house(x: int, y: int) -> bool:
+        return left < x < right and top < y < bottom
+    
+    # Spanning tree by iterative depth-first search
+    start = (xs[0], ys[0])
+    rows[start[1]][start[0]] = " "
+    stack = [start]
+    steps = ((0, -2), (0, 2), (-2, 0), (2, 0))
+    while stack:
+        x, y = stack[-1]
+        options = [(x + dx, y + dy) for dx, dy in steps
+                   if 1 <= x + dx <= last_x and 1 <= y + dy <= last_y and rows[y + dy][x + dx] == "#"]
+        if not options:
+            stack.pop()
+            continue
+        nx, ny = rng.choice(options)
+        rows[(y + ny) // 2][(x + nx) // 2] = " "
+        rows[ny][nx] = " "
+        stack.append((nx, ny))
+        
+    # Braid: open most dead ends into a neighbour so Pac-Man isn't cornered
+    braid = 1.0 - 0.1 * difficulty
+    for y in ys:
+        for x in xs:
+            openings = sum(1 for dx, dy in steps if rows[y + dy // 2][x + dx // 2] != "#")
+            walls = [(dx, dy) for dx, dy in steps
+                     if 1 <= x + dx <= last_x and 1 <= y + dy <= last_y and rows[y + dy // 2][x + dx // 2] == "#"]
+            if openings == 1 and walls and rng.random() < braid:
+                dx, dy = rng.choice(walls)
+                rows[y + dy // 2][x + dx // 2] = " "
+                
+    for y in range(top, bottom + 1):
+        for x in range(left, right + 1):
+            if inside_house(x, y):
+                on_box = x in (left + 1, right - 1) or y in (top + 1, bottom - 1)
+                rows[y][x] = "#" if on_box else "H"
+            else:
+                rows[y][x] = " "
+    rows[top + 1][center] = "-"
+    for dx in (-2, -1, 1, 2):
+        rows[top + 3][center + dx] = "G"
+        
+    # Side tunnels on lattice rows clear of the house; both ends are opened
+    # through the border, and actors wrap between them
+    candidates = [y for y in ys[1:-1] if not top <= y <= bottom]
+    for y in rng.sample(candidates, min(len(candidates), 2 if difficulty < 3 else 1)):
+        rows[y][0] = "T"
+        for x in range(last_x + 1, width):
+            rows[y][x] = "T"
+            
+    # Pellets everywhere open, power pellets in the corners, Pac-Man below the house
+    for y in range(height):
+        for x in range(width):
+            if rows[y][x] == " " and not (left <= x <= right and top <= y <= bottom):
+                rows[y][x] = "."
+    corners = [(1, 1), (last_x, last_y), (last_x, 1), (1, last_y)]
+    for x, y in corners[:4 if difficulty < 3 else 2]:
+        rows[y][x] = "o"
+    spawn_y = bottom + 2 if bottom + 2 <= last_y else top
+    rows[spawn_y][center] = "P"
+    
+    layout = MazeLayout.parse("\n".join("".join(row) for row in rows), f"<generated {seed}>")
+    # Cached layouts are shared between levels, so make them read-only
+    layout.cells = bytes(layout.cells)
+    layout.pellets = bytes(layout.pellets)
+    return layout
+
+class MazeCache:
+    # Generated layouts keyed by (seed, difficulty, width, height), in a
+    # small in-memory LRU backed by compiled .mazec files on disk, so a
+    # maze is generated once per machine. prefetch() generates on a worker
+    # thread; get() then only waits if that hasn't finished yet.
+    def __init__(self, directory: Optional[str] = MAZE_CACHE_DIR, capacity: int = GENERATED_MEMORY_CACHE,
+                 disk_capacity: int = GENERATED_DISK_CACHE):
+        self.directory = directory
+        self.capacity = capacity
+        self.disk_capacity = disk_capacity
+        self.layouts: 'OrderedDict[Tuple[int, int, int, int], MazeLayout]' = OrderedDict()
+        self.pending: Dict[Tuple[int, int, int, int], Future] = {}
+        self.lock = threading.Lock()
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        
+    def path(self, key: Tuple[int, int, int, int]) -> str:
+        seed, difficulty, width, height = key
+        name = f"gen{MAZE_GENERATOR_VERSION}-{seed}-{difficulty}-{width}x{height}{COMPILED_MAZE_EXTENSION}"
+        return os.path.join(self.directory, name)
+    
+    def get(self, seed: int, difficulty: int = 0, width: int = GRID_WIDTH, height: int = GRID_HEIGHT) -> MazeLayout:
+        key = (seed, difficulty, width, height)
+        with self.lock:
+            layout = self.layouts.get(key)
+            if layout is not None:
+                self.layouts.move_to_end(key)
+                self.hits += 1
+                return layout
+            future = self.pending.get(key)
+        if future is not None:
+            return future.result()
+        return self.load(key)
+    
+    def prefetch(self, seed: int, difficulty: int = 0, width: int = GRID_WIDTH, height: int = GRID_HEIGHT):
+        key = (seed, difficulty, width, height)
+        with self.lock:
+            if key in self.layouts or key in self.pending:
+                return
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="maze-gen")
+            self.pending[key] = self.executor.submit(self.load, key)
+            
+    def load(self, key: Tuple[int, int, int, int]) -> MazeLayout:
+        try:
+            layout = None
+            if self.directory is not None:
+                try:
+                    layout = map_compiled_maze(self.path(key))
+                    os.utime(self.path(key))  # Recently used, for pruning
+                    with self.lock:
+                        self.disk_hits += 1
+                except (OSError, ValueError):
+                    layout = None
+            if layout is None:
+                layout = generate_maze(*key)
+                with self.lock:
+                    self.misses += 1
+                self.save(key, layout)
+            with self.lock:
+                self.layouts[key] = layout
+                if len(self.layouts) > self.capacity:
+                    self.layouts.popitem(last=False)
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        return layout
+    
+    def save(self, key: Tuple[int, int, int, int], layout: MazeLayout):
+        # Best effort: an unwritable cache directory only costs regenerating
+        if self.directory is None:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            target = self.path(key)
+            temp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp, "wb") as f:
+                f.write(layout.to_bytes())
+            os.replace(temp, target)
+            self.prune()
+        except OSError:
+            pass
+        
+    def prune(self):
+        # Drops the least recently used files beyond disk_capacity
+        entries = [entry for entry in os.scandir(self.directory)
+                   if entry.name.startswith("gen") and entry.name.endswith(COMPILED_MAZE_EXTENSION)]
+        if len(entries) <= self.disk_capacity:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in entries[:len(entries) - self.disk_capacity]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+            
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+def check_maze(layout: MazeLayout) -> List[str]:
+    # Problems that would make a maze unplayable: open cells Pac-Man can't
+    # reach, a ghost house ghosts can't leave, or no tunnel
+    grid = OccupancyGrid(layout.width, layout.height, layout.cells)
+    field = DistanceFields(grid).field(*layout.pacman_spawn)
+    problems = []
+    unreachable = sum(1 for i, kind in enumerate(layout.cells) if kind != CELL_WALL and field[i] < 0)
+    if unreachable:
+        problems.append(f"{unreachable} open cell(s) unreachable from the Pac-Man spawn")
+    if layout.gate is None or layout.house_exit is None:
+        problems.append("no ghost house gate with an exit")
+    if not layout.ghost_spawns:
+        problems.append("no ghost spawns")
+    if CELL_TUNNEL not in bytes(layout.cells):
+        problems.append("no tunnel")
+    return problems
+
+def run_maze_check(count: int, seed: int) -> bool:
+    # Generates count seeds at every difficulty into a scratch cache, checks
+    # each maze is playable and times the cold, disk and memory paths
+    keys = [(seed + i, difficulty) for i in range(count) for difficulty in range(MAX_MAZE_DIFFICULTY + 1)]
+    ok = True
+    timings = {}
+    
+    def timed(name: str, cache: MazeCache, keys: List[Tuple[int, int]]):
+        start = time.perf_counter()
+        for key in keys:
+            cache.get(*key)
+        timings[name] = (time.perf_counter() - start) / len(keys)
+        
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        cache = MazeCache(directory)
+        timed("generate", cache, keys)
+        for key in keys:
+            for problem in check_maze(cache.get(*key)):
+                print(f"seed {key[0]} difficulty {key[1]}: {problem}")
+                ok = False
+        timed("memory", cache, keys[-cache.capacity:])
+        timed("disk", MazeCache(directory), keys)
+        
+        # Collecting a maze the worker has already prefetched
+        cache = MazeCache(directory)
+        cache.prefetch(seed + count)
+        with cache.lock:
+            future = cache.pending.get((seed + count, 0, GRID_WIDTH, GRID_HEIGHT))
+        if future is not None:
+            future.result()
+        timed("prefetched", cache, [(seed + count, 0)])
+        cache.close()
+        
+    print(f"{len(keys)} {GRID_WIDTH}x{GRID_HEIGHT} mazes {'all playable' if ok else 'with problems'}; per maze: "
+          + ", ".join(f"{name} {seconds * 1e6:.0f}us" for name, seconds in timings.items()))
+    return ok
+
+class TextCache:
+    # Rendered text surfaces keyed by (font, text, color), least recently used
+    # entries are evicted first
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.surfaces: 'OrderedDict[Tuple[pygame.font.Font, str, Tuple[int, int, int]], pygame.Surface]' = OrderedDict()
+        
+    def render(self, font: pygame.font.Font, text: str, color: Tuple[int, int, int]) -> pygame.Surface:
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = font.render(text, True, color)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.max_size:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+_fonts: Dict[int, pygame.font.Font] = {}
+text_cache = TextCache()
+
+def get_font(size: int) -> pygame.font.Font:
+    # Font lookup and loading is slow, so each size is only created once
+    font = _fonts.get(size)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = pygame.font.SysFont(None, size)
+        _fonts[size] = font
+    return font
+
+class SpriteAtlas:
+    # Pre-rendered actor frames, so drawing an actor is a single blit. Every
+    # mouth angle x direction and ghost colour x eye direction is rendered
+    # by prepare(); anything unexpected is rendered on first use.
+    COLORKEY = (255, 0, 255)  # Not used by any sprite
+    PACMAN_SIZE = GRID_SIZE + 4  # Mouth lines reach past the body radius
+    MOUTH_ANGLES = range(-1, 46)  # Pacman.update swings between these
+    EYE_DIRECTIONS = (Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT, Direction.NONE)
+    
+    def __init__(self):
+        self.pacman_frames: Dict[Tuple[int, Direction], pygame.Surface] = {}
+        self.ghost_frames: Dict[Tuple[Tuple[int, int, int], Direction], pygame.Surface] = {}
+        
+    def prepare(self, ghost_colors):
+        for direction in (Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT):
+            for angle in self.MOUTH_ANGLES:
+                self.pacman(angle, direction)
+        for color in set(ghost_colors) | {FRIGHTENED_COLOR, EATEN_COLOR}:
+            for direction in self.EYE_DIRECTIONS:
+                self.ghost(color, direction)
+                
+    def new_frame(self, size: int) -> pygame.Surface:
+        frame = pygame.Surface((size, size))
+        if pygame.display.get_surface() is not None:
+            frame = frame.convert()
+        frame.fill(self.COLORKEY)
+        return frame
+    
+    def finish_frame(self, frame: pygame.Surface) -> pygame.Surface:
+        frame.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+        return frame
+                
+    def pacman(self, mouth_angle: int, direction: Direction) -> pygame.Surface:
+        if direction == Direction.NONE:
+            direction = Direction.RIGHT  # Same mouth offset
+        key = (mouth_angle, direction)
+        frame = self.pacman_frames.get(key)
+        if frame is None:
+            frame = self.render_pacman(mouth_angle, direction)
+            self.pacman_frames[key] = frame
+        return frame
+    
+    def ghost(self, color: Tuple[int, int, int], eye_direction: Direction) -> pygame.Surface:
+        key = (color, eye_direction)
+        frame = self.ghost_frames.get(key)
+        if frame is None:
+            frame = self.render_ghost(color, eye_direction)
+            self.ghost_frames[key] = frame
+        return frame
+    
+    def render_pacman(self, mouth_angle: int, direction: Direction) -> pygame.Surface:
+        # Pac-Man as a circle with a mouth, centred in the frame
+        frame = self.new_frame(self.PACMAN_SIZE)
+        center_x = center_y = self.PACMAN_SIZE // 2
+        radius = GRID_SIZE // 2 - 2
+        
+        # Calculate mouth angles based on direction and mouth_angle
+        angle_offset = {
+            Direction.RIGHT: 0,
+            Direction.UP: 90,
+            Direction.LEFT: 180,
+            Direction.DOWN: 270
+        }.get(direction, 0)
+        
+        start_angle = math.radians(angle_offset + mouth_angle)
+        end_angle = math.radians(angle_offset + 360 - mouth_angle)
+        
+        pygame.draw.arc(frame, YELLOW, 
+                       (center_x - radius, center_y - radius, 
+                        radius * 2, radius * 2),
+                       start_angle, end_angle, radius * 2)
+        
+        # Draw the mouth lines
+        pygame.draw.line(frame, YELLOW, 
+                        (center_x, center_y),
+                        (center_x + math.cos(start_angle) * radius,
+                         center_y + math.sin(start_angle) * radius), 2)
+        pygame.draw.line(frame, YELLOW,
+                        (center_x, center_y),
+                        (center_x + math.cos(end_angle) * radius,
+                         center_y + math.sin(end_angle) * radius), 2)
+        
+        # Draw a small eye
+        eye_radius = 2
+        eye_offset = radius // 2
+        eye_x = center_x + math.cos(math.radians(angle_offset)) * eye_offset
+        eye_y = center_y + math.sin(math.radians(angle_offset)) * eye_offset
+        pygame.draw.circle(frame, BLACK, (int(eye_x), int(eye_y)), eye_radius)
+        return self.finish_frame(frame)
+    
+    def render_ghost(self, color: Tuple[int, int, int], eye_direction: Direction) -> pygame.Surface:
+        frame = self.new_frame(GRID_SIZE)
+        
+        # Draw ghost body
+        ghost_rect = frame.get_rect()
+        pygame.draw.rect(frame, color, ghost_rect, 0, 10)
+        
+        # Draw eyes
+        eye_radius = 3
+        left_eye_pos = (ghost_rect.centerx - 4, ghost_rect.centery - 2)
+        right_eye_pos = (ghost_rect.centerx + 4, ghost_rect.centery - 2)
+        pygame.draw.circle(frame, WHITE, left_eye_pos, eye_radius + 2)
+        pygame.draw.circle(frame, WHITE, right_eye_pos, eye_radius + 2)
+        
+        # Draw pupils
+        pupil_x, pupil_y = eye_direction.value
+        pygame.draw.circle(frame, BLACK,
+                           (left_eye_pos[0] + pupil_x * 2, left_eye_pos[1] + pupil_y * 2),
+                           eye_radius - 1)
+        pygame.draw.circle(frame, BLACK,
+                           (right_eye_pos[0] + pupil_x * 2, right_eye_pos[1] + pupil_y * 2),
+                           eye_radius - 1)
+        return self.finish_frame(frame)
+
+sprite_atlas = SpriteAtlas()
+
+class FrameProfiler:
+    # Per-frame timings for the hot sections of the game loop, kept in a ring
+    # buffer of the last `capacity` frames. Levels only hold a reference while
+    # profiling is on, so when it is off the cost is a None check per section.
+    SECTIONS = ("events", "pacman", "ghosts", "collisions", "maze", "sprites", "hud", "present")
+    
+    def __init__(self, capacity: int = 600):
+        self.capacity = capacity
+        self.enabled = False
+        self.show_overlay = False
+        self.frames = 0  # Frames recorded since start, including overwritten ones
+        self.current = dict.fromkeys(self.SECTIONS, 0.0)
+        self.samples = array('d', [0.0]) * (capacity * len(self.SECTIONS))
+        self.overlay_text: List[pygame.Surface] = []
+        
+    def add(self, section: str, seconds: float):
+        self.current[section] += seconds
+        
+    def end_frame(self):
+        row = (self.frames % self.capacity) * len(self.SECTIONS)
+        for i, section in enumerate(self.SECTIONS):
+            self.samples[row + i] = self.current[section]
+            self.current[section] = 0.0
+        self.frames += 1
+        
+    def rows(self) -> List[List[float]]:
+        # Recorded frames, oldest first, in milliseconds
+        count = min(self.frames, self.capacity)
+        first = self.frames - count
+        width = len(self.SECTIONS)
+        result = []
+        for frame in range(first, self.frames):
+            row = (frame % self.capacity) * width
+            result.append([t * 1000 for t in self.samples[row:row + width]])
+        return result
+    
+    def percentiles(self, points: Tuple[int, ...] = (50, 95, 99)) -> Dict[str, Dict[int, float]]:
+        rows = self.rows()
+        result = {}
+        if not rows:
+            return result
+        columns = list(zip(*rows))
+        totals = [sum(row) for row in rows]
+        for section, values in list(zip(self.SECTIONS, columns)) + [("total", totals)]:
+            ordered = sorted(values)
+            result[section] = {p: ordered[min(len(ordered) - 1, len(ordered) * p // 100)] for p in points}
+        return result
+    
+    def export(self, path: str):
+        # CSV with one row per frame, or JSON with percentiles as well
+        rows = self.rows()
+        first = self.frames - len(rows)
+        if path.endswith(".json"):
+            with open(path, "w") as f:
+                json.dump({
+                    "unit": "ms",
+                    "sections": list(self.SECTIONS),
+                    "first_frame": first,
+                    "frames": rows,
+                    "percentiles": {section: {f"p{p}": ms for p, ms in values.items()}
+                                    for section, values in self.percentiles().items()}
+                }, f)
+        else:
+            import csv
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(("frame",) + self.SECTIONS)
+                for i, row in enumerate(rows):
+                    writer.writerow([first + i] + [f"{t:.4f}" for t in row])
+                    
+    def draw(self, screen: pygame.Surface) -> pygame.Rect:
+        # Bar graph of recent frame times (update, draw, other), with a line
+        # at the frame budget and rolling percentiles of the total
+        width, height, scale = 240, 120, 4  # Pixels per millisecond
+        panel = pygame.Rect(10, HUD_HEIGHT + 10, width, height)
+        pygame.draw.rect(screen, BLACK, panel)
+        pygame.draw.rect(screen, GRAY, panel, 1)
+        
+        rows = self.rows()[-width:]
+        for i, row in enumerate(rows):
+            update_ms = row[1] + row[2] + row[3]
+            draw_ms = row[4] + row[5] + row[6] + row[7]
+            x = panel.right - len(rows) + i
+            y = panel.bottom
+            for ms, color in ((update_ms, GREEN), (draw_ms, CYAN), (row[0], WHITE)):
+                bar = min(int(ms * scale), y - panel.top)
+                if bar > 0:
+                    pygame.draw.line(screen, color, (x, y - 1), (x, y - bar))
+                    y -= bar
+                    
+        budget_y = panel.bottom - int(1000 / FPS * scale)
+        if budget_y > panel.top:
+            pygame.draw.line(screen, RED, (panel.left, budget_y), (panel.right - 1, budget_y))
+        
+        # Re-rasterise the numbers a few times a second, not every frame
+        if self.frames % 15 == 0 or not self.overlay_text:
+            total = self.percentiles().get("total", {})
+            font = get_font(20)
+            self.overlay_text = [font.render(
+                "p50 {:.2f}  p95 {:.2f}  p99 {:.2f} ms".format(
+                    total.get(50, 0.0), total.get(95, 0.0), total.get(99, 0.0)), True, WHITE)]
+        screen.blit(self.overlay_text[0], (panel.left + 4, panel.top + 4))
+        return panel
+
+# Game event kinds. Every event has the same columns: tick, kind, actor
+# (Pac-Man p is p, ghost i follows them at players + i; with one Pac-Man
+# that's 0 = Pac-Man, i + 1 = ghost i), cell x and y, and a kind-specific
+# value.
+EVENT_PELLET = 0  # value: points
+EVENT_POWER_PELLET = 1  # value: points
+EVENT_GHOST_EATEN = 2  # value: points
+EVENT_DEATH = 3  # value: lives left
+EVENT_GHOST_STATE = 4  # value: the new GhostState
+EVENT_LEVEL_COMPLETE = 5  # value: score
+EVENT_GAME_OVER = 6  # value: score
+EVENT_NAMES = ("pellet", "power_pellet", "ghost_eaten", "death", "ghost_state", "level_complete", "game_over")
+# (name, array typecode, little-endian NumPy dtype)
+EVENT_COLUMNS = (("tick", "I", "<u4"), ("kind", "B", "u1"), ("actor", "H", "<u2"),
+                 ("x", "h", "<i2"), ("y", "h", "<i2"), ("value", "i", "<i4"))
+EVENT_BATCH = 8192  # Events per flushed block
+EVENT_SLOTS = 4  # Preallocated blocks: one filling, the rest queued or being written
+EVENT_EXTENSION = ".ppev"
+
+class EventLog:
+    # Records events into a ring of preallocated column blocks. A full block
+    # is handed to a writer thread, which appends it to the file, and the
+    # next free block takes over; emit() only waits if every block is still
+    # queued. The file is a header followed by blocks of
+    # (count, then each column's `count` values), little-endian.
+    MAGIC = b"PPEV"
+    VERSION = 1
+    HEADER = struct.Struct("<4sH")
+    BLOCK = struct.Struct("<I")
+    
+    def __init__(self, path: str, batch: int = EVENT_BATCH, slots: int = EVENT_SLOTS):
+        self.path = path
+        self.batch = batch
+        self.free: 'queue.Queue[Tuple[array, ...]]' = queue.Queue()
+        self.full: 'queue.Queue[Optional[Tuple[Tuple[array, ...], int]]]' = queue.Queue()
+        for _ in range(slots - 1):
+            self.free.put(self.new_block())
+        self.columns = self.new_block()
+        self.count = 0
+        self.emitted = 0
+        # The first write error, raised from flush() and close(); once set the
+        # writer drops blocks but still hands them back, so emit() never
+        # waits on it
+        self.error: Optional[OSError] = None
+        self.file = open(path, "wb")
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+        self.writer = threading.Thread(target=self.write_blocks, name="event-writer", daemon=True)
+        self.writer.start()
+        
+    def new_block(self) -> Tuple[array, ...]:
+        return tuple(array(code, [0]) * self.batch for _, code, _ in EVENT_COLUMNS)
+    
+    def emit(self, tick: int, kind: int, actor: int, x: int, y: int, value: int):
+        i = self.count
+        ticks, kinds, actors, xs, ys, values = self.columns
+        ticks[i] = tick
+        kinds[i] = kind
+        actors[i] = actor
+        xs[i] = x
+        ys[i] = y
+        values[i] = value
+        self.count = i + 1
+        if self.count == self.batch:
+            self.flush()
+            
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+        if self.count:
+            self.emitted += self.count
+            self.full.put((self.columns, self.count))
+            self.columns = self.free.get()
+            self.count = 0
+            
+    def write_blocks(self):
+        big_endian = sys.byteorder == "big"
+        while True:
+            item = self.full.get()
+            if item is None:
+                break
+            columns, count = item
+            if self.error is None:
+                try:
+                    self.file.write(self.BLOCK.pack(count))
+                    for column in columns:
+                        if big_endian:
+                            column = array(column.typecode, column[:count])
+                            column.byteswap()
+                        self.file.write(memoryview(column)[:count])
+                except OSError as e:
+                    self.error = e
+            self.free.put(columns)
+            
+    def close(self):
+        if self.file.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.full.put(None)
+            self.writer.join()
+            self.file.close()
+        if self.error is not None:
+            raise self.error
+        
+    def __enter__(self) -> 'EventLog':
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def read_events(path: str) -> Dict[str, object]:
+    # Loads a whole event log as one array per column, NumPy arrays when
+    # NumPy is available. Each column's blocks are joined in a single copy.
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version = EventLog.HEADER.unpack_from(data)
+    if magic != EventLog.MAGIC or version != EventLog.VERSION:
+        raise ValueError(f"{path}: not a Pac Pro event log (or an unsupported version)")
+    view = memoryview(data)
+    parts: Dict[str, List[memoryview]] = {name: [] for name, _, _ in EVENT_COLUMNS}
+    offset = EventLog.HEADER.size
+    while offset < len(data):
+        count, = EventLog.BLOCK.unpack_from(data, offset)
+        offset += EventLog.BLOCK.size
+        for name, code, _ in EVENT_COLUMNS:
+            size = count * array(code).itemsize
+            if offset + size > len(data):
+                raise ValueError(f"{path}: event log is truncated")
+            parts[name].append(view[offset:offset + size])
+            offset += size
+            
+    columns = {}
+    for name, code, dtype in EVENT_COLUMNS:
+        joined = b"".join(parts[name])
+        if load_numpy() is not None:
+            columns[name] = np.frombuffer(joined, dtype=dtype)
+        else:
+            column = array(code)
+            column.frombytes(joined)
+            if sys.byteorder == "big":
+                column.byteswap()
+            columns[name] = column
+    return columns
+
 class GameObject:
+    __slots__ = ("x", "y", "color", "rect", "prev_x", "prev_y", "draw_x", "draw_y")
+    
     def __init__(self, x: int, y: int, color: Tuple[int, int, int]):
         self.x = x
         self.y = y
         self.color = color
-        self.rect = pygame.Rect(x * GRID_SIZE, y * GRID_SIZE, GRID_SIZE, GRID_SIZE)
+        self.rect = pygame.Rect(x * GRID_SIZE, y * GRID_SIZE + HUD_HEIGHT, GRID_SIZE, GRID_SIZE)
+        # Position at the previous tick and where the actor is drawn now
+        self.prev_x = self.draw_x = x
+        self.prev_y = self.draw_y = y
         
     def update_rect(self):
         self.rect.x = self.x * GRID_SIZE
-        self.rect.y = self.y * GRID_SIZE + 50  # Offset for HUD
+        self.rect.y = self.y * GRID_SIZE + HUD_HEIGHT  # Offset for HUD
+        
+    def set_draw_position(self, alpha: float):
+        # Blend between the last two ticks; jumps (wrap-around, respawn) are
+        # drawn where they land
+        x, y = self.x, self.y
+        if alpha < 1.0 and abs(x - self.prev_x) <= 1 and abs(y - self.prev_y) <= 1:
+            x = self.prev_x + (x - self.prev_x) * alpha
+            y = self.prev_y + (y - self.prev_y) * alpha
+        self.draw_x = x
+        self.draw_y = y
+        self.rect.x = x * GRID_SIZE
+        self.rect.y = y * GRID_SIZE + HUD_HEIGHT
+        
+    def dirty_rect(self) -> pygame.Rect:
+        # Screen area touched by the last draw, with room for outlines
+        return self.rect.inflate(4, 4)
         
     def draw(self, screen: pygame.Surface):
         pygame.draw.rect(screen, self.color, self.rect)
 
-class Wall(GameObject):
-    def __init__(self, x: int, y: int):
-        super().__init__(x, y, BLUE)
-        self.is_gate = False
+class Wall:
+    # Thin view of one wall cell; walls live in the level's grid
+    __slots__ = ("x", "y", "is_gate")
+    color = BLUE
+    
+    def __init__(self, x: int, y: int, is_gate: bool = False):
+        self.x = x
+        self.y = y
+        self.is_gate = is_gate
+        
+    @property
+    def rect(self) -> pygame.Rect:
+        return pygame.Rect(self.x * GRID_SIZE, self.y * GRID_SIZE + HUD_HEIGHT, GRID_SIZE, GRID_SIZE)
         
     def draw(self, screen: pygame.Surface):
         if not self.is_gate:
-            pygame.draw.rect(screen, self.color, self.rect, 1)
-            inner_rect = self.rect.inflate(-6, -6)
+            rect = self.rect
+            pygame.draw.rect(screen, self.color, rect, 1)
+            inner_rect = rect.inflate(-6, -6)
             pygame.draw.rect(screen, self.color, inner_rect)
 
-class Pellet(GameObject):
-    def __init__(self, x: int, y: int, is_power_pellet: bool = False):
-        super().__init__(x, y, WHITE)
-        self.is_power_pellet = is_power_pellet
-        self.radius = 4 if not is_power_pellet else 8
-        self.eaten = False
+class WallStore:
+    # Walls and the gate read straight from the occupancy grid, so static
+    # maze cells cost one byte each and no objects until drawn
+    def __init__(self, grid: OccupancyGrid):
+        self.grid = grid
+        
+    def __iter__(self):
+        cells = self.grid.cells
+        width = self.grid.width
+        for i, kind in enumerate(cells):
+            if kind == CELL_WALL or kind == CELL_GATE:
+                yield Wall(i % width, i // width, kind == CELL_GATE)
+                
+    def __len__(self) -> int:
+        # Cells may be a read-only memoryview of a compiled maze, which has no count()
+        cells = bytes(self.grid.cells)
+        return cells.count(CELL_WALL) + cells.count(CELL_GATE)
+    
+    def draw(self, screen: pygame.Surface):
+        for wall in self:
+            wall.draw(screen)
+
+class Pellet:
+    # Thin view of one cell of a PelletStore
+    __slots__ = ("store", "index")
+    color = WHITE
+    
+    def __init__(self, store: 'PelletStore', index: int):
+        self.store = store
+        self.index = index
+        
+    @property
+    def x(self) -> int:
+        return self.index % self.store.width
+    
+    @property
+    def y(self) -> int:
+        return self.index // self.store.width
+    
+    @property
+    def is_power_pellet(self) -> bool:
+        return self.store.kinds[self.index] == PELLET_POWER
+    
+    @property
+    def eaten(self) -> bool:
+        return not self.store.live[self.index]
+    
+    @property
+    def radius(self) -> int:
+        return 8 if self.is_power_pellet else 4
+    
+    @property
+    def rect(self) -> pygame.Rect:
+        return pygame.Rect(self.x * GRID_SIZE, self.y * GRID_SIZE + HUD_HEIGHT, GRID_SIZE, GRID_SIZE)
         
     def draw(self, screen: pygame.Surface):
         if not self.eaten:
-            center = (self.rect.centerx, self.rect.centery + 50)  # Offset for HUD
-            pygame.draw.circle(screen, self.color, center, self.radius)
+            pygame.draw.circle(screen, self.color, self.rect.center, self.radius)
+
+class PelletStore:
+    # Pellets as two per-cell planes: `kinds` is what the level started with
+    # (PELLET_NONE / PELLET_NORMAL / PELLET_POWER) and `live` the same with
+    # eaten pellets cleared. Pellet objects are only made on lookup. The
+    # cells of uneaten power pellets are also kept as a set.
+    def __init__(self, width: int, height: int, kinds=None):
+        self.width = width
+        self.height = height
+        self.kinds = bytearray(width * height) if kinds is None else bytearray(kinds)
+        self.live = bytearray(self.kinds)
+        self.count = len(self.kinds) - self.kinds.count(PELLET_NONE)
+        self.remaining = self.count
+        self.power_cells = {i for i, kind in enumerate(self.kinds) if kind == PELLET_POWER}
+        self.power = set(self.power_cells)
+        
+    def __iter__(self):
+        kinds = self.kinds
+        for i in range(len(kinds)):
+            if kinds[i]:
+                yield Pellet(self, i)
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    @property
+    def power_pellets(self) -> List[Pellet]:
+        return [Pellet(self, i) for i in sorted(self.power)]
+        
+    def add(self, x: int, y: int, is_power_pellet: bool = False):
+        i = y * self.width + x
+        kind = PELLET_POWER if is_power_pellet else PELLET_NORMAL
+        if not self.kinds[i]:
+            self.count += 1
+            self.remaining += 1
+        self.kinds[i] = self.live[i] = kind
+        if is_power_pellet:
+            self.power_cells.add(i)
+            self.power.add(i)
+        else:
+            self.power_cells.discard(i)
+            self.power.discard(i)
+            
+    def reset(self, live: bytes, remaining: Optional[int] = None):
+        # Takes a whole live plane at once, as saved by Level.snapshot()
+        self.live[:] = live
+        self.remaining = len(live) - live.count(PELLET_NONE) if remaining is None else remaining
+        self.power = {i for i in self.power_cells if live[i]}
+            
+    def at(self, x: int, y: int) -> Optional[Pellet]:
+        # Uneaten pellet in the given cell, if any
+        if 0 <= x < self.width and 0 <= y < self.height and self.live[y * self.width + x]:
+            return Pellet(self, y * self.width + x)
+        return None
+    
+    def eat(self, pellet: Pellet):
+        if self.live[pellet.index]:
+            self.live[pellet.index] = PELLET_NONE
+            self.remaining -= 1
+            self.power.discard(pellet.index)
 
 class Ghost(GameObject):
+    __slots__ = ("name", "start_x", "start_y", "direction", "next_direction", "speed", "state",
+                 "frightened_timer", "scatter_timer", "chase_timer", "target", "scatter_target",
+                 "personality", "in_house", "eye_direction")
+    
     def __init__(self, x: int, y: int, color: Tuple[int, int, int], name: str):
         super().__init__(x, y, color)
         self.name = name
@@ -103,6 +1350,8 @@ class Ghost(GameObject):
         self.scatter_timer = 7 * FPS  # 7 seconds
         self.chase_timer = 20 * FPS   # 20 seconds
         self.target = (0, 0)
+        self.scatter_target = (0, 0)
+        self.personality = GHOST_PERSONALITIES.get(name, 0)
         self.in_house = True
         self.eye_direction = Direction.LEFT
         
@@ -127,27 +1376,97 @@ class Ghost(GameObject):
         self.update_rect()
         
     def move(self, level: 'Level', pacman: 'Pacman'):
-        # Simplified movement - in a real game, implement proper pathfinding
-        possible_directions = self.get_possible_directions(level)
+        # One draw per move whether or not it is needed, so the random
+        # stream lines up with BatchSimulator's per-ghost draws
+        roll = level.rng.random()
         
-        if not possible_directions:
-            return
+        # Ghosts only turn at cell centres, where the decision is a lookup
+        # of the neighbouring cells in the target's distance field
+        cell_x = round(self.x)
+        cell_y = round(self.y)
+        if abs(self.x - cell_x) < 1e-6 and abs(self.y - cell_y) < 1e-6:
+            self.x = float(cell_x)
+            self.y = float(cell_y)
+            self.update_house_state(level, cell_x, cell_y)
+            possible_directions = self.get_possible_directions(level)
             
-        if len(possible_directions) > 1:
-            self.direction = random.choice(possible_directions)
-        else:
-            self.direction = possible_directions[0]
+            if self.state == GhostState.FRIGHTENED:
+                self.direction = possible_directions[int(roll * len(possible_directions))]
+            else:
+                self.target = self.get_target(level, pacman)
+                self.direction = self.choose_direction(level, possible_directions, cell_x, cell_y)
+            self.eye_direction = self.direction
             
         dx, dy = self.direction.value
-        self.x += dx * self.speed * 0.1  # Slower movement
-        self.y += dy * self.speed * 0.1
+        self.x += dx * self.speed * MOVE_STEP  # Slower movement
+        self.y += dy * self.speed * MOVE_STEP
         
         # Wrap around
         if self.x < 0:
-            self.x = GRID_WIDTH - 1
-        elif self.x >= GRID_WIDTH:
+            self.x = level.width - 1
+        elif self.x >= level.width:
             self.x = 0
             
+    def update_house_state(self, level: 'Level', cell_x: int, cell_y: int):
+        if self.in_house and (level.house_exit is None or (cell_x, cell_y) == level.house_exit):
+            self.in_house = False
+        if self.state == GhostState.EATEN and (cell_x, cell_y) == (self.start_x, self.start_y):
+            # Back home: revive and leave the house again
+            self.state = GhostState.CHASE
+            self.in_house = True
+            
+    def get_target(self, level: 'Level', pacman: 'Pacman') -> Tuple[int, int]:
+        if self.state == GhostState.EATEN:
+            return (self.start_x, self.start_y)
+        if self.in_house:
+            return level.house_exit
+        if self.state == GhostState.SCATTER:
+            return self.scatter_target
+        
+        pac_x = math.floor(pacman.x + 0.5)
+        pac_y = math.floor(pacman.y + 0.5)
+        dx, dy = pacman.direction.value
+        if self.personality == 1:
+            # Pinky: ambush four cells ahead of Pac-Man
+            x, y = pac_x + 4 * dx, pac_y + 4 * dy
+        elif self.personality == 2:
+            # Inky: double the vector from the lead ghost to two cells ahead
+            leader = level.ghosts[0]
+            x = 2 * (pac_x + 2 * dx) - math.floor(leader.x + 0.5)
+            y = 2 * (pac_y + 2 * dy) - math.floor(leader.y + 0.5)
+        elif self.personality == 3:
+            # Clyde: chase from afar, back off to his corner when close
+            ghost_x = math.floor(self.x + 0.5)
+            ghost_y = math.floor(self.y + 0.5)
+            if (ghost_x - pac_x) ** 2 + (ghost_y - pac_y) ** 2 > 64:
+                x, y = pac_x, pac_y
+            else:
+                x, y = self.scatter_target
+        else:
+            # Blinky: straight at Pac-Man
+            x, y = pac_x, pac_y
+        
+        return (min(max(x, 0), level.width - 1), min(max(y, 0), level.height - 1))
+    
+    def choose_direction(self, level: 'Level', possible_directions: List[Direction],
+                         cell_x: int, cell_y: int) -> Direction:
+        # Step to the neighbour closest to the target; ties keep the
+        # first direction in possible_directions
+        field = level.distance_fields.field(*self.target)
+        best = possible_directions[0]
+        best_distance = None
+        for direction in possible_directions:
+            dx, dy = direction.value
+            next_x = (cell_x + dx) % level.width
+            next_y = cell_y + dy
+            distance = field[next_y * level.width + next_x] if 0 <= next_y < level.height else -1
+            if distance < 0:
+                distance = level.width * level.height
+            if best_distance is None or distance < best_distance:
+                best = direction
+                best_distance = distance
+        return best
+    
     def get_possible_directions(self, level: 'Level') -> List[Direction]:
         directions = []
         for direction in [Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT]:
@@ -167,58 +1486,23 @@ class Ghost(GameObject):
             
     def would_collide(self, level: 'Level', direction: Direction) -> bool:
         dx, dy = direction.value
-        new_x = int(self.x + dx)
-        new_y = int(self.y + dy)
-        
-        # Check if out of bounds (wrapping is handled in move)
-        if new_x < 0 or new_x >= GRID_WIDTH or new_y < 0 or new_y >= GRID_HEIGHT:
-            return False
-            
-        # Check for walls
-        for wall in level.walls:
-            if wall.x == new_x and wall.y == new_y and not wall.is_gate:
-                return True
-                
-        return False
+        # Out of bounds counts as open (wrapping is handled in move)
+        return level.grid.is_blocked(int(self.x + dx), int(self.y + dy))
     
-    def draw(self, screen: pygame.Surface):
+    def body_color(self) -> Tuple[int, int, int]:
         if self.state == GhostState.FRIGHTENED:
-            color = (0, 0, 139)  # Dark blue when frightened
-        elif self.state == GhostState.EATEN:
-            color = (200, 200, 200)  # Faint gray when eaten
-        else:
-            color = self.color
-            
-        # Draw ghost body
-        ghost_rect = self.rect.copy()
-        ghost_rect.y += 50  # Offset for HUD
-        pygame.draw.rect(screen, color, ghost_rect, 0, 10)
+            return FRIGHTENED_COLOR
+        if self.state == GhostState.EATEN:
+            return EATEN_COLOR
+        return self.color
         
-        # Draw eyes
-        eye_radius = 3
-        left_eye_pos = (ghost_rect.centerx - 4, ghost_rect.centery - 2)
-        right_eye_pos = (ghost_rect.centerx + 4, ghost_rect.centery - 2)
-        pygame.draw.circle(screen, WHITE, left_eye_pos, eye_radius + 2)
-        pygame.draw.circle(screen, WHITE, right_eye_pos, eye_radius + 2)
-        
-        # Draw pupils
-        pupil_offset = {
-            Direction.UP: (0, -1),
-            Direction.DOWN: (0, 1),
-            Direction.LEFT: (-1, 0),
-            Direction.RIGHT: (1, 0)
-        }.get(self.eye_direction, (0, 0))
-        
-        pygame.draw.circle(screen, (0, 0, 0), 
-                         (left_eye_pos[0] + pupil_offset[0] * 2, 
-                          left_eye_pos[1] + pupil_offset[1] * 2), 
-                         eye_radius - 1)
-        pygame.draw.circle(screen, (0, 0, 0),
-                         (right_eye_pos[0] + pupil_offset[0] * 2,
-                          right_eye_pos[1] + pupil_offset[1] * 2),
-                         eye_radius - 1)
+    def draw(self, screen: pygame.Surface):
+        screen.blit(sprite_atlas.ghost(self.body_color(), self.eye_direction), self.rect)
 
 class Pacman(GameObject):
+    __slots__ = ("direction", "next_direction", "speed", "lives", "score", "power_pellet_active",
+                 "power_pellet_timer", "mouth_angle", "mouth_direction", "mouth_speed")
+    
     def __init__(self, x: int, y: int):
         super().__init__(x, y, YELLOW)
         self.direction = Direction.RIGHT
@@ -256,13 +1540,13 @@ class Pacman(GameObject):
         # Move in current direction
         if not self.will_collide(level, self.direction):
             dx, dy = self.direction.value
-            self.x += dx * self.speed * 0.1
-            self.y += dy * self.speed * 0.1
+            self.x += dx * self.speed * MOVE_STEP
+            self.y += dy * self.speed * MOVE_STEP
             
             # Wrap around
             if self.x < 0:
-                self.x = GRID_WIDTH - 1
-            elif self.x >= GRID_WIDTH:
+                self.x = level.width - 1
+            elif self.x >= level.width:
                 self.x = 0
                 
         # Check for pellet collisions
@@ -270,38 +1554,36 @@ class Pacman(GameObject):
         
         # Update rect for collision detection
         self.update_rect()
+        
+    def dirty_rect(self) -> pygame.Rect:
+        # draw() works from the draw position rather than the rect
+        radius = GRID_SIZE // 2
+        center_x = int(self.draw_x * GRID_SIZE + radius)
+        center_y = int(self.draw_y * GRID_SIZE + radius + HUD_HEIGHT)
+        return pygame.Rect(center_x - radius - 2, center_y - radius - 2,
+                           GRID_SIZE + 4, GRID_SIZE + 4)
     
     def will_collide(self, level: 'Level', direction: Direction) -> bool:
         dx, dy = direction.value
-        new_x = int(self.x + dx)
-        new_y = int(self.y + dy)
-        
-        # Check if out of bounds (wrapping is handled in move)
-        if new_x < 0 or new_x >= GRID_WIDTH or new_y < 0 or new_y >= GRID_HEIGHT:
-            return False
-            
-        # Check for walls
-        for wall in level.walls:
-            if wall.x == new_x and wall.y == new_y and not wall.is_gate:
-                return True
-                
-        return False
+        # Out of bounds counts as open (wrapping is handled in move)
+        return level.grid.is_blocked(int(self.x + dx), int(self.y + dy))
     
     def check_pellet_collision(self, level: 'Level'):
-        for pellet in level.pellets:
-            if not pellet.eaten and math.dist((self.x, self.y), (pellet.x, pellet.y)) < 0.5:
-                pellet.eaten = True
-                if pellet.is_power_pellet:
-                    self.score += 50
-                    self.activate_power_pellet()
-                else:
-                    self.score += 10
-                
-                # Check if level is complete
-                if all(p.eaten for p in level.pellets):
-                    level.complete = True
+        # Only the nearest cell can hold a pellet within 0.5 of Pac-Man
+        pellet = level.pellets.at(math.floor(self.x + 0.5), math.floor(self.y + 0.5))
+        if pellet is not None and math.dist((self.x, self.y), (pellet.x, pellet.y)) < 0.5:
+            level.eat_pellet(pellet)
+            if pellet.is_power_pellet:
+                self.score += 50
+                self.activate_power_pellet(level)
+            else:
+                self.score += 10
+            if level.events is not None:
+                power = pellet.is_power_pellet
+                level.events.emit(level.ticks, EVENT_POWER_PELLET if power else EVENT_PELLET,
+                                  level.players.index(self), pellet.x, pellet.y, 50 if power else 10)
     
-    def activate_power_pellet(self):
+    def activate_power_pellet(self, level: 'Level'):
         self.power_pellet_active = True
         self.power_pellet_timer = 10 * FPS  # 10 seconds
         # Set all ghosts to frightened state
@@ -311,196 +1593,1999 @@ class Pacman(GameObject):
                 ghost.frightened_timer = 10 * FPS
     
     def draw(self, screen: pygame.Surface):
-        # Draw Pac-Man as a circle with a mouth
-        center_x = int(self.x * GRID_SIZE + GRID_SIZE // 2)
-        center_y = int(self.y * GRID_SIZE + GRID_SIZE // 2 + 50)  # Offset for HUD
-        radius = GRID_SIZE // 2 - 2
-        
-        # Calculate mouth angles based on direction and mouth_angle
-        angle_offset = {
-            Direction.RIGHT: 0,
-            Direction.UP: 90,
-            Direction.LEFT: 180,
-            Direction.DOWN: 270
-        }.get(self.direction, 0)
-        
-        start_angle = math.radians(angle_offset + self.mouth_angle)
-        end_angle = math.radians(angle_offset + 360 - self.mouth_angle)
-        
-        # Draw Pac-Man
-        pygame.draw.arc(screen, self.color, 
-                       (center_x - radius, center_y - radius, 
-                        radius * 2, radius * 2),
-                       start_angle, end_angle, radius * 2)
-        
-        # Draw the mouth lines
-        pygame.draw.line(screen, self.color, 
-                        (center_x, center_y),
-                        (center_x + math.cos(start_angle) * radius,
-                         center_y + math.sin(start_angle) * radius), 2)
-        pygame.draw.line(screen, self.color,
-                        (center_x, center_y),
-                        (center_x + math.cos(end_angle) * radius,
-                         center_y + math.sin(end_angle) * radius), 2)
-        
-        # Draw a small eye
-        eye_radius = 2
-        eye_offset = radius // 2
-        eye_x = center_x + math.cos(math.radians(angle_offset)) * eye_offset
-        eye_y = center_y + math.sin(math.radians(angle_offset)) * eye_offset
-        pygame.draw.circle(screen, BLACK, (int(eye_x), int(eye_y)), eye_radius)
+        # Frames are centred on the same point the dirty rect is
+        offset = SpriteAtlas.PACMAN_SIZE // 2
+        center_x = int(self.draw_x * GRID_SIZE + GRID_SIZE // 2)
+        center_y = int(self.draw_y * GRID_SIZE + GRID_SIZE // 2 + HUD_HEIGHT)  # Offset for HUD
+        screen.blit(sprite_atlas.pacman(self.mouth_angle, self.direction), (center_x - offset, center_y - offset))
 
 class Level:
-    def __init__(self, level_num: int = 1):
+    def __init__(self, level_num: int = 1, width: int = GRID_WIDTH, height: int = GRID_HEIGHT,
+                 seed: Optional[int] = None, num_ghosts: int = 4, layout: Optional[MazeLayout] = None,
+                 num_players: int = 1):
         self.level_num = level_num
-        self.walls: List[Wall] = []
-        self.pellets: List[Pellet] = []
+        self.layout = layout
+        if layout is not None:
+            width, height = layout.width, layout.height
+        self.num_ghosts = num_ghosts
+        self.num_players = num_players
+        # Every random decision in the level goes through this, so a seed
+        # fully determines a run for a given input sequence
+        self.rng = random.Random(seed)
+        self.ticks = 0
+        self.ghosts_eaten = 0
+        self.width = width
+        self.height = height
+        self.grid = OccupancyGrid(width, height, layout.cells if layout is not None else None)
+        self.walls = WallStore(self.grid)
+        self.gate: Optional[Tuple[int, int]] = None
+        self.exit_cell: Optional[Tuple[int, int]] = None  # Set by layouts; derived from the gate otherwise
+        self.pacman_spawn = (width // 2, height - 3)
+        self.ghost_home = (width // 2, 7)
+        self.pellets = PelletStore(width, height, layout.pellets if layout is not None else None)
         self.ghosts: List[Ghost] = []
+        # Every Pac-Man in the maze; `pacman` is players[0], the one the HUD
+        # follows. Multiplayer Pac-Men all (re)spawn at pacman_spawn.
         self.pacman: Optional[Pacman] = None
-        self.complete = False
-        self.setup_level()
+        self.players: List[Pacman] = []
+        # Cell indices of pellets eaten, appended to when not None
+        self.eaten_log: Optional[List[int]] = None
+        # Static maze layer, built on first draw
+        self.background: Optional[pygame.Surface] = None
+        self.full_redraw = True
+        self.sprite_rects: List[pygame.Rect] = []
+        self.erased_rects: List[pygame.Rect] = []
+        self.profiler: Optional[FrameProfiler] = None
+        self.events: Optional[EventLog] = None
+        self.hud_values: Optional[Tuple[int, int, int]] = None
+        self.power_bar_width: Optional[int] = None
+        if layout is not None:
+            self.load_layout(layout)
+        else:
+            self.setup_level()
+        self.distance_fields = DistanceFields(self.grid)
+        # Who is near whom. Pac-Man is kept current for collisions; buckets
+        # are at least a collision distance wide, so every Pac-Man a ghost
+        # could touch is filed in the ghost's own bucket. The ghost hash is
+        # only for proximity queries, so it's rebuilt on the first query of
+        # a tick rather than every tick.
+        self.pacman_hash = SpatialHash(width, height, reach=1)
+        self.pacman_hash.rebuild(self.players)
+        self.ghost_hash = SpatialHash(width, height)
+        self.ghost_hash_tick: Optional[int] = None
+        
+    @property
+    def house_exit(self) -> Optional[Tuple[int, int]]:
+        # Ghosts leave the house through the cell just above the gate
+        if self.exit_cell is not None:
+            return self.exit_cell
+        if self.gate is None:
+            return None
+        return (self.gate[0], self.gate[1] - 1)
+        
+    @property
+    def complete(self) -> bool:
+        # Level is done once the live pellet counter hits zero
+        return self.pellets.remaining == 0
+        
+    def add_wall(self, x: int, y: int, is_gate: bool = False) -> Wall:
+        # Walls are just grid cells; WallStore reads them back for drawing
+        self.grid.set(x, y, CELL_GATE if is_gate else CELL_WALL)
+        if is_gate:
+            self.gate = (x, y)
+        return Wall(x, y, is_gate)
+    
+    def eat_pellet(self, pellet: Pellet):
+        self.pellets.eat(pellet)
+        if self.eaten_log is not None:
+            self.eaten_log.append(pellet.index)
+        # Keep the cached maze layer in step with the pellet store
+        if self.background is not None:
+            self.background.fill(BLACK, pellet.rect)
+            self.erased_rects.append(pellet.rect)
+            
+    def snapshot(self) -> tuple:
+        # Everything that changes while playing, as one flat immutable tuple:
+        # (ticks, ghosts eaten, rng state, pellet plane, pellets left,
+        #  (Pac-Man fields...), ghost fields...). The maze, roster and caches
+        # are never copied; restore() expects a Level built on the same maze.
+        return (self.ticks, self.ghosts_eaten, self.rng.getstate(), bytes(self.pellets.live),
+                self.pellets.remaining,
+                tuple((pacman.x, pacman.y, pacman.direction, pacman.next_direction, pacman.lives, pacman.score,
+                       pacman.power_pellet_active, pacman.power_pellet_timer, pacman.mouth_angle,
+                       pacman.mouth_direction) for pacman in self.players),
+                *[(ghost.x, ghost.y, ghost.direction, ghost.state, ghost.frightened_timer, ghost.scatter_timer,
+                   ghost.chase_timer, ghost.target, ghost.in_house, ghost.eye_direction)
+                  for ghost in self.ghosts])
+    
+    def restore(self, snapshot: tuple):
+        self.ticks, self.ghosts_eaten, rng_state, pellets, remaining, players = snapshot[:6]
+        self.rng.setstate(rng_state)
+        self.pellets.reset(pellets, remaining)
+        
+        for pacman, state in zip(self.players, players):
+            (pacman.x, pacman.y, pacman.direction, pacman.next_direction, pacman.lives, pacman.score,
+             pacman.power_pellet_active, pacman.power_pellet_timer, pacman.mouth_angle,
+             pacman.mouth_direction) = state
+            pacman.prev_x, pacman.prev_y = pacman.x, pacman.y
+            pacman.update_rect()
+        for ghost, state in zip(self.ghosts, snapshot[6:]):
+            (ghost.x, ghost.y, ghost.direction, ghost.state, ghost.frightened_timer, ghost.scatter_timer,
+             ghost.chase_timer, ghost.target, ghost.in_house, ghost.eye_direction) = state
+            ghost.prev_x, ghost.prev_y = ghost.x, ghost.y
+            ghost.update_rect()
+            
+        self.pacman_hash.rebuild([pacman for pacman in self.players if pacman.lives > 0])
+        self.ghost_hash_tick = None
+        if self.background is not None:
+            # Eaten pellets may have come back
+            self.background = None
+            self.erased_rects = []
+            
+    def mark_dirty(self, rect: pygame.Rect):
+        # Something else drew over the maze; restore it on the next frame
+        self.erased_rects.append(rect)
         
     def setup_level(self):
+        width, height = self.width, self.height
+        
         # Create a simple maze
         # Outer walls
-        for x in range(GRID_WIDTH):
-            self.walls.append(Wall(x, 0))
-            self.walls.append(Wall(x, GRID_HEIGHT - 1))
+        for x in range(width):
+            self.add_wall(x, 0)
+            self.add_wall(x, height - 1)
             
-        for y in range(GRID_HEIGHT):
-            self.walls.append(Wall(0, y))
-            self.walls.append(Wall(GRID_WIDTH - 1, y))
+        for y in range(height):
+            self.add_wall(0, y)
+            self.add_wall(width - 1, y)
         
         # Add some inner walls
-        for x in range(5, GRID_WIDTH - 5):
-            if x != GRID_WIDTH // 2:
-                self.walls.append(Wall(x, 5))
-                self.walls.append(Wall(x, GRID_HEIGHT - 6))
+        for x in range(5, width - 5):
+            if x != width // 2:
+                self.add_wall(x, 5)
+                self.add_wall(x, height - 6)
                 
         # Add a gate for the ghost house
-        gate = Wall(GRID_WIDTH // 2, 5)
-        gate.is_gate = True
-        self.walls.append(gate)
+        self.add_wall(width // 2, 5, is_gate=True)
         
         # Add pellets
-        for x in range(2, GRID_WIDTH - 2):
-            for y in range(2, GRID_HEIGHT - 2):
+        for x in range(2, width - 2):
+            for y in range(2, height - 2):
                 # Skip walls and ghost house area
-                if not any(wall.x == x and wall.y == y for wall in self.walls) and \
-                   not (x > GRID_WIDTH // 2 - 3 and x < GRID_WIDTH // 2 + 3 and y > 2 and y < 8):
+                if self.grid.get(x, y) == CELL_EMPTY and \
+                   not (x > width // 2 - 3 and x < width // 2 + 3 and y > 2 and y < 8):
                     is_power = (x == 2 and y == 2) or \
-                              (x == GRID_WIDTH - 3 and y == 2) or \
-                              (x == 2 and y == GRID_HEIGHT - 3) or \
-                              (x == GRID_WIDTH - 3 and y == GRID_HEIGHT - 3)
-                    self.pellets.append(Pellet(x, y, is_power))
+                              (x == width - 3 and y == 2) or \
+                              (x == 2 and y == height - 3) or \
+                              (x == width - 3 and y == height - 3)
+                    self.pellets.add(x, y, is_power)
         
         # Add Pac-Man
-        self.pacman = Pacman(GRID_WIDTH // 2, GRID_HEIGHT - 3)
+        self.pacman = Pacman(*self.pacman_spawn)
+        self.players = [self.pacman] + [Pacman(*self.pacman_spawn) for _ in range(self.num_players - 1)]
         
         # Add ghosts
         self.ghosts = [
-            Ghost(GRID_WIDTH // 2 - 2, 7, RED, "Blinky"),
-            Ghost(GRID_WIDTH // 2 + 2, 7, PINK, "Pinky"),
-            Ghost(GRID_WIDTH // 2 - 2, 8, CYAN, "Inky"),
-            Ghost(GRID_WIDTH // 2 + 2, 8, ORANGE, "Clyde")
-        ]
-    
-    def update(self):
-        self.pacman.update(self)
+            Ghost(width // 2 - 2, 7, RED, "Blinky"),
+            Ghost(width // 2 + 2, 7, PINK, "Pinky"),
+            Ghost(width // 2 - 2, 8, CYAN, "Inky"),
+            Ghost(width // 2 + 2, 8, ORANGE, "Clyde")
+        ][:self.num_ghosts]
+        self.add_extra_ghosts()
+        self.assign_scatter_targets()
+        
+    def load_layout(self, layout: MazeLayout):
+        # The grid and pellet store were built straight from the layout's
+        # planes, so only spawns are left to set up
+        self.gate = layout.gate
+        self.exit_cell = layout.house_exit
+        
+        self.pacman_spawn = layout.pacman_spawn
+        self.pacman = Pacman(*self.pacman_spawn)
+        self.players = [self.pacman] + [Pacman(*self.pacman_spawn) for _ in range(self.num_players - 1)]
+        
+        roster = [(RED, "Blinky"), (PINK, "Pinky"), (CYAN, "Inky"), (ORANGE, "Clyde")]
+        spawns = layout.ghost_spawns[:self.num_ghosts]
+        for i, (x, y) in enumerate(spawns):
+            color, name = roster[i % len(roster)]
+            ghost = Ghost(x, y, color, name if i < len(roster) else f"{name} {i // len(roster) + 1}")
+            ghost.personality = i % len(roster)
+            self.ghosts.append(ghost)
+        if layout.ghost_spawns:
+            self.ghost_home = layout.ghost_spawns[0]
+        elif layout.house_exit is not None:
+            self.ghost_home = layout.house_exit
+        else:
+            self.ghost_home = layout.pacman_spawn
+        self.add_extra_ghosts()
+        self.assign_scatter_targets()
         
-        # Update ghosts
+    def add_extra_ghosts(self):
+        # Ghosts beyond the classic four cycle through the same colours and
+        # personalities, spawning in the open cells nearest the house
+        if len(self.ghosts) >= self.num_ghosts:
+            return
+        taken = {(ghost.x, ghost.y) for ghost in self.ghosts}
+        taken.add((self.pacman.x, self.pacman.y))
+        start = self.ghost_home
+        seen = {start}
+        frontier = deque([start])
+        roster = [(RED, "Blinky"), (PINK, "Pinky"), (CYAN, "Inky"), (ORANGE, "Clyde")]
+        
+        while frontier and len(self.ghosts) < self.num_ghosts:
+            x, y = frontier.popleft()
+            if (x, y) not in taken and self.grid.get(x, y) == CELL_EMPTY:
+                i = len(self.ghosts)
+                color, name = roster[i % len(roster)]
+                ghost = Ghost(x, y, color, f"{name} {i // len(roster) + 1}")
+                ghost.personality = i % len(roster)
+                self.ghosts.append(ghost)
+            for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+                cell = (x + dx, y + dy)
+                if cell not in seen and self.grid.in_bounds(*cell) and not self.grid.is_blocked(*cell):
+                    seen.add(cell)
+                    frontier.append(cell)
+        
+    def assign_scatter_targets(self):
+        corners = [(self.width - 2, 1), (1, 1), (self.width - 2, self.height - 2), (1, self.height - 2)]
         for ghost in self.ghosts:
-            ghost.update(self, self.pacman)
-            
-            # Check ghost collisions with Pac-Man
-            if (ghost.state != GhostState.EATEN and 
-                math.dist((ghost.x, ghost.y), (self.pacman.x, self.pacman.y)) < 0.8):
-                if ghost.state == GhostState.FRIGHTENED:
-                    # Eat ghost
-                    ghost.state = GhostState.EATEN
-                    self.pacman.score += 200
-                elif ghost.state != GhostState.EATEN:
-                    # Lose a life
-                    self.pacman.lives -= 1
-                    if self.pacman.lives <= 0:
-                        return "GAME_OVER"
-                    else:
-                        # Reset positions
-                        self.pacman.x = GRID_WIDTH // 2
-                        self.pacman.y = GRID_HEIGHT - 3
-                        self.pacman.direction = Direction.RIGHT
-                        self.pacman.next_direction = Direction.RIGHT
-                        
-                        for g in self.ghosts:
-                            g.x = g.start_x
-                            g.y = g.start_y
-                            g.state = GhostState.SCATTER
-                            g.in_house = True
+            ghost.scatter_target = corners[ghost.personality]
+    
+    def update(self) -> str:
+        if self.events is not None:
+            return self.update_logged(self.events)
+        return self.advance()
+    
+    def update_logged(self, events: EventLog) -> str:
+        # advance(), plus events for the ghost state changes and the result.
+        # Pellets, ghosts eaten and deaths are logged where they happen.
+        states = [ghost.state for ghost in self.ghosts]
+        result = self.advance()
+        tick = self.ticks
+        for i, ghost in enumerate(self.ghosts):
+            if ghost.state is not states[i]:
+                events.emit(tick, EVENT_GHOST_STATE, len(self.players) + i, round(ghost.x), round(ghost.y),
+                            ghost.state.value)
+        if result != "PLAYING":
+            pacman = self.pacman
+            events.emit(tick, EVENT_LEVEL_COMPLETE if result == "LEVEL_COMPLETE" else EVENT_GAME_OVER, 0,
+                        round(pacman.x), round(pacman.y), pacman.score)
+        return result
+        
+    def advance(self) -> str:
+        self.ticks += 1
+        # Remember where everyone was, for interpolated drawing
+        for actor in self.ghosts:
+            actor.prev_x, actor.prev_y = actor.x, actor.y
+        for pacman in self.players:
+            pacman.prev_x, pacman.prev_y = pacman.x, pacman.y
+        
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+        for pacman in self.players:
+            if pacman.lives > 0:
+                pacman.update(self)
+                self.pacman_hash.move(pacman, pacman.x, pacman.y)
+        if profiler is not None:
+            now = time.perf_counter()
+            profiler.add("pacman", now - start)
+            start = now
+        
+        # Update ghosts; with several Pac-Men each ghost hunts the nearest
+        chase = self.pacman
+        multiplayer = len(self.players) > 1
+        for ghost in self.ghosts:
+            if multiplayer:
+                chase = self.nearest_player(ghost.x, ghost.y)
+            ghost.update(self, chase)
+            if profiler is not None:
+                now = time.perf_counter()
+                profiler.add("ghosts", now - start)
+                start = now
+                
+            result = self.check_ghost_collision(ghost)
+            if profiler is not None:
+                now = time.perf_counter()
+                profiler.add("collisions", now - start)
+                start = now
+            if result is not None:
+                return result
         
         if self.complete:
             return "LEVEL_COMPLETE"
             
         return "PLAYING"
     
-    def draw(self, screen: pygame.Surface):
-        # Draw background
-        screen.fill(BLACK)
-        
-        # Draw HUD
-        self.draw_hud(screen)
+    def check_ghost_collision(self, ghost: Ghost) -> Optional[str]:
+        if ghost.state == GhostState.EATEN:
+            return None
+        for pacman in self.pacman_hash.at(ghost.x, ghost.y):
+            if math.dist((ghost.x, ghost.y), (pacman.x, pacman.y)) >= GHOST_COLLISION_DISTANCE:
+                continue
+            if ghost.state == GhostState.FRIGHTENED:
+                # Eat ghost
+                ghost.state = GhostState.EATEN
+                pacman.score += 200
+                self.ghosts_eaten += 1
+                if self.events is not None:
+                    self.events.emit(self.ticks, EVENT_GHOST_EATEN, self.players.index(pacman),
+                                     round(ghost.x), round(ghost.y), 200)
+                return None
+            
+            # Lose a life
+            pacman.lives -= 1
+            if self.events is not None:
+                self.events.emit(self.ticks, EVENT_DEATH, self.players.index(pacman), round(pacman.x),
+                                 round(pacman.y), pacman.lives)
+            if pacman.lives <= 0:
+                if len(self.players) == 1:
+                    return "GAME_OVER"
+                # Out of a multiplayer game; it's over when everyone is
+                self.pacman_hash.remove(pacman)
+                if not any(player.lives > 0 for player in self.players):
+                    return "GAME_OVER"
+                return None
+            
+            # Reset positions
+            pacman.x, pacman.y = self.pacman_spawn
+            pacman.direction = Direction.RIGHT
+            pacman.next_direction = Direction.RIGHT
+            self.pacman_hash.move(pacman, pacman.x, pacman.y)
+            if len(self.players) > 1:
+                # The others play on; only the one caught starts over
+                return None
+            
+            for g in self.ghosts:
+                g.x = g.start_x
+                g.y = g.start_y
+                g.state = GhostState.SCATTER
+                g.in_house = True
+            return None
+        return None
+    
+    def nearest_player(self, x: float, y: float) -> Pacman:
+        best = self.pacman
+        best_distance = None
+        for pacman in self.players:
+            if pacman.lives > 0:
+                distance = (pacman.x - x) ** 2 + (pacman.y - y) ** 2
+                if best_distance is None or distance < best_distance:
+                    best = pacman
+                    best_distance = distance
+        return best
+    
+    def ghosts_near(self, x: float, y: float, radius: float) -> List[Ghost]:
+        if self.ghost_hash_tick != self.ticks:
+            self.ghost_hash.rebuild(self.ghosts)
+            self.ghost_hash_tick = self.ticks
+        return [ghost for ghost in self.ghost_hash.query(x, y, radius)
+                if math.dist((ghost.x, ghost.y), (x, y)) < radius]
+    
+    def ghost_pairs(self, radius: float) -> int:
+        # Number of ghost pairs closer than radius, O(ghosts) via the hash
+        order = {ghost: i for i, ghost in enumerate(self.ghosts)}
+        pairs = 0
+        for i, ghost in enumerate(self.ghosts):
+            for other in self.ghosts_near(ghost.x, ghost.y, radius):
+                if order[other] > i:
+                    pairs += 1
+        return pairs
+    
+    def build_background(self, size: Tuple[int, int]):
+        # Walls never change and pellets only disappear, so draw them once
+        self.background = pygame.Surface(size)
+        if pygame.display.get_surface() is not None:
+            self.background = self.background.convert()
+        self.background.fill(BLACK)
         
-        # Draw walls
-        for wall in self.walls:
-            wall.draw(screen)
+        self.walls.draw(self.background)
+        sprite_atlas.prepare(ghost.color for ghost in self.ghosts)
             
-        # Draw pellets
         for pellet in self.pellets:
-            pellet.draw(screen)
+            pellet.draw(self.background)
             
+        self.full_redraw = True
+        
+    def invalidate(self):
+        # Next draw repaints the whole screen (e.g. after an overlay)
+        self.full_redraw = True
+    
+    def draw(self, screen: pygame.Surface, alpha: float = 1.0) -> List[pygame.Rect]:
+        # Returns the screen regions that changed, for display.update().
+        # `alpha` is how far into the next tick to draw the actors.
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+            
+        if self.background is None or self.background.get_size() != screen.get_size():
+            self.build_background(screen.get_size())
+            
+        players = [pacman for pacman in self.players if pacman.lives > 0] or [self.pacman]
+        for ghost in self.ghosts:
+            ghost.set_draw_position(alpha)
+        for pacman in players:
+            pacman.set_draw_position(alpha)
+        sprite_rects = [ghost.dirty_rect() for ghost in self.ghosts]
+        sprite_rects.extend(pacman.dirty_rect() for pacman in players)
+        
+        if self.full_redraw:
+            screen.blit(self.background, (0, 0))
+            dirty = [screen.get_rect()]
+            self.full_redraw = False
+            self.hud_values = None
+            self.power_bar_width = None
+        else:
+            # Restore the maze under last frame's sprites and under the new
+            # positions, since sprites don't cover their whole cell
+            dirty = self.sprite_rects + sprite_rects + self.erased_rects
+            for rect in dirty:
+                screen.blit(self.background, rect, rect)
+        self.sprite_rects = sprite_rects
+        self.erased_rects = []
+        if profiler is not None:
+            now = time.perf_counter()
+            profiler.add("maze", now - start)
+            start = now
+        
+        # Draw HUD
+        dirty.extend(self.draw_hud(screen))
+        if profiler is not None:
+            now = time.perf_counter()
+            profiler.add("hud", now - start)
+            start = now
+        
         # Draw ghosts
         for ghost in self.ghosts:
             ghost.draw(screen)
             
         # Draw Pac-Man
-        self.pacman.draw(screen)
+        for pacman in players:
+            pacman.draw(screen)
+        if profiler is not None:
+            profiler.add("sprites", time.perf_counter() - start)
+        
+        return dirty
     
-    def draw_hud(self, screen: pygame.Surface):
-        # Draw score and lives at the top
-        font = pygame.font.SysFont(None, 36)
-        score_text = font.render(f"Score: {self.pacman.score}", True, WHITE)
-        lives_text = font.render(f"Lives: {self.pacman.lives}", True, WHITE)
-        level_text = font.render(f"Level: {self.level_num}", True, WHITE)
+    def draw_hud(self, screen: pygame.Surface) -> List[pygame.Rect]:
+        # Only strips whose values changed since the last frame are redrawn
+        dirty = []
+        power_width = 200
         
-        screen.blit(score_text, (20, 10))
-        screen.blit(level_text, (SCREEN_WIDTH // 2 - level_text.get_width() // 2, 10))
-        screen.blit(lives_text, (SCREEN_WIDTH - lives_text.get_width() - 20, 10))
+        hud_values = (self.pacman.score, self.pacman.lives, self.level_num)
+        if hud_values != self.hud_values:
+            self.hud_values = hud_values
+            top = pygame.Rect(0, 0, screen.get_width(), HUD_HEIGHT)
+            screen.blit(self.background, top, top)
+            
+            # Draw score and lives at the top
+            font = get_font(36)
+            score_text = text_cache.render(font, f"Score: {self.pacman.score}", WHITE)
+            lives_text = text_cache.render(font, f"Lives: {self.pacman.lives}", WHITE)
+            level_text = text_cache.render(font, f"Level: {self.level_num}", WHITE)
+            
+            screen.blit(score_text, (20, 10))
+            screen.blit(level_text, (SCREEN_WIDTH // 2 - level_text.get_width() // 2, 10))
+            screen.blit(lives_text, (SCREEN_WIDTH - lives_text.get_width() - 20, 10))
+            dirty.append(top)
         
-        # Draw power pellet timer if active
+        timer_width = -1
         if self.pacman.power_pellet_active:
-            power_width = 200
-            power_height = 10
-            power_x = SCREEN_WIDTH // 2 - power_width // 2
-            power_y = SCREEN_HEIGHT - 30
+            timer_width = int(power_width * (self.pacman.power_pellet_timer / (10 * FPS)))
             
-            # Background
-            pygame.draw.rect(screen, GRAY, (power_x, power_y, power_width, power_height))
+        if timer_width != self.power_bar_width:
+            self.power_bar_width = timer_width
+            maze_bottom = self.height * GRID_SIZE + HUD_HEIGHT
+            bottom = pygame.Rect(0, maze_bottom, screen.get_width(), max(0, screen.get_height() - maze_bottom))
+            screen.blit(self.background, bottom, bottom)
             
-            # Timer bar
-            timer_width = int(power_width * (self.pacman.power_pellet_timer / (10 * FPS)))
-            pygame.draw.rect(screen, CYAN, (power_x, power_y, timer_width, power_height))
+            # Draw power pellet timer if active
+            if self.pacman.power_pellet_active:
+                power_height = 10
+                power_x = SCREEN_WIDTH // 2 - power_width // 2
+                power_y = SCREEN_HEIGHT - 30
+                
+                # Background
+                pygame.draw.rect(screen, GRAY, (power_x, power_y, power_width, power_height))
+                
+                # Timer bar
+                pygame.draw.rect(screen, CYAN, (power_x, power_y, timer_width, power_height))
+            dirty.append(bottom)
+            
+        return dirty
 
-class Game:
+class RandomAgent:
+    # Wanders the maze: picks a new open direction every so often
+    def __init__(self, seed: Optional[int] = None, turn_every: int = FPS // 2):
+        self.rng = random.Random(seed)
+        self.turn_every = turn_every
+        
+    def __call__(self, level: Level) -> Optional[Direction]:
+        pacman = level.pacman
+        blocked = pacman.will_collide(level, pacman.direction)
+        if not blocked and level.ticks % self.turn_every:
+            return None
+        options = [d for d in (Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT)
+                   if not pacman.will_collide(level, d)]
+        return self.rng.choice(options) if options else None
+
+class CellModel:
+    # Level.update's rules at the grain tree search needs. One step is the
+    # step_ticks Pac-Man takes to cross a cell; ghosts, at half that speed,
+    # cover half a cell. A state is a small tuple of ints (pellets eaten
+    # since the search began are a bitmask), so a step is a few dozen
+    # lookups rather than step_ticks full updates. Actors are snapped to the
+    # nearest cell, ghosts to the nearest half cell, when a state is taken
+    # from a level, so it forecasts the level rather than copying it. Being
+    # caught ends a forecast.
+    #
+    # State: (Pac-Man cell, direction, power timer, pellets left, eaten
+    # mask, ghosts), each ghost (cell, half way out of it, direction, state,
+    # frightened timer, scatter timer, chase timer, in house).
+    PLAYING, COMPLETE, CAUGHT = range(3)
+    CHASE, SCATTER, FRIGHTENED, EATEN = (state.value for state in GhostState)
+    
+    def __init__(self, level: Level, rng: random.Random):
+        self.level = level
+        self.rng = rng
+        width, height = level.width, level.height
+        self.width = width
+        self.height = height
+        self.step_ticks = round(1 / (level.pacman.speed * MOVE_STEP))
+        # Cell reached moving from each cell in each DIRECTIONS index, -1
+        # where blocked; rows wrap and NONE stays put, as in Pacman.update
+        self.moves = moves = array('i', [-1]) * (width * height * 5)
+        grid = level.grid
+        for y in range(height):
+            for x in range(width):
+                cell = y * width + x
+                moves[cell * 5 + 4] = cell
+                for d, direction in enumerate(DIRECTIONS[:4]):
+                    dx, dy = direction.value
+                    if 0 <= y + dy < height and not grid.is_blocked(x + dx, y + dy):
+                        moves[cell * 5 + d] = (y + dy) * width + (x + dx) % width
+        # (direction, cell reached) a ghost in each cell heading each way
+        # may take next, as Ghost.get_possible_directions
+        opposite = [DIRECTION_INDEX[d] for d in (
+            Direction.DOWN, Direction.UP, Direction.RIGHT, Direction.LEFT, Direction.LEFT)]
+        self.turns = []
+        for cell in range(width * height):
+            for heading in range(5):
+                back = opposite[heading]
+                self.turns.append(tuple((d, moves[cell * 5 + d]) for d in range(4)
+                                        if d != back and moves[cell * 5 + d] >= 0) or
+                                  ((back, moves[cell * 5 + back]),))
+        self.vectors = [d.value for d in DIRECTIONS]
+        exit_cell = level.house_exit
+        self.exit = exit_cell[1] * width + exit_cell[0] if exit_cell is not None else -1
+        self.ghosts = [(ghost.start_y * width + ghost.start_x, ghost.personality,
+                        min(max(ghost.scatter_target[1], 0), height - 1) * width +
+                        min(max(ghost.scatter_target[0], 0), width - 1)) for ghost in level.ghosts]
+        self.fields: Dict[int, array] = {}
+        self.live = level.pellets.live
+        
+    def field(self, target: int) -> array:
+        # The level's distance fields, held here so lookups skip its LRU
+        field = self.fields.get(target)
+        if field is None:
+            field = self.fields[target] = self.level.distance_fields.field(target % self.width,
+                                                                           target // self.width)
+        return field
+    
+    def state(self, level: Level) -> tuple:
+        width, height = level.width, level.height
+        self.live = level.pellets.live
+        pacman = level.pacman
+        pac = (min(max(math.floor(pacman.y + 0.5), 0), height - 1) * width +
+               math.floor(pacman.x + 0.5) % width)
+        ghosts = []
+        for ghost in level.ghosts:
+            dx, dy = ghost.direction.value
+            hx, hy = round(ghost.x * 2), round(ghost.y * 2)
+            half = bool(hx % 2 or hy % 2)
+            x = (hx - dx) // 2 if hx % 2 else hx // 2
+            y = (hy - dy) // 2 if hy % 2 else hy // 2
+            ghosts.append((min(max(y, 0), height - 1) * width + x % width, half, DIRECTION_INDEX[ghost.direction],
+                           ghost.state.value, ghost.frightened_timer, ghost.scatter_timer, ghost.chase_timer,
+                           ghost.in_house))
+        power = pacman.power_pellet_timer if pacman.power_pellet_active else 0
+        return (pac, DIRECTION_INDEX[pacman.direction], power, level.pellets.remaining, 0, tuple(ghosts))
+    
+    def options(self, state: tuple) -> List[int]:
+        # Directions Pac-Man can head in from the state's cell
+        base = state[0] * 5
+        moves = self.moves
+        return [d for d in range(4) if moves[base + d] >= 0]
+    
+    def advance(self, state: tuple, direction: int) -> Tuple[tuple, int, int]:
+        # One step with Pac-Man steering `direction`; returns the new state,
+        # points scored and PLAYING, COMPLETE or CAUGHT
+        pac, pdir, power, remaining, eaten, ghosts = state
+        moves = self.moves
+        ticks = self.step_ticks
+        CHASE, SCATTER, FRIGHTENED, EATEN = self.CHASE, self.SCATTER, self.FRIGHTENED, self.EATEN
+        points = 0
+        
+        # Pac-Man: power timer, turn, move, eat
+        frighten = False
+        if power:
+            power = max(power - ticks, 0)
+            if not power:
+                ghosts = tuple(ghost if ghost[3] == EATEN else ghost[:3] + (CHASE,) + ghost[4:]
+                               for ghost in ghosts)
+        if direction != pdir and moves[pac * 5 + direction] >= 0:
+            pdir = direction
+        if moves[pac * 5 + pdir] >= 0:
+            pac = moves[pac * 5 + pdir]
+        kind = self.live[pac]
+        if kind and not eaten >> pac & 1:
+            eaten |= 1 << pac
+            remaining -= 1
+            if kind == PELLET_POWER:
+                points += 50
+                power = 10 * FPS
+                frighten = True
+            else:
+                points += 10
+                
+        # Ghosts, as Ghost.update: timers, then a decision at cell centres
+        width, height = self.width, self.height
+        pac_x, pac_y = pac % width, pac // width
+        pac_dx, pac_dy = self.vectors[pdir]
+        exit_cell = self.exit
+        result = self.PLAYING
+        moved = []
+        for i, (cell, half, gdir, gstate, fright, scatter, chase, in_house) in enumerate(ghosts):
+            if frighten and gstate != EATEN:
+                gstate = FRIGHTENED
+                fright = 10 * FPS
+            elif gstate == FRIGHTENED:
+                fright -= ticks
+                if fright <= 0:
+                    gstate = CHASE
+            if gstate == SCATTER:
+                scatter -= ticks
+                if scatter <= 0:
+                    gstate = CHASE
+                    chase = 20 * FPS
+            elif gstate == CHASE:
+                chase -= ticks
+                if chase <= 0:
+                    gstate = SCATTER
+                    scatter = 7 * FPS
+                    
+            if half:
+                # Finish crossing into the next cell
+                if moves[cell * 5 + gdir] >= 0:
+                    cell = moves[cell * 5 + gdir]
+                half = False
+            else:
+                start, personality, corner = self.ghosts[i]
+                if in_house and (exit_cell < 0 or cell == exit_cell):
+                    in_house = False
+                if gstate == EATEN and cell == start:
+                    gstate = CHASE
+                    in_house = True
+                turns = self.turns[cell * 5 + gdir]
+                if gstate == FRIGHTENED:
+                    gdir = turns[int(self.rng.random() * len(turns))][0]
+                elif len(turns) == 1:
+                    gdir = turns[0][0]
+                else:
+                    if gstate == EATEN:
+                        target = start
+                    elif in_house and exit_cell >= 0:
+                        target = exit_cell
+                    elif gstate == SCATTER or personality == 3 and \
+                            (cell % width - pac_x) ** 2 + (cell // width - pac_y) ** 2 <= 64:
+                        target = corner
+                    else:
+                        # Ghost.get_target's chase rules
+                        if personality == 1:
+                            x, y = pac_x + 4 * pac_dx, pac_y + 4 * pac_dy
+                        elif personality == 2:
+                            leader = moved[0][0] if moved else cell
+                            x = 2 * (pac_x + 2 * pac_dx) - leader % width
+                            y = 2 * (pac_y + 2 * pac_dy) - leader // width
+                        else:
+                            x, y = pac_x, pac_y
+                        target = min(max(y, 0), height - 1) * width + min(max(x, 0), width - 1)
+                    field = self.fields.get(target) or self.field(target)
+                    best = None
+                    for d, next_cell in turns:
+                        distance = field[next_cell]
+                        if distance < 0:
+                            distance = len(field)
+                        if best is None or distance < best:
+                            best = distance
+                            gdir = d
+                half = True
+                
+            # Within GHOST_COLLISION_DISTANCE: in Pac-Man's cell, or half
+            # way into it
+            if gstate != EATEN and (cell == pac or (half and moves[cell * 5 + gdir] == pac)):
+                if gstate == FRIGHTENED:
+                    gstate = EATEN
+                    points += 200
+                else:
+                    result = self.CAUGHT
+            moved.append((cell, half, gdir, gstate, fright, scatter, chase, in_house))
+            
+        if result == self.PLAYING and not remaining:
+            result = self.COMPLETE
+        return (pac, pdir, power, remaining, eaten, tuple(moved)), points, result
+
+class MCTSNode:
+    __slots__ = ("state", "parent", "action", "reward", "terminal", "untried", "children", "visits", "value")
+    
+    def __init__(self, state: tuple, parent: Optional['MCTSNode'], action: Optional[int],
+                 reward: float, terminal: bool, untried: List[int]):
+        self.state = state
+        self.parent = parent
+        self.action = action  # DIRECTIONS index
+        self.reward = reward  # Gained on the edge into this node
+        self.terminal = terminal
+        self.untried = untried
+        self.children: List['MCTSNode'] = []
+        self.visits = 0
+        self.value = 0.0  # Sum of returns from this node's edge onwards
+
+class MCTSAgent:
+    # Monte Carlo tree search autopilot (UCT). Searches run on a CellModel of
+    # the level rather than the level itself: an edge is one model step, a
+    # cell of Pac-Man movement, and every node keeps the model state it
+    # reached, so expanding one is a single step from its parent's state.
+    # The real level is never touched.
+    LIFE_PENALTY = 500
+    COMPLETE_BONUS = 1000
+    REWARD_SCALE = 100.0  # Rewards are divided by this before the UCB term
+    
+    def __init__(self, iterations: int = 64, rollout_steps: int = 2, exploration: float = 1.4,
+                 decide_every: int = 5, seed: Optional[int] = None):
+        self.iterations = iterations
+        self.rollout_steps = rollout_steps
+        self.exploration = exploration
+        self.decide_every = decide_every
+        self.rng = random.Random(seed)
+        self.model: Optional[CellModel] = None
+        self.nodes = 0
+        self.search_time = 0.0
+        
+    def __call__(self, level: Level) -> Optional[Direction]:
+        pacman = level.pacman
+        if level.ticks % self.decide_every and not pacman.will_collide(level, pacman.direction):
+            return None
+        if self.model is None or self.model.level is not level:
+            self.model = CellModel(level, self.rng)
+            
+        start = time.perf_counter()
+        model = self.model
+        state = model.state(level)
+        root = MCTSNode(state, None, None, 0.0, False, model.options(state))
+        draw = self.rng.random
+        
+        for _ in range(self.iterations):
+            node = root
+            while not node.untried and node.children:
+                node = self.select(node)
+                
+            ret = 0.0
+            if node.untried:
+                action = node.untried.pop(int(draw() * len(node.untried)))
+                state, reward, terminal = self.advance(node.state, action)
+                child = MCTSNode(state, node, action, reward, terminal, [] if terminal else model.options(state))
+                node.children.append(child)
+                node = child
+                self.nodes += 1
+                if not terminal:
+                    ret = self.rollout(state)
+                    
+            while node is not None:
+                ret += node.reward
+                node.visits += 1
+                node.value += ret
+                node = node.parent
+                
+        self.search_time += time.perf_counter() - start
+        if not root.children:
+            return None
+        return DIRECTIONS[max(root.children, key=lambda child: child.visits).action]
+    
+    def select(self, node: MCTSNode) -> MCTSNode:
+        # Child with the highest UCB1 score; ties go to the first
+        log_visits = math.log(node.visits)
+        scale = self.REWARD_SCALE
+        c = self.exploration
+        best = None
+        best_score = 0.0
+        for child in node.children:
+            score = child.value / child.visits / scale + c * math.sqrt(log_visits / child.visits)
+            if best is None or score > best_score:
+                best = child
+                best_score = score
+        return best
+    
+    def advance(self, state: tuple, direction: int) -> Tuple[tuple, float, bool]:
+        # One model step; returns (state, reward, episode over)
+        state, reward, result = self.model.advance(state, direction)
+        if result == CellModel.CAUGHT:
+            reward -= self.LIFE_PENALTY
+        elif result == CellModel.COMPLETE:
+            reward += self.COMPLETE_BONUS
+        return state, reward, result != CellModel.PLAYING
+    
+    def rollout(self, state: tuple) -> float:
+        total = 0.0
+        choice = self.rng.choice
+        for _ in range(self.rollout_steps):
+            options = self.model.options(state)
+            if not options:
+                break
+            state, reward, terminal = self.advance(state, choice(options))
+            total += reward
+            if terminal:
+                break
+        return total
+
+class SimulationResult:
+    def __init__(self, result: str, ticks: int, score: int, lives: int, elapsed: float,
+                 lives_lost: int = 0, ghosts_eaten: int = 0):
+        self.result = result
+        self.ticks = ticks
+        self.score = score
+        self.lives = lives
+        self.elapsed = elapsed
+        self.lives_lost = lives_lost
+        self.ghosts_eaten = ghosts_eaten
+        
+    @property
+    def ticks_per_second(self) -> float:
+        return self.ticks / self.elapsed if self.elapsed > 0 else float("inf")
+    
+    def __str__(self) -> str:
+        return (f"{self.result}: {self.ticks} ticks, score {self.score}, lives {self.lives}, "
+                f"{self.ticks_per_second:.0f} ticks/s")
+
+def simulate(level_num: int = 1, seed: Optional[int] = None,
+             directions: Optional[List[Tuple[int, Direction]]] = None,
+             agent: Optional[Callable[[Level], Optional[Direction]]] = None,
+             max_ticks: int = 5 * 60 * FPS,
+             width: int = GRID_WIDTH, height: int = GRID_HEIGHT,
+             layout: Optional[MazeLayout] = None, events: Optional[EventLog] = None) -> SimulationResult:
+    # Steps a Level as fast as possible with no window, audio or rendering.
+    # `directions` is a script of (tick, direction) changes, `agent` is asked
+    # for a direction before every tick; either may be combined with the other.
+    level = Level(level_num, width, height, seed=seed, layout=layout)
+    level.events = events
+    start_lives = level.pacman.lives
+    script = sorted(directions or [], key=lambda change: change[0])
+    next_change = 0
+    result = "PLAYING"
+    
+    start = time.perf_counter()
+    while level.ticks < max_ticks:
+        while next_change < len(script) and script[next_change][0] <= level.ticks:
+            level.pacman.next_direction = script[next_change][1]
+            next_change += 1
+        if agent is not None:
+            direction = agent(level)
+            if direction is not None:
+                level.pacman.next_direction = direction
+                
+        result = level.update()
+        if result != "PLAYING":
+            break
+    elapsed = time.perf_counter() - start
+    
+    return SimulationResult(result, level.ticks, level.pacman.score, level.pacman.lives, elapsed,
+                            lives_lost=start_lives - level.pacman.lives,
+                            ghosts_eaten=level.ghosts_eaten)
+
+# A maze for rollout workers: a maze file path, or the (seed, difficulty,
+# width, height) key of a generated maze
+RolloutMaze = Union[str, Tuple[int, int, int, int]]
+
+_rollout_mazes: Dict[Tuple[int, int, int, int], MazeLayout] = {}
+
+def play_rollout(task: Tuple[int, int, int, Optional[RolloutMaze]]) -> SimulationResult:
+    # Worker entry point for RolloutRunner; module level so it pickles.
+    # Maze files are mapped and generated mazes built once per worker.
+    seed, level_num, max_ticks, maze = task
+    if isinstance(maze, tuple):
+        layout = _rollout_mazes.get(maze)
+        if layout is None:
+            layout = _rollout_mazes[maze] = generate_maze(*maze)
+    else:
+        layout = load_maze(maze) if maze else None
+    return simulate(level_num, seed=seed, agent=RandomAgent(seed), max_ticks=max_ticks, layout=layout)
+
+class RolloutReport:
+    def __init__(self, results: List[SimulationResult], elapsed: float, workers: int):
+        self.results = results
+        self.elapsed = elapsed
+        self.workers = workers
+        
+    @property
+    def games_per_second(self) -> float:
+        return len(self.results) / self.elapsed if self.elapsed > 0 else float("inf")
+    
+    def __str__(self) -> str:
+        games = len(self.results)
+        if not games:
+            return "No games played"
+        scores = [r.score for r in self.results]
+        completed = [r.ticks for r in self.results if r.result == "LEVEL_COMPLETE"]
+        completion = f", mean {sum(completed) / len(completed):.0f} ticks to clear" if completed else ""
+        return (
+            f"{games} games on {self.workers} worker(s) in {self.elapsed:.2f}s "
+            f"({self.games_per_second:.1f} games/s)\n"
+            f"Score: mean {sum(scores) / games:.0f}, min {min(scores)}, max {max(scores)}\n"
+            f"Lives lost: mean {sum(r.lives_lost for r in self.results) / games:.2f}\n"
+            f"Ghosts eaten: {sum(r.ghosts_eaten for r in self.results)} total\n"
+            f"Levels cleared: {len(completed)}/{games}{completion}"
+        )
+
+class RolloutRunner:
+    # Shards seeded headless games across a process pool that is kept alive
+    # between runs, so repeated evaluations don't pay worker start-up again
+    def __init__(self, workers: Optional[int] = None):
+        from concurrent.futures import ProcessPoolExecutor  # Pulls in multiprocessing
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        
+    def run(self, games: int, seed: int = 0, level_num: int = 1,
+            max_ticks: int = 5 * 60 * FPS, maze: Optional[RolloutMaze] = None) -> RolloutReport:
+        tasks = [(seed + i, level_num, max_ticks, maze) for i in range(games)]
+        chunksize = max(1, games // (self.workers * 4))
+        start = time.perf_counter()
+        results = list(self.pool.map(play_rollout, tasks, chunksize=chunksize))
+        return RolloutReport(results, time.perf_counter() - start, self.workers)
+    
+    def close(self):
+        self.pool.shutdown()
+        
+    def __enter__(self) -> 'RolloutRunner':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+def measure_scaling(games: int, seed: int, max_ticks: int, max_workers: Optional[int] = None,
+                    maze: Optional[RolloutMaze] = None):
+    # Games per second for 1, 2, 4, ... workers up to max_workers
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(max_workers)
+    
+    baseline = None
+    for workers in counts:
+        with RolloutRunner(workers) as runner:
+            runner.run(workers, seed, max_ticks=FPS, maze=maze)  # Warm the pool up
+            report = runner.run(games, seed, max_ticks=max_ticks, maze=maze)
+        baseline = baseline or report.games_per_second
+        speedup = report.games_per_second / baseline
+        print(f"{workers:3d} worker(s): {report.games_per_second:8.1f} games/s, "
+              f"speedup {speedup:.2f}x, efficiency {speedup / workers:.0%}")
+
+SCORE_DB_PATH = os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share"),
+                             "pac-pro", "scores.db")
+SCORE_BATCH = 10000  # Buffered runs written per transaction
+SCORE_CACHE_KIB = 64 * 1024  # SQLite page cache; index inserts land on random pages
+LEADERBOARD_SIZE = 5  # Entries shown on the menu
+
+class ScoreEntry:
+    def __init__(self, score: int, level_num: int, seed: int, ticks: int, result: str, source: str,
+                 created: float, maze: str = ""):
+        self.score = score
+        self.level_num = level_num
+        self.seed = seed
+        self.ticks = ticks
+        self.result = result
+        self.source = source
+        self.created = created
+        self.maze = maze  # MazeLayout.digest(), or "" for the built-in maze
+        
+    def __str__(self) -> str:
+        return (f"{self.score:>7}  level {self.level_num:<3} seed {self.seed:<10} {self.result.lower():<14} "
+                f"{self.source} {time.strftime('%Y-%m-%d %H:%M', time.localtime(self.created))}"
+                f"{f'  maze {self.maze}' if self.maze else ''}")
+
+class ScoreStore:
+    # Run history in SQLite. Rows are only ever appended; add() buffers and
+    # flush() writes a batch in one transaction. (score), (level, maze,
+    # score) and (seed, maze, score) indexes make every top-K query a walk
+    # down one index, so they stay in the milliseconds at millions of rows.
+    # Per-level and per-seed boards only compare runs on the same maze. The
+    # menu's leaderboard is cached and only re-read after a flush that
+    # could change it.
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, score INTEGER NOT NULL, "
+        "level INTEGER NOT NULL, seed INTEGER NOT NULL, ticks INTEGER NOT NULL, result TEXT NOT NULL, "
+        "source TEXT NOT NULL, created REAL NOT NULL, maze TEXT NOT NULL DEFAULT '')",
+    )
+    # Stores from before the maze column: every run was on the built-in maze
+    MIGRATION = (
+        "ALTER TABLE runs ADD COLUMN maze TEXT NOT NULL DEFAULT ''",
+        "DROP INDEX IF EXISTS runs_level_score",
+        "DROP INDEX IF EXISTS runs_seed_score",
+    )
+    INDEXES = (
+        "CREATE INDEX IF NOT EXISTS runs_score ON runs (score DESC)",
+        "CREATE INDEX IF NOT EXISTS runs_level_maze_score ON runs (level, maze, score DESC)",
+        "CREATE INDEX IF NOT EXISTS runs_seed_maze_score ON runs (seed, maze, score DESC)",
+    )
+    COLUMNS = "score, level, seed, ticks, result, source, created, maze"
+    
+    def __init__(self, path: str = SCORE_DB_PATH, batch: int = SCORE_BATCH):
+        self.path = path
+        self.batch = batch
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        import sqlite3
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(f"PRAGMA cache_size=-{SCORE_CACHE_KIB}")
+        with self.db:
+            for statement in self.SCHEMA:
+                self.db.execute(statement)
+            if "maze" not in [row[1] for row in self.db.execute("PRAGMA table_info(runs)")]:
+                for statement in self.MIGRATION:
+                    self.db.execute(statement)
+            for statement in self.INDEXES:
+                self.db.execute(statement)
+        self.pending: List[Tuple[int, int, int, int, str, str, float, str]] = []
+        self.board: Optional[List[ScoreEntry]] = None
+        
+    def add(self, score: int, level_num: int, seed: int, ticks: int, result: str, source: str = "game",
+            maze: str = ""):
+        self.pending.append((score, level_num, seed, ticks, result, source, time.time(), maze))
+        if len(self.pending) >= self.batch:
+            self.flush()
+            
+    def add_result(self, result: SimulationResult, seed: int, level_num: int = 1, source: str = "headless",
+                   maze: str = ""):
+        self.add(result.score, level_num, seed, result.ticks, result.result, source, maze)
+        
+    def flush(self):
+        if not self.pending:
+            return
+        with self.db:
+            self.db.executemany(f"INSERT INTO runs ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self.pending)
+        board = self.board
+        if board is not None and (len(board) < LEADERBOARD_SIZE or
+                                  max(run[0] for run in self.pending) > board[-1].score):
+            self.board = None
+        self.pending = []
+        
+    def top(self, k: int = 10, level_num: Optional[int] = None, seed: Optional[int] = None,
+            maze: str = "") -> List[ScoreEntry]:
+        # Ties go to the earlier run; rowid order is also the index order,
+        # so the sort is never done separately. `maze` only narrows the
+        # per-level and per-seed boards.
+        self.flush()
+        sql, params = self.top_query(k, level_num, seed, maze)
+        return [ScoreEntry(*row) for row in self.db.execute(sql, params)]
+    
+    def top_query(self, k: int, level_num: Optional[int], seed: Optional[int],
+                  maze: str = "") -> Tuple[str, tuple]:
+        where, params = "", ()
+        if level_num is not None:
+            where, params = "WHERE level = ? AND maze = ? ", (level_num, maze)
+        elif seed is not None:
+            where, params = "WHERE seed = ? AND maze = ? ", (seed, maze)
+        return f"SELECT {self.COLUMNS} FROM runs {where}ORDER BY score DESC, id LIMIT ?", params + (k,)
+    
+    def leaderboard(self) -> List[ScoreEntry]:
+        if self.board is None:
+            self.board = self.top(LEADERBOARD_SIZE)
+        return self.board
+    
+    def count(self) -> int:
+        self.flush()
+        return self.db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+    
+    def close(self):
+        self.flush()
+        self.db.close()
+        
+    def __enter__(self) -> 'ScoreStore':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+def run_score_benchmark(rows: int, seed: int) -> bool:
+    # Fills a scratch store with `rows` random runs, then times top-10
+    # queries and checks SQLite answers each from an index, without a scan
+    # or a separate sort
+    import tempfile
+    ok = True
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        with ScoreStore(os.path.join(directory, "scores.db")) as store:
+            start = time.perf_counter()
+            for i in range(rows):
+                store.add(rng.randrange(20000), rng.randrange(1, 51), rng.randrange(rows // 10 + 1),
+                          rng.randrange(18000), "GAME_OVER", "bench")
+            store.flush()
+            elapsed = time.perf_counter() - start
+            print(f"{rows} runs inserted in {elapsed:.2f}s ({rows / elapsed:.0f} runs/s)")
+            
+            for name, level_num, query_seed in (("overall", None, None), ("per level", 7, None),
+                                                 ("per seed", None, 42)):
+                sql, params = store.top_query(10, level_num, query_seed)
+                plan = " / ".join(row[-1] for row in store.db.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+                if "INDEX" not in plan or "TEMP B-TREE" in plan:
+                    print(f"{name}: not answered from an index ({plan})")
+                    ok = False
+                count = 200
+                start = time.perf_counter()
+                for _ in range(count):
+                    store.top(10, level_num, query_seed)
+                print(f"top 10 {name}: {(time.perf_counter() - start) / count * 1e3:.3f}ms ({plan})")
+                
+            store.leaderboard()
+            count = 10000
+            start = time.perf_counter()
+            for _ in range(count):
+                store.leaderboard()
+            print(f"menu leaderboard (cached): {(time.perf_counter() - start) / count * 1e6:.2f}us")
+    return ok
+
+class Replay:
+    # An RNG seed, the maze, and a tick-stamped log of Pac-Man direction
+    # changes; with those, Level.update reproduces a session exactly. Stored
+    # as a small fixed header followed by packed (tick, direction) entries.
+    # The maze is recorded as where it came from plus its digest, so a
+    # replay on the wrong maze is refused rather than silently diverging.
+    MAGIC = b"PPRP"
+    VERSION = 2
+    # magic, version, seed, level, width, height, end tick, count, maze kind, maze digest
+    HEADER = struct.Struct("<4sHQHHHIIB8s")
+    HEADER_V1 = struct.Struct("<4sHQHHHII")  # Before the maze was recorded
+    ENTRY = struct.Struct("<IB")  # tick, DIRECTION_INDEX
+    MAZE_BUILTIN, MAZE_FILE, MAZE_GENERATED = range(3)
+    
+    def __init__(self, seed: int, level_num: int = 1, width: int = GRID_WIDTH, height: int = GRID_HEIGHT,
+                 maze_kind: int = MAZE_BUILTIN, maze_digest: Optional[str] = ""):
+        self.seed = seed
+        self.level_num = level_num
+        self.width = width
+        self.height = height
+        self.maze_kind = maze_kind
+        # MazeLayout.digest() of the maze, "" for the built-in one, None if
+        # the replay predates recording it
+        self.maze_digest = maze_digest
+        self.end_tick = 0
+        self.changes: List[Tuple[int, Direction]] = []
+        
+    def record(self, tick: int, direction: Direction):
+        self.changes.append((tick, direction))
+        self.end_tick = max(self.end_tick, tick)
+        
+    def to_bytes(self) -> bytes:
+        parts = [self.HEADER.pack(self.MAGIC, self.VERSION, self.seed, self.level_num, self.width,
+                                  self.height, self.end_tick, len(self.changes), self.maze_kind,
+                                  bytes.fromhex(self.maze_digest or "").ljust(8, b"\0"))]
+        parts.extend(self.ENTRY.pack(tick, DIRECTION_INDEX[direction]) for tick, direction in self.changes)
+        return b"".join(parts)
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Replay':
+        magic, version = data[:4], int.from_bytes(data[4:6], "little")
+        if magic != cls.MAGIC or version not in (1, cls.VERSION):
+            raise ValueError("Not a Pac Pro replay (or an unsupported version)")
+        header = cls.HEADER_V1 if version == 1 else cls.HEADER
+        if len(data) < header.size or (len(data) - header.size) % cls.ENTRY.size:
+            raise ValueError("Replay is truncated")
+        if version == 1:
+            _, _, seed, level_num, width, height, end_tick, count = header.unpack_from(data)
+            replay = cls(seed, level_num, width, height, maze_digest=None)
+        else:
+            _, _, seed, level_num, width, height, end_tick, count, kind, digest = header.unpack_from(data)
+            replay = cls(seed, level_num, width, height, kind, "" if kind == cls.MAZE_BUILTIN else digest.hex())
+        try:
+            replay.changes = [(tick, DIRECTIONS[index])
+                              for tick, index in cls.ENTRY.iter_unpack(data[header.size:])]
+        except IndexError:
+            raise ValueError("Replay has an unknown direction") from None
+        if len(replay.changes) != count:
+            raise ValueError("Replay is truncated")
+        replay.end_tick = end_tick
+        return replay
+    
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+            
+    @classmethod
+    def load(cls, path: str) -> 'Replay':
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+class ReplayRecorder:
+    # Hooked into Game: logs direction changes for the level being played and
+    # writes one replay file per level, as <path>-level<N><ext>
+    def __init__(self, path: str):
+        self.path = path
+        self.replay: Optional[Replay] = None
+        
+    def start(self, level: Level, seed: int, maze_kind: int = Replay.MAZE_BUILTIN):
+        layout = level.layout
+        self.replay = Replay(seed, level.level_num, level.width, level.height, maze_kind,
+                             layout.digest() if layout is not None else "")
+        
+    def record(self, level: Level, direction: Direction):
+        if self.replay is not None and direction != level.pacman.next_direction:
+            self.replay.record(level.ticks, direction)
+            
+    def finish(self, level: Level) -> Optional[str]:
+        if self.replay is None:
+            return None
+        self.replay.end_tick = level.ticks
+        root, ext = os.path.splitext(self.path)
+        path = f"{root}-level{self.replay.level_num}{ext or '.pprp'}"
+        self.replay.save(path)
+        self.replay = None
+        return path
+
+def replay_layout(replay: Replay, layout: Optional[MazeLayout] = None) -> Optional[MazeLayout]:
+    # The maze to replay on. `layout` is the one given on the command line,
+    # if any; generated mazes are rebuilt from the replay's seed otherwise.
+    # Raises ValueError when it isn't the maze the replay was recorded on.
+    if replay.maze_kind == Replay.MAZE_GENERATED and layout is None:
+        layout = generate_maze(replay.seed, maze_difficulty(replay.level_num), replay.width, replay.height)
+    if replay.maze_digest is None:
+        return layout  # Recorded before mazes were; nothing to check
+    digest = layout.digest() if layout is not None else ""
+    if digest != replay.maze_digest:
+        if replay.maze_kind == Replay.MAZE_BUILTIN:
+            raise ValueError("replay was recorded on the built-in maze; don't pass --maze or --generated")
+        if layout is None:
+            raise ValueError(f"replay was recorded on maze file {replay.maze_digest}; pass it with --maze")
+        raise ValueError(f"replay was recorded on maze {replay.maze_digest}, not {digest}")
+    return layout
+
+def play_replay(replay: Replay, checkpoints: Tuple[int, ...] = (),
+                snapshot_dir: Optional[str] = None, layout: Optional[MazeLayout] = None) -> Level:
+    # Re-runs a replay at full speed. Nothing is rendered except at the
+    # checkpoint ticks, where the state is printed and, with snapshot_dir,
+    # the frame is saved as a PNG.
+    level = Level(replay.level_num, replay.width, replay.height, seed=replay.seed, layout=layout)
+    changes = replay.changes
+    next_change = 0
+    pending = sorted(set(checkpoints))
+    surface = None
+    
+    while level.ticks < replay.end_tick:
+        while next_change < len(changes) and changes[next_change][0] <= level.ticks:
+            level.pacman.next_direction = changes[next_change][1]
+            next_change += 1
+        if level.update() != "PLAYING":
+            break
+        
+        while pending and pending[0] <= level.ticks:
+            pending.pop(0)
+            print(f"Tick {level.ticks}: {level_state(level)}")
+            if snapshot_dir is not None:
+                if surface is None:
+                    pygame.font.init()
+                    surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+                level.invalidate()
+                level.draw(surface)
+                pygame.image.save(surface, os.path.join(snapshot_dir, f"tick-{level.ticks:07d}.png"))
+                
+    return level
+
+class BatchSimulator:
+    # Steps N independent games on the same maze at once, with all per-game
+    # state held in NumPy arrays. The rules mirror Pacman.update, Ghost.update
+    # and Level.update exactly; check_batch_equivalence() holds it to that.
+    PLAYING = 0
+    LEVEL_COMPLETE = 1
+    GAME_OVER = 2
+    
+    def __init__(self, num_games: int, level_num: int = 1, width: int = GRID_WIDTH,
+                 height: int = GRID_HEIGHT, seed: Optional[int] = None,
+                 layout: Optional[MazeLayout] = None):
+        if load_numpy() is None:
+            raise RuntimeError("BatchSimulator requires NumPy")
+            
+        template = Level(level_num, width, height, layout=layout)
+        width, height = template.width, template.height
+        n = num_games
+        g = len(template.ghosts)
+        self.num_games = n
+        self.num_ghosts = g
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+        self.last_draws = np.zeros((n, g))
+        
+        # Shared, read-only maze data
+        cells = np.frombuffer(bytes(template.grid.cells), dtype=np.uint8)
+        self.walls = cells.reshape(height, width) == CELL_WALL
+        self.dx = np.array([d.value[0] for d in DIRECTIONS], dtype=np.float64)
+        self.dy = np.array([d.value[1] for d in DIRECTIONS], dtype=np.float64)
+        # Ghost.get_opposite_direction falls back to LEFT for NONE
+        self.opposite = np.array([DIRECTION_INDEX[d] for d in (
+            Direction.DOWN, Direction.UP, Direction.RIGHT, Direction.LEFT, Direction.LEFT)])
+        self.games = np.arange(n)
+        
+        # Pellet bitmap: 0 none or eaten, 1 pellet, 2 power pellet
+        pellets = np.frombuffer(template.pellets.kinds, dtype=np.int8).reshape(height, width)
+        self.pellets = np.repeat(pellets[None], n, axis=0)
+        self.remaining = np.full(n, len(template.pellets), dtype=np.int64)
+        
+        pacman = template.pacman
+        self.pacman_speed = pacman.speed
+        self.px = np.full(n, float(pacman.x))
+        self.py = np.full(n, float(pacman.y))
+        self.pdir = np.full(n, DIRECTION_INDEX[pacman.direction], dtype=np.int64)
+        self.pnext = np.full(n, DIRECTION_INDEX[pacman.next_direction], dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lives = np.full(n, pacman.lives, dtype=np.int64)
+        self.power_active = np.zeros(n, dtype=bool)
+        self.power_timer = np.zeros(n, dtype=np.int64)
+        
+        ghosts = template.ghosts
+        self.ghost_speed = [ghost.speed for ghost in ghosts]
+        self.start_x = np.array([float(ghost.start_x) for ghost in ghosts])
+        self.start_y = np.array([float(ghost.start_y) for ghost in ghosts])
+        self.gx = np.tile(self.start_x, (n, 1))
+        self.gy = np.tile(self.start_y, (n, 1))
+        self.gdir = np.tile([DIRECTION_INDEX[ghost.direction] for ghost in ghosts], (n, 1))
+        self.gstate = np.tile([ghost.state.value for ghost in ghosts], (n, 1))
+        self.frightened_timer = np.tile([ghost.frightened_timer for ghost in ghosts], (n, 1))
+        self.scatter_timer = np.tile([ghost.scatter_timer for ghost in ghosts], (n, 1))
+        self.chase_timer = np.tile([ghost.chase_timer for ghost in ghosts], (n, 1))
+        self.in_house = np.ones((n, g), dtype=bool)
+        self.personality = [ghost.personality for ghost in ghosts]
+        self.scatter_targets = [ghost.scatter_target for ghost in ghosts]
+        self.house_exit = template.house_exit
+        self.pacman_spawn = template.pacman_spawn
+        
+        # Distance rows for recently used target cells, copied from the
+        # level's BFS fields and held in a fixed set of slots under the same
+        # budget as DistanceFields; the least recently used slot is reused.
+        # It only grows if one step needs more distinct targets than that.
+        cell_count = width * height
+        slots = template.distance_fields.max_fields
+        self.distance_fields = template.distance_fields
+        self.distance_rows = np.full((slots, cell_count), -1, dtype=np.int32)
+        self.slot_target = np.full(slots, -1, dtype=np.int64)
+        self.slot_used = np.zeros(slots, dtype=np.int64)
+        self.target_slot = np.full(cell_count, -1, dtype=np.int64)
+        self.slot_clock = 0
+        
+        self.ticks = np.zeros(n, dtype=np.int64)
+        self.result = np.full(n, self.PLAYING, dtype=np.int8)
+        
+    def blocked(self, x, y, direction):
+        # Vector form of OccupancyGrid.is_blocked(int(x + dx), int(y + dy))
+        nx = (x + self.dx[direction]).astype(np.int64)  # Truncates like int()
+        ny = (y + self.dy[direction]).astype(np.int64)
+        inside = (nx >= 0) & (nx < self.width) & (ny >= 0) & (ny < self.height)
+        cells = self.walls[np.clip(ny, 0, self.height - 1), np.clip(nx, 0, self.width - 1)]
+        return inside & cells
+    
+    def step(self, directions=None):
+        # `directions` holds a DIRECTION_INDEX per game, or -1 for no change
+        live = self.result == self.PLAYING
+        if directions is not None:
+            change = live & (directions >= 0)
+            self.pnext[change] = directions[change]
+            
+        self.ticks[live] += 1
+        self.update_pacman(live)
+        
+        self.last_draws = self.rng.random((self.num_games, self.num_ghosts))
+        for i in range(self.num_ghosts):
+            self.update_ghost(i, live)
+            self.check_ghost_collision(i, live)
+            
+        complete = live & (self.remaining == 0)
+        self.result[complete] = self.LEVEL_COMPLETE
+        
+    def update_pacman(self, live):
+        # Handle power pellet timer
+        active = live & self.power_active
+        self.power_timer[active] -= 1
+        expired = active & (self.power_timer <= 0)
+        self.power_active[expired] = False
+        self.gstate[expired[:, None] & (self.gstate != GhostState.EATEN.value)] = GhostState.CHASE.value
+        
+        # Try to change direction, then move
+        turn = live & (self.pdir != self.pnext) & ~self.blocked(self.px, self.py, self.pnext)
+        self.pdir[turn] = self.pnext[turn]
+        
+        move = live & ~self.blocked(self.px, self.py, self.pdir)
+        self.px[move] += self.dx[self.pdir[move]] * self.pacman_speed * MOVE_STEP
+        self.py[move] += self.dy[self.pdir[move]] * self.pacman_speed * MOVE_STEP
+        self.px[move & (self.px < 0)] = self.width - 1
+        self.px[move & (self.px >= self.width)] = 0
+        
+        # Pellet in the nearest cell, as in Pacman.check_pellet_collision
+        cx = np.floor(self.px + 0.5).astype(np.int64)
+        cy = np.floor(self.py + 0.5).astype(np.int64)
+        inside = (cx >= 0) & (cx < self.width) & (cy >= 0) & (cy < self.height)
+        cx = np.clip(cx, 0, self.width - 1)
+        cy = np.clip(cy, 0, self.height - 1)
+        kind = np.where(inside, self.pellets[self.games, cy, cx], 0)
+        eat = live & (kind > 0) & (np.hypot(self.px - cx, self.py - cy) < 0.5)
+        
+        self.pellets[self.games[eat], cy[eat], cx[eat]] = 0
+        self.remaining[eat] -= 1
+        power = eat & (kind == 2)
+        self.score[eat & ~power] += 10
+        self.score[power] += 50
+        
+        # Activate power pellet
+        self.power_active[power] = True
+        self.power_timer[power] = 10 * FPS
+        scared = power[:, None] & (self.gstate != GhostState.EATEN.value)
+        self.gstate[scared] = GhostState.FRIGHTENED.value
+        self.frightened_timer[scared] = 10 * FPS
+        
+    def update_ghost(self, i: int, live):
+        state = self.gstate[:, i]
+        frightened = live & (state == GhostState.FRIGHTENED.value)
+        self.frightened_timer[frightened, i] -= 1
+        state[frightened & (self.frightened_timer[:, i] <= 0)] = GhostState.CHASE.value
+        
+        scatter = live & (state == GhostState.SCATTER.value)
+        self.scatter_timer[scatter, i] -= 1
+        ended = scatter & (self.scatter_timer[:, i] <= 0)
+        state[ended] = GhostState.CHASE.value
+        self.chase_timer[ended, i] = 20 * FPS
+        
+        chase = live & ~scatter & (state == GhostState.CHASE.value)
+        self.chase_timer[chase, i] -= 1
+        ended = chase & (self.chase_timer[:, i] <= 0)
+        state[ended] = GhostState.SCATTER.value
+        self.scatter_timer[ended, i] = 7 * FPS
+        
+        # Ghosts only turn at cell centres
+        x = self.gx[:, i]
+        y = self.gy[:, i]
+        direction = self.gdir[:, i]
+        in_house = self.in_house[:, i]
+        cell_x = np.round(x)
+        cell_y = np.round(y)
+        decide = live & (np.abs(x - cell_x) < 1e-6) & (np.abs(y - cell_y) < 1e-6)
+        x[decide] = cell_x[decide]
+        y[decide] = cell_y[decide]
+        cell_x = cell_x.astype(np.int64)
+        cell_y = cell_y.astype(np.int64)
+        
+        # Ghost.update_house_state
+        if self.house_exit is None:
+            in_house[decide] = False
+        else:
+            in_house[decide & (cell_x == self.house_exit[0]) & (cell_y == self.house_exit[1])] = False
+        home = decide & (state == GhostState.EATEN.value) & \
+               (cell_x == self.start_x[i]) & (cell_y == self.start_y[i])
+        state[home] = GhostState.CHASE.value
+        in_house[home] = True
+        
+        # Legal directions that aren't a reversal, in DIRECTIONS order
+        opposite = self.opposite[direction]
+        allowed = np.empty((self.num_games, 4), dtype=bool)
+        for d in range(4):
+            allowed[:, d] = (opposite != d) & ~self.blocked(x, y, d)
+        count = allowed.sum(axis=1)
+        
+        # Frightened ghosts pick at random
+        pick = (self.last_draws[:, i] * count).astype(np.int64)
+        rank = np.cumsum(allowed, axis=1) - 1
+        random_choice = np.argmax(allowed & (rank == pick[:, None]), axis=1)
+        
+        # Everyone else steps to the neighbour nearest their target
+        target_x, target_y = self.ghost_targets(i, state, in_house)
+        target = target_y * self.width + target_x
+        # Only deciding ghosts read their row; the rest borrow slot 0
+        slot = np.zeros(self.num_games, dtype=np.int64)
+        slot[decide] = self.load_distances(target[decide])
+        unreachable = self.width * self.height
+        best = np.full(self.num_games, unreachable + 1)
+        targeted_choice = np.zeros(self.num_games, dtype=np.int64)
+        for d in range(4):
+            next_x = (cell_x + int(self.dx[d])) % self.width
+            next_y = cell_y + int(self.dy[d])
+            inside = (next_y >= 0) & (next_y < self.height)
+            distance = self.distance_rows[slot, np.clip(next_y, 0, self.height - 1) * self.width + next_x]
+            distance = np.where(inside & (distance >= 0), distance, unreachable)
+            better = allowed[:, d] & (distance < best)
+            best = np.where(better, distance, best)
+            targeted_choice = np.where(better, d, targeted_choice)
+            
+        choice = np.where(state == GhostState.FRIGHTENED.value, random_choice, targeted_choice)
+        choice = np.where(count > 0, choice, opposite)
+        direction[decide] = choice[decide]
+        
+        x[live] += self.dx[direction[live]] * self.ghost_speed[i] * MOVE_STEP
+        y[live] += self.dy[direction[live]] * self.ghost_speed[i] * MOVE_STEP
+        x[live & (x < 0)] = self.width - 1
+        x[live & (x >= self.width)] = 0
+        
+    def ghost_targets(self, i: int, state, in_house):
+        # Vector form of Ghost.get_target
+        pac_x = np.floor(self.px + 0.5).astype(np.int64)
+        pac_y = np.floor(self.py + 0.5).astype(np.int64)
+        dx = self.dx[self.pdir].astype(np.int64)
+        dy = self.dy[self.pdir].astype(np.int64)
+        personality = self.personality[i]
+        scatter_x, scatter_y = self.scatter_targets[i]
+        
+        if personality == 1:
+            x, y = pac_x + 4 * dx, pac_y + 4 * dy
+        elif personality == 2:
+            x = 2 * (pac_x + 2 * dx) - np.floor(self.gx[:, 0] + 0.5).astype(np.int64)
+            y = 2 * (pac_y + 2 * dy) - np.floor(self.gy[:, 0] + 0.5).astype(np.int64)
+        elif personality == 3:
+            ghost_x = np.floor(self.gx[:, i] + 0.5).astype(np.int64)
+            ghost_y = np.floor(self.gy[:, i] + 0.5).astype(np.int64)
+            far = (ghost_x - pac_x) ** 2 + (ghost_y - pac_y) ** 2 > 64
+            x = np.where(far, pac_x, scatter_x)
+            y = np.where(far, pac_y, scatter_y)
+        else:
+            x, y = pac_x, pac_y
+        x = np.clip(x, 0, self.width - 1)
+        y = np.clip(y, 0, self.height - 1)
+        
+        # Later rules take priority, as in the if-chain of get_target
+        scatter = state == GhostState.SCATTER.value
+        x = np.where(scatter, scatter_x, x)
+        y = np.where(scatter, scatter_y, y)
+        if self.house_exit is not None:
+            x = np.where(in_house, self.house_exit[0], x)
+            y = np.where(in_house, self.house_exit[1], y)
+        eaten = state == GhostState.EATEN.value
+        x = np.where(eaten, int(self.start_x[i]), x)
+        y = np.where(eaten, int(self.start_y[i]), y)
+        return x, y
+    
+    def load_distances(self, targets):
+        # Slot holding each target's distance row, loading missing rows into
+        # the least recently used slots
+        self.slot_clock += 1
+        unique = np.unique(targets)
+        if len(unique) > len(self.slot_target):
+            self.grow_slots(len(unique))
+        cached = self.target_slot[unique]
+        self.slot_used[cached[cached >= 0]] = self.slot_clock
+        missing = unique[cached < 0]
+        if len(missing):
+            free = np.argsort(self.slot_used, kind="stable")[:len(missing)]
+            evicted = self.slot_target[free]
+            self.target_slot[evicted[evicted >= 0]] = -1
+            for slot, target in zip(free, missing):
+                field = self.distance_fields.field(int(target) % self.width, int(target) // self.width)
+                self.distance_rows[slot] = np.frombuffer(field, dtype=np.intc)
+            self.slot_target[free] = missing
+            self.target_slot[missing] = free
+            self.slot_used[free] = self.slot_clock
+        return self.target_slot[targets]
+    
+    def grow_slots(self, slots: int):
+        extra = slots - len(self.slot_target)
+        self.distance_rows = np.concatenate(
+            [self.distance_rows, np.full((extra, self.distance_rows.shape[1]), -1, dtype=np.int32)])
+        self.slot_target = np.concatenate([self.slot_target, np.full(extra, -1, dtype=np.int64)])
+        self.slot_used = np.concatenate([self.slot_used, np.zeros(extra, dtype=np.int64)])
+        
+    def check_ghost_collision(self, i: int, live):
+        state = self.gstate[:, i]
+        hit = live & (state != GhostState.EATEN.value) & \
+              (np.hypot(self.gx[:, i] - self.px, self.gy[:, i] - self.py) < 0.8)
+        
+        # Eat ghost
+        eaten = hit & (state == GhostState.FRIGHTENED.value)
+        state[eaten] = GhostState.EATEN.value
+        self.score[eaten] += 200
+        
+        # Lose a life
+        caught = hit & ~eaten
+        self.lives[caught] -= 1
+        over = caught & (self.lives <= 0)
+        self.result[over] = self.GAME_OVER
+        live &= ~over  # Later ghosts don't move in a game that just ended
+        
+        # Reset positions
+        reset = caught & ~over
+        self.px[reset] = self.pacman_spawn[0]
+        self.py[reset] = self.pacman_spawn[1]
+        self.pdir[reset] = DIRECTION_INDEX[Direction.RIGHT]
+        self.pnext[reset] = DIRECTION_INDEX[Direction.RIGHT]
+        self.gx[reset] = self.start_x
+        self.gy[reset] = self.start_y
+        self.gstate[reset] = GhostState.SCATTER.value
+        self.in_house[reset] = True
+        
+    def game_state(self, i: int) -> tuple:
+        # Same shape as level_state(), for comparing against a scalar Level
+        ghosts = tuple((float(self.gx[i, j]), float(self.gy[i, j]), DIRECTIONS[self.gdir[i, j]],
+                        GhostState(int(self.gstate[i, j])))
+                       for j in range(self.num_ghosts))
+        return (int(self.ticks[i]), float(self.px[i]), float(self.py[i]), DIRECTIONS[self.pdir[i]],
+                int(self.score[i]), int(self.lives[i]), int(self.remaining[i]), ghosts)
+
+def level_state(level: Level) -> tuple:
+    pacman = level.pacman
+    ghosts = tuple((ghost.x, ghost.y, ghost.direction, ghost.state) for ghost in level.ghosts)
+    return (level.ticks, pacman.x, pacman.y, pacman.direction, pacman.score, pacman.lives,
+            level.pellets.remaining, ghosts)
+
+class ScriptedRandom:
+    # Stands in for Level.rng and hands out draws queued from elsewhere
     def __init__(self):
+        self.values = deque()
+        
+    def random(self) -> float:
+        return self.values.popleft()
+
+def check_batch_equivalence(num_games: int = 16, ticks: int = 3000, seed: int = 0,
+                            layout: Optional[MazeLayout] = None) -> bool:
+    # Runs scalar Levels alongside a BatchSimulator on the same inputs and
+    # random draws, comparing full game state after every tick
+    batch = BatchSimulator(num_games, seed=seed, layout=layout)
+    levels = [Level(layout=layout) for _ in range(num_games)]
+    streams = [ScriptedRandom() for _ in range(num_games)]
+    for level, stream in zip(levels, streams):
+        level.rng = stream
+    results = ["PLAYING"] * num_games
+    inputs = np.random.default_rng(seed + 1)
+    
+    for tick in range(ticks):
+        turns = np.where(inputs.random(num_games) < 0.05, inputs.integers(0, 4, num_games), -1)
+        batch.step(turns)
+        
+        for i, level in enumerate(levels):
+            if results[i] != "PLAYING":
+                continue
+            if turns[i] >= 0:
+                level.pacman.next_direction = DIRECTIONS[turns[i]]
+            streams[i].values.extend(batch.last_draws[i].tolist())
+            results[i] = level.update()
+            streams[i].values.clear()
+            
+            if level_state(level) != batch.game_state(i) or \
+               results[i] != ("PLAYING", "LEVEL_COMPLETE", "GAME_OVER")[batch.result[i]]:
+                print(f"Game {i} diverged at tick {tick + 1}:")
+                print(f"  scalar: {results[i]} {level_state(level)}")
+                print(f"  batch:  {batch.game_state(i)}")
+                return False
+                
+    return True
+
+# Observation layout for PacProEnv.state
+ENV_STATE_FIELDS = ("pacman_x", "pacman_y", "direction", "lives", "score", "power_timer", "ticks", "pellets_left")
+
+class PacProEnv:
+    # reset/step environment around a Level for training agents. Actions
+    # index DIRECTIONS (NONE keeps the current heading) and the reward is
+    # the score gained. Observations are a dict of NumPy arrays:
+    #   walls    (height, width) uint8 CELL_* kinds, a view of the level grid
+    #   pellets  (height, width) uint8 PELLET_* kinds left, a view of the pellet store
+    #   ghosts   (height, width) uint8 GhostState value + 1 where a ghost is, else 0
+    #   state    (len(ENV_STATE_FIELDS),) float32
+    # Nothing is copied: the arrays are views that change as the level
+    # plays, so copy them to keep an old observation. New arrays are only
+    # made on reset, when the level is replaced.
+    ACTIONS = DIRECTIONS
+    
+    def __init__(self, level_num: int = 1, width: int = GRID_WIDTH, height: int = GRID_HEIGHT,
+                 num_ghosts: int = 4, layout: Optional[MazeLayout] = None, frame_skip: int = 1,
+                 max_ticks: int = 5 * 60 * FPS, seed: Optional[int] = None,
+                 ghosts_buffer=None, state_buffer=None):
+        if load_numpy() is None:
+            raise RuntimeError("PacProEnv requires NumPy")
+        self.level_num = level_num
+        self.width = layout.width if layout is not None else width
+        self.height = layout.height if layout is not None else height
+        self.num_ghosts = num_ghosts
+        self.layout = layout
+        self.frame_skip = frame_skip
+        self.max_ticks = max_ticks
+        self.seeds = random.Random(seed)
+        self.level: Optional[Level] = None
+        self.result = "PLAYING"
+        # VectorEnv passes rows of its batch arrays so these need no copying either
+        self.ghosts = np.zeros((self.height, self.width), dtype=np.uint8) if ghosts_buffer is None else ghosts_buffer
+        self.state = np.zeros(len(ENV_STATE_FIELDS), dtype=np.float32) if state_buffer is None else state_buffer
+        self.observation: Dict[str, object] = {}
+        
+    def reset(self, seed: Optional[int] = None) -> Tuple[Dict[str, object], dict]:
+        if seed is None:
+            seed = self.seeds.randrange(2 ** 32)
+        self.level = Level(self.level_num, self.width, self.height, seed=seed,
+                           num_ghosts=self.num_ghosts, layout=self.layout)
+        self.result = "PLAYING"
+        shape = (self.height, self.width)
+        self.observation = {
+            "walls": np.frombuffer(self.level.grid.cells, dtype=np.uint8).reshape(shape),
+            "pellets": np.frombuffer(self.level.pellets.live, dtype=np.uint8).reshape(shape),
+            "ghosts": self.ghosts,
+            "state": self.state
+        }
+        self.observe()
+        return self.observation, self.info()
+    
+    def step(self, action: int) -> Tuple[Dict[str, object], float, bool, bool, dict]:
+        # Returns (observation, reward, terminated, truncated, info)
+        level = self.level
+        pacman = level.pacman
+        direction = self.ACTIONS[action]
+        if direction != Direction.NONE:
+            pacman.next_direction = direction
+            
+        score = pacman.score
+        for _ in range(self.frame_skip):
+            self.result = level.update()
+            if self.result != "PLAYING":
+                break
+        self.observe()
+        terminated = self.result != "PLAYING"
+        truncated = not terminated and level.ticks >= self.max_ticks
+        return self.observation, float(pacman.score - score), terminated, truncated, self.info()
+    
+    def observe(self):
+        level = self.level
+        pacman = level.pacman
+        ghosts = self.ghosts
+        ghosts.fill(0)
+        width, height = self.width, self.height
+        for ghost in level.ghosts:
+            y = math.floor(ghost.y + 0.5)
+            if 0 <= y < height:
+                ghosts[y, math.floor(ghost.x + 0.5) % width] = ghost.state.value + 1
+        self.state[:] = (pacman.x, pacman.y, DIRECTION_INDEX[pacman.direction], pacman.lives, pacman.score,
+                         pacman.power_pellet_timer, level.ticks, level.pellets.remaining)
+        
+    def info(self) -> dict:
+        pacman = self.level.pacman
+        return {"result": self.result, "ticks": self.level.ticks, "score": pacman.score, "lives": pacman.lives}
+
+class VectorEnv:
+    # Steps K PacProEnvs per call and resets each one as soon as its episode
+    # ends. Observations are batched arrays with a leading K axis. Ghost
+    # and state rows are the sub-environments' own buffers, so they are
+    # written in place. Pellets are copied in, one row per env. Walls are
+    # the same for every env, so they are a broadcast view of env 0's grid.
+    # Rewards, terminated and truncated flags are reused arrays too.
+    def __init__(self, num_envs: int, seed: Optional[int] = None, **kwargs):
+        if load_numpy() is None:
+            raise RuntimeError("VectorEnv requires NumPy")
+        seeds = random.Random(seed)
+        first = PacProEnv(seed=seeds.randrange(2 ** 32), **kwargs)
+        shape = (num_envs, first.height, first.width)
+        self.num_envs = num_envs
+        self.ghosts = np.zeros(shape, dtype=np.uint8)
+        self.pellets = np.zeros(shape, dtype=np.uint8)
+        self.state = np.zeros((num_envs, len(ENV_STATE_FIELDS)), dtype=np.float32)
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.terminated = np.zeros(num_envs, dtype=bool)
+        self.truncated = np.zeros(num_envs, dtype=bool)
+        self.envs = [PacProEnv(seed=seeds.randrange(2 ** 32), ghosts_buffer=self.ghosts[i],
+                               state_buffer=self.state[i], **kwargs)
+                     for i in range(num_envs)]
+        self.observation: Dict[str, object] = {}
+        
+    def reset(self) -> Tuple[Dict[str, object], List[dict]]:
+        infos = []
+        for i, env in enumerate(self.envs):
+            obs, info = env.reset()
+            self.pellets[i] = obs["pellets"]
+            infos.append(info)
+        self.observation = {
+            "walls": np.broadcast_to(self.envs[0].observation["walls"], self.pellets.shape),
+            "pellets": self.pellets,
+            "ghosts": self.ghosts,
+            "state": self.state
+        }
+        return self.observation, infos
+    
+    def step(self, actions) -> Tuple[Dict[str, object], object, object, object, List[dict]]:
+        # Finished episodes report their final info with "final": True and
+        # the env's row already holds the first observation of the next one
+        infos = []
+        for i, env in enumerate(self.envs):
+            obs, reward, terminated, truncated, info = env.step(int(actions[i]))
+            self.rewards[i] = reward
+            self.terminated[i] = terminated
+            self.truncated[i] = truncated
+            if terminated or truncated:
+                info["final"] = True
+                obs, _ = env.reset()
+            self.pellets[i] = obs["pellets"]
+            infos.append(info)
+        return self.observation, self.rewards, self.terminated, self.truncated, infos
+
+def run_env_benchmark(num_envs: int, steps: int, seed: int, layout: Optional[MazeLayout] = None):
+    # Random actions through VectorEnv, reporting environment steps per second
+    env = VectorEnv(num_envs, seed=seed, layout=layout)
+    env.reset()
+    actions = np.random.default_rng(seed)
+    episodes = 0
+    total = 0.0
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, rewards, terminated, truncated, _ = env.step(actions.integers(0, len(PacProEnv.ACTIONS), num_envs))
+        episodes += int(terminated.sum() + truncated.sum())
+        total += float(rewards.sum())
+    elapsed = time.perf_counter() - start
+    print(f"{num_envs} envs x {steps} steps in {elapsed:.2f}s ({num_envs * steps / elapsed:.0f} steps/s), "
+          f"{episodes} episodes finished, total reward {total:.0f}")
+
+class FrameCapture:
+    # Offscreen render target for pixel observations. Level.draw renders
+    # into a surface that shares memory with a preallocated buffer, and the
+    # optional downscale and grayscale passes write into buffers of their
+    # own through pygame's dest_surface arguments, so a capture allocates
+    # no pixel memory per frame. Those passes only redo the regions
+    # Level.draw reports as changed. capture() returns a (height, width, 3) uint8 RGB
+    # view, or (height, width) with grayscale, of the final buffer. The
+    # view is overwritten by the next capture. Without NumPy it returns
+    # the raw RGBX bytes as a memoryview.
+    def __init__(self, width: int = GRID_WIDTH, height: int = GRID_HEIGHT, scale: int = 1,
+                 grayscale: bool = False, smooth: bool = True):
+        if not pygame.font.get_init():
+            pygame.font.init()  # For the HUD
+        self.size = (width * GRID_SIZE, height * GRID_SIZE + 2 * HUD_HEIGHT)
+        self.scale = scale
+        self.grayscale = grayscale
+        self.smooth = smooth
+        self.frame, self.frame_buffer = self.new_target(self.size)
+        self.output, self.output_buffer = self.frame, self.frame_buffer
+        
+        self.scaled = None
+        if scale > 1:
+            self.scaled_size = (self.size[0] // scale, self.size[1] // scale)
+            self.scaled, self.scaled_buffer = self.new_target(self.scaled_size)
+            self.output, self.output_buffer = self.scaled, self.scaled_buffer
+        self.gray = None
+        if grayscale:
+            self.gray, self.gray_buffer = self.new_target(self.output.get_size())
+            self.output, self.output_buffer = self.gray, self.gray_buffer
+            
+        width, height = self.output.get_size()
+        if load_numpy() is not None:
+            pixels = np.frombuffer(self.output_buffer, dtype=np.uint8).reshape(height, width, 4)
+            # All three channels are equal after grayscale, so any one will do
+            self.view = pixels[:, :, 0] if grayscale else pixels[:, :, :3]
+        else:
+            self.view = memoryview(self.output_buffer)
+            
+    @staticmethod
+    def new_target(size: Tuple[int, int]) -> Tuple[pygame.Surface, bytearray]:
+        buffer = bytearray(size[0] * size[1] * 4)
+        return pygame.image.frombuffer(buffer, size, "RGBX"), buffer
+    
+    def capture(self, level: Level):
+        dirty = level.draw(self.frame)
+        if self.output is self.frame:
+            return self.view
+        
+        bounds = self.frame.get_rect()
+        scale = self.scale
+        for rect in dirty:
+            # Widen to whole scale blocks so each output pixel is rebuilt
+            # from its complete source block
+            rect = rect.clip(bounds)
+            left, top = rect.left // scale * scale, rect.top // scale * scale
+            right = min(-(-rect.right // scale) * scale, self.scaled_size[0] * scale if self.scaled else bounds.width)
+            bottom = min(-(-rect.bottom // scale) * scale, self.scaled_size[1] * scale if self.scaled else bounds.height)
+            if right <= left or bottom <= top:
+                continue
+            
+            source = self.frame.subsurface((left, top, right - left, bottom - top))
+            if self.scaled is not None:
+                target = pygame.Rect(left // scale, top // scale, (right - left) // scale, (bottom - top) // scale)
+                scaled = self.scaled.subsurface(target)
+                if self.smooth:
+                    pygame.transform.smoothscale(source, target.size, scaled)
+                else:
+                    pygame.transform.scale(source, target.size, scaled)
+                source = scaled
+            if self.gray is not None:
+                pygame.transform.grayscale(source, self.gray.subsurface(source.get_abs_offset(), source.get_size()))
+        return self.view
+    
+    def buffer(self) -> memoryview:
+        # The final frame as raw RGBX bytes, for consumers of the buffer protocol
+        return memoryview(self.output_buffer)
+
+def run_capture_benchmark(frames: int, scale: int, grayscale: bool, seed: int,
+                          layout: Optional[MazeLayout] = None):
+    # Steps one environment with random actions and captures every frame
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    env = PacProEnv(layout=layout, seed=seed)
+    env.reset()
+    capture = FrameCapture(env.width, env.height, scale, grayscale)
+    actions = random.Random(seed)
+    pixels = capture.capture(env.level)
+    start = time.perf_counter()
+    for _ in range(frames):
+        _, _, terminated, truncated, _ = env.step(actions.randrange(len(PacProEnv.ACTIONS)))
+        if terminated or truncated:
+            env.reset()
+        pixels = capture.capture(env.level)
+    elapsed = time.perf_counter() - start
+    shape = getattr(pixels, "shape", (len(pixels),))
+    print(f"{frames} frames of {'x'.join(map(str, shape))} in {elapsed:.2f}s ({frames / elapsed:.0f} frames/s)")
+
+def run_mcts_demo(iterations: int, games: int, seed: int, max_ticks: int,
+                  layout: Optional[MazeLayout] = None):
+    # Plays the MCTS autopilot against the random agent on the same seeds
+    level = Level(seed=seed, layout=layout)
+    state = level.snapshot()
+    count = 2000
+    start = time.perf_counter()
+    for _ in range(count):
+        state = level.snapshot()
+    snap = (time.perf_counter() - start) / count
+    start = time.perf_counter()
+    for _ in range(count):
+        level.restore(state)
+    restore = (time.perf_counter() - start) / count
+    print(f"snapshot {snap * 1e6:.1f}us, restore {restore * 1e6:.1f}us")
+    
+    for i in range(games):
+        game_seed = seed + i
+        agent = MCTSAgent(iterations, seed=game_seed)
+        result = simulate(seed=game_seed, agent=agent, max_ticks=max_ticks, layout=layout)
+        baseline = simulate(seed=game_seed, agent=RandomAgent(game_seed), max_ticks=max_ticks, layout=layout)
+        rate = agent.nodes / agent.search_time if agent.search_time else 0.0
+        print(f"seed {game_seed}: mcts {result}")
+        print(f"{'':>{len(str(game_seed)) + 6}}random {baseline}")
+        print(f"{'':>{len(str(game_seed)) + 6}}{agent.nodes} nodes in {agent.search_time:.2f}s "
+              f"({rate:.0f} nodes/s, {agent.model.step_ticks} ticks/step, "
+              f"{agent.rollout_steps} rollout steps/node)")
+
+class Game:
+    def __init__(self, recorder: Optional[ReplayRecorder] = None, render_fps: int = FPS,
+                 mazes: Optional[List[str]] = None, maze_cache: Optional[MazeCache] = None,
+                 events_dir: Optional[str] = None, scores: Optional[ScoreStore] = None):
+        # Only video is needed up front; fonts start on first use and
+        # there is no sound
+        pygame.display.init()
+        
+        # Levels are seeded from this so a recorded session can be replayed
+        self.seed = random.randrange(2 ** 32)
+        self.recorder = recorder
+        # Custom maze files, played in turn; the built-in maze when empty
+        self.mazes = mazes or []
+        # Or generated mazes, one per level seed. The next level's maze is
+        # always being prefetched, so starting a level never generates.
+        self.maze_cache = maze_cache
+        # One event log per game played, when set
+        self.events_dir = events_dir
+        self.events: Optional[EventLog] = None
+        # Every finished level goes in here; the menu shows the best
+        self.scores = scores
+        
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("Pac Pro - Professional Pac-Man Management")
         self.clock = pygame.time.Clock()
+        self.render_fps = render_fps  # 0 draws as often as possible
+        self.profiler = FrameProfiler()
+        self.profile_path: Optional[str] = None  # Exported on exit when set
         self.running = True
         self.state = GameState.MENU
         self.current_level = 1
         self.level = None
-        self.font = pygame.font.SysFont(None, 48)
-        self.small_font = pygame.font.SysFont(None, 36)
+        self.font = get_font(48)
+        self.small_font = get_font(36)
+        # Built once, blitted under every message
+        self.overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+        self.overlay.fill((0, 0, 0, 180))  # Semi-transparent black
         self.setup_menu()
+        self.prefetch_maze(1)
         
     def setup_menu(self):
         self.state = GameState.MENU
@@ -509,13 +3594,52 @@ class Game:
         
     def setup_game(self):
         self.current_level = 1
-        self.level = Level(self.current_level)
-        self.state = GameState.PLAYING
+        if self.events_dir is not None:
+            self.close_events()
+            path = os.path.join(self.events_dir, time.strftime(f"pac-pro-%Y%m%d-%H%M%S{EVENT_EXTENSION}"))
+            self.events = EventLog(path)
+        self.start_level()
+        
+    def close_events(self):
+        if self.events is not None:
+            self.events.close()
+            print(f"Events written to {self.events.path}")
+            self.events = None
         
     def next_level(self):
         self.current_level += 1
-        self.level = Level(self.current_level)
+        self.start_level()
+        
+    def level_seed(self, level_num: int) -> int:
+        return (self.seed + level_num) % 2 ** 32
+        
+    def prefetch_maze(self, level_num: int):
+        if self.maze_cache is not None and not self.mazes:
+            self.maze_cache.prefetch(self.level_seed(level_num), maze_difficulty(level_num))
+            
+    def start_level(self):
+        seed = self.level_seed(self.current_level)
+        layout = None
+        if self.mazes:
+            layout = load_maze(self.mazes[(self.current_level - 1) % len(self.mazes)])
+        elif self.maze_cache is not None:
+            layout = self.maze_cache.get(seed, maze_difficulty(self.current_level))
+        self.level = Level(self.current_level, seed=seed, layout=layout)
+        self.level.profiler = self.profiler if self.profiler.enabled else None
+        self.level.events = self.events
         self.state = GameState.PLAYING
+        if self.recorder:
+            kind = (Replay.MAZE_FILE if self.mazes else
+                    Replay.MAZE_GENERATED if self.maze_cache is not None else Replay.MAZE_BUILTIN)
+            self.recorder.start(self.level, seed, kind)
+        # Level N + 1 is generated while this one is played
+        self.prefetch_maze(self.current_level + 1)
+            
+    def finish_level(self):
+        if self.recorder and self.level:
+            path = self.recorder.finish(self.level)
+            if path:
+                print(f"Replay saved to {path}")
     
     def handle_events(self):
         for event in pygame.event.get():
@@ -523,7 +3647,9 @@ class Game:
                 self.running = False
                 
             if event.type == pygame.KEYDOWN:
-                if self.state == GameState.MENU:
+                if event.key in (pygame.K_F3, pygame.K_F4):
+                    self.handle_profiler_input(event)
+                elif self.state == GameState.MENU:
                     self.handle_menu_input(event)
                 elif self.state == GameState.PLAYING:
                     self.handle_game_input(event)
@@ -534,6 +3660,23 @@ class Game:
                         else:
                             self.setup_menu()
     
+    def handle_profiler_input(self, event):
+        if event.key == pygame.K_F3:
+            # Toggle profiling together with its on-screen graph
+            self.set_profiling(not self.profiler.enabled)
+            self.profiler.show_overlay = self.profiler.enabled
+            if self.level:
+                self.level.invalidate()
+        elif event.key == pygame.K_F4 and self.profiler.frames:
+            path = time.strftime("pac-pro-profile-%Y%m%d-%H%M%S.csv")
+            self.profiler.export(path)
+            print(f"Profile written to {path}")
+            
+    def set_profiling(self, enabled: bool):
+        self.profiler.enabled = enabled
+        if self.level:
+            self.level.profiler = self.profiler if enabled else None
+    
     def handle_menu_input(self, event):
         if event.key == pygame.K_UP:
             self.selected_item = (self.selected_item - 1) % len(self.menu_items)
@@ -548,14 +3691,17 @@ class Game:
                 self.running = False
     
     def handle_game_input(self, event):
-        if event.key == pygame.K_UP:
-            self.level.pacman.next_direction = Direction.UP
-        elif event.key == pygame.K_DOWN:
-            self.level.pacman.next_direction = Direction.DOWN
-        elif event.key == pygame.K_LEFT:
-            self.level.pacman.next_direction = Direction.LEFT
-        elif event.key == pygame.K_RIGHT:
-            self.level.pacman.next_direction = Direction.RIGHT
+        direction = {
+            pygame.K_UP: Direction.UP,
+            pygame.K_DOWN: Direction.DOWN,
+            pygame.K_LEFT: Direction.LEFT,
+            pygame.K_RIGHT: Direction.RIGHT
+        }.get(event.key)
+        
+        if direction is not None:
+            if self.recorder:
+                self.recorder.record(self.level, direction)
+            self.level.pacman.next_direction = direction
         elif event.key == pygame.K_ESCAPE:
             self.state = GameState.PAUSED
     
@@ -564,14 +3710,36 @@ class Game:
             result = self.level.update()
             if result == "LEVEL_COMPLETE":
                 self.state = GameState.LEVEL_COMPLETE
+                self.finish_level()
+                self.record_score(result)
             elif result == "GAME_OVER":
                 self.state = GameState.GAME_OVER
+                self.finish_level()
+                self.record_score(result)
+                
+    def record_score(self, result: str):
+        if self.scores is not None:
+            layout = self.level.layout
+            self.scores.add(self.level.pacman.score, self.current_level, self.level_seed(self.current_level),
+                            self.level.ticks, result, maze=layout.digest() if layout is not None else "")
+            self.scores.flush()
     
-    def draw(self):
+    def draw(self, alpha: float = 1.0):
+        if self.state == GameState.PLAYING and self.level:
+            # Only push the regions that changed this frame
+            rects = self.level.draw(self.screen, alpha)
+            if self.profiler.show_overlay:
+                rects.append(self.profiler.draw(self.screen))
+                self.level.mark_dirty(rects[-1])
+            self.present(rects)
+            return
+        
+        # Overlays cover the whole screen, so repaint it all underneath
+        if self.level:
+            self.level.invalidate()
+            
         if self.state == GameState.MENU:
             self.draw_menu()
-        elif self.state == GameState.PLAYING and self.level:
-            self.level.draw(self.screen)
         elif self.state == GameState.LEVEL_COMPLETE:
             self.level.draw(self.screen)
             self.draw_message("Level Complete! Press ENTER to continue", GREEN)
@@ -582,16 +3750,29 @@ class Game:
             self.level.draw(self.screen)
             self.draw_message("Paused - Press ESC to resume", WHITE)
             
-        pygame.display.flip()
+        if self.profiler.show_overlay:
+            self.profiler.draw(self.screen)
+        self.present(None)
+        
+    def present(self, rects: Optional[List[pygame.Rect]]):
+        # Push changed regions (or the whole frame) to the display
+        if self.profiler.enabled:
+            start = time.perf_counter()
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+        if self.profiler.enabled:
+            self.profiler.add("present", time.perf_counter() - start)
     
     def draw_menu(self):
         self.screen.fill(BLACK)
-        title = self.font.render("PAC PRO", True, YELLOW)
+        title = text_cache.render(self.font, "PAC PRO", YELLOW)
         self.screen.blit(title, (SCREEN_WIDTH // 2 - title.get_width() // 2, 100))
         
         for i, item in enumerate(self.menu_items):
             color = YELLOW if i == self.selected_item else WHITE
-            text = self.small_font.render(item, True, color)
+            text = text_cache.render(self.small_font, item, color)
             self.screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 250 + i * 50))
         
         # Draw instructions
@@ -603,29 +3784,610 @@ class Game:
         ]
         
         for i, line in enumerate(instructions):
-            text = self.small_font.render(line, True, WHITE)
+            text = text_cache.render(self.small_font, line, WHITE)
             self.screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 450 + i * 30))
+            
+        # High scores, from the store's in-memory leaderboard
+        board = self.scores.leaderboard() if self.scores is not None else []
+        if board:
+            title = text_cache.render(self.small_font, "HIGH SCORES", YELLOW)
+            self.screen.blit(title, (SCREEN_WIDTH // 2 - title.get_width() // 2, 620))
+            for i, entry in enumerate(board):
+                line = f"{i + 1}.  {entry.score:>6}   level {entry.level_num}"
+                text = text_cache.render(self.small_font, line, WHITE)
+                self.screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 660 + i * 30))
     
     def draw_message(self, message, color):
         # Dark overlay
-        s = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        s.fill((0, 0, 0, 180))  # Semi-transparent black
-        self.screen.blit(s, (0, 0))
+        self.screen.blit(self.overlay, (0, 0))
         
         # Message
-        text = self.font.render(message, True, color)
+        text = text_cache.render(self.font, message, color)
         self.screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 
                                SCREEN_HEIGHT // 2 - text.get_height() // 2))
     
     def run(self):
+        # Fixed-timestep loop: real time is accumulated and spent in whole
+        # FPS-rate ticks, so game speed doesn't depend on how fast we draw.
+        # Frames are drawn part way into the next tick and interpolated.
+        step = 1.0 / FPS
+        accumulator = 0.0
+        skipped = 0
+        previous = time.perf_counter()
+        
         while self.running:
+            now = time.perf_counter()
+            accumulator += now - previous
+            previous = now
+            
             self.handle_events()
-            self.update()
-            self.draw()
-            self.clock.tick(FPS)
+            if self.profiler.enabled:
+                self.profiler.add("events", time.perf_counter() - now)
+            updates = 0
+            while accumulator >= step and updates < MAX_UPDATES_PER_FRAME:
+                self.update()
+                accumulator -= step
+                updates += 1
+                
+            if accumulator >= step:
+                if skipped < MAX_FRAME_SKIP:
+                    # Behind: drop this frame and keep simulating
+                    skipped += 1
+                    continue
+                # Too far behind to catch up, let the backlog go
+                accumulator = 0.0
+            skipped = 0
+            
+            self.draw(accumulator / step)
+            if self.profiler.enabled:
+                self.profiler.end_frame()
+            if self.render_fps:
+                self.clock.tick(self.render_fps)
             
+        if self.state in (GameState.PLAYING, GameState.PAUSED):
+            self.finish_level()
+        if self.profile_path and self.profiler.frames:
+            self.profiler.export(self.profile_path)
+            print(f"Profile written to {self.profile_path}")
+        if self.maze_cache is not None:
+            self.maze_cache.close()
+        self.close_events()
+        if self.scores is not None:
+            self.scores.close()
         pygame.quit()
 
-if __name__ == "__main__":
+STARTUP_RUNS = 5
+
+def time_import(path: str, runs: int = STARTUP_RUNS) -> float:
+    # Best of `runs` imports of the module in a fresh interpreter, in seconds.
+    # subprocess and argparse are imported where used to keep import cheap.
+    import subprocess
+    code = ("import importlib.util, sys, time\n"
+            "start = time.perf_counter()\n"
+            "spec = importlib.util.spec_from_file_location('startup_probe', sys.argv[1])\n"
+            "spec.loader.exec_module(importlib.util.module_from_spec(spec))\n"
+            "print(time.perf_counter() - start)\n")
+    return min(float(subprocess.run([sys.executable, "-c", code, path], check=True, capture_output=True,
+                                    text=True).stdout) for _ in range(runs))
+
+def run_startup_time():
+    # Cold import, then what the player waits for: the window and menu, and
+    # the first frame of a level
+    print(f"import: {time_import(os.path.abspath(__file__)) * 1e3:.1f}ms (best of {STARTUP_RUNS})")
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    start = time.perf_counter()
     game = Game()
+    created = time.perf_counter()
+    game.draw()
+    menu = time.perf_counter()
+    game.setup_game()
+    game.draw()
+    level = time.perf_counter()
+    print(f"Game(): {(created - start) * 1e3:.1f}ms, first frame (menu): {(menu - created) * 1e3:.1f}ms, "
+          f"first level frame: {(level - menu) * 1e3:.1f}ms ({pygame.display.get_driver()} video)")
+    pygame.quit()
+
+BENCH_SEED = 1234
+BENCH_SCALES = ((40, 40), (80, 80), (160, 160))
+BENCH_GHOSTS = (4, 16, 64)
+
+def time_per_call(fn: Callable[[], object], min_time: float = 0.2, repeat: int = 3) -> float:
+    # Best of `repeat` runs of at least `min_time` seconds, in seconds per call
+    best = float("inf")
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / calls)
+    return best
+
+def run_benchmarks(scales: Tuple[Tuple[int, int], ...] = BENCH_SCALES,
+                   ghost_counts: Tuple[int, ...] = BENCH_GHOSTS,
+                   min_time: float = 0.2) -> Dict[str, float]:
+    # Seconds per call for the engine hot paths, keyed "<case>/<size>[/<ghosts>g]".
+    # Drawing goes to an offscreen Surface, so no window is needed.
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.font.init()
+    random.seed(BENCH_SEED)
+    results = {}
+    
+    for width, height in scales:
+        size = f"{width}x{height}"
+        results[f"setup_level/{size}"] = time_per_call(
+            lambda: Level(1, width, height, seed=BENCH_SEED), min_time)
+        
+        for ghosts in ghost_counts:
+            level = Level(1, width, height, seed=BENCH_SEED, num_ghosts=ghosts)
+            results[f"update/{size}/{ghosts}g"] = time_per_call(
+                bench_ticker(level, RandomAgent(BENCH_SEED)), min_time)
+            
+        level = Level(1, width, height, seed=BENCH_SEED)
+        pacman = level.pacman
+        ghost = level.ghosts[0]
+        results[f"check_pellet_collision/{size}"] = time_per_call(
+            lambda: pacman.check_pellet_collision(level), min_time)
+        results[f"would_collide/{size}"] = time_per_call(
+            lambda: ghost.would_collide(level, Direction.UP), min_time)
+        
+        surface = pygame.Surface((width * GRID_SIZE, height * GRID_SIZE + 2 * HUD_HEIGHT))
+        level.draw(surface)
+        results[f"draw/{size}"] = time_per_call(lambda: level.draw(surface), min_time)
+        
+        def full_draw():
+            level.invalidate()
+            level.draw(surface)
+        results[f"draw_full/{size}"] = time_per_call(full_draw, min_time)
+        
+    return results
+
+def bench_ticker(level: Level, agent: RandomAgent) -> Callable[[], None]:
+    # A level that has ended starts over from its first tick, so every
+    # timed call is a tick of a game in progress
+    start = level.snapshot()
+    
+    def tick():
+        direction = agent(level)
+        if direction is not None:
+            level.pacman.next_direction = direction
+        if level.update() != "PLAYING":
+            level.restore(start)
+    return tick
+
+def compare_benchmarks(results: Dict[str, float], baseline: Dict[str, float],
+                       threshold: float) -> List[str]:
+    # Prints a comparison table and returns the cases slower than
+    # baseline * (1 + threshold)
+    regressions = []
+    print(f"{'case':40s} {'now (us)':>12s} {'base (us)':>12s} {'ratio':>7s}")
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:40s} {seconds * 1e6:12.2f} {'-':>12s} {'-':>7s}")
+            continue
+        ratio = seconds / base if base > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:40s} {seconds * 1e6:12.2f} {base * 1e6:12.2f} {ratio:7.2f}{flag}")
+    return regressions
+
+def run_bench_suite(quick: bool, save: Optional[str], baseline_path: Optional[str],
+                    threshold: float) -> bool:
+    if quick:
+        results = run_benchmarks(BENCH_SCALES[:1], BENCH_GHOSTS[:2], min_time=0.05)
+    else:
+        results = run_benchmarks()
+        
+    if save:
+        with open(save, "w") as f:
+            json.dump({
+                "version": 1,
+                "seed": BENCH_SEED,
+                "python": platform.python_version(),
+                "pygame": pygame.version.ver,
+                "machine": platform.machine(),
+                "results": results
+            }, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {save}")
+        
+    baseline = {}
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare_benchmarks(results, baseline, threshold)
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed by more than {threshold:.0%}")
+    return not regressions
+
+SWARM_GHOSTS = (16, 64, 256, 1024)
+SWARM_SIZE = (160, 160)
+SWARM_TICKS = 300
+
+def run_swarm(ghost_counts: Tuple[int, ...], seed: int, ticks: int = SWARM_TICKS,
+              layout: Optional[MazeLayout] = None):
+    # Stress scenario: ticks per second against actor count on a large maze.
+    # Pac-Man can't run out of lives, so every run lasts the full length.
+    # Also times an all-pairs ghost proximity query through the spatial
+    # hash against brute force.
+    print(f"{'ghosts':>7s} {'actors':>7s} {'ticks/s':>9s} {'pairs':>7s} {'hashed ms':>10s} {'brute ms':>10s}")
+    for count in ghost_counts:
+        level = Level(1, *SWARM_SIZE, seed=seed, num_ghosts=count, layout=layout)
+        level.pacman.lives = 2 ** 31
+        tick = bench_ticker(level, RandomAgent(seed))
+        start = time.perf_counter()
+        for _ in range(ticks):
+            tick()
+        tps = ticks / (time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        pairs = level.ghost_pairs(1.0)
+        hashed = time.perf_counter() - start
+        ghosts = level.ghosts
+        start = time.perf_counter()
+        brute = sum(1 for i, a in enumerate(ghosts) for b in ghosts[i + 1:]
+                    if math.dist((a.x, a.y), (b.x, b.y)) < 1.0)
+        brute_time = time.perf_counter() - start
+        if brute != pairs:
+            print(f"Spatial hash found {pairs} pairs, brute force {brute}")
+        print(f"{len(ghosts):7d} {len(ghosts) + 1:7d} {tps:9.0f} {pairs:7d} "
+              f"{hashed * 1000:10.2f} {brute_time * 1000:10.2f}")
+
+def run_event_benchmark(games: int, seed: int, max_ticks: int, layout: Optional[MazeLayout] = None,
+                        stream_events: int = 2_000_000) -> bool:
+    # Plays the same games with and without an event log and checks the log
+    # accounts for every point scored, then times a raw stream of
+    # stream_events events through emit() and back through read_events()
+    import tempfile
+    ok = True
+    with tempfile.TemporaryDirectory() as directory:
+        elapsed = {False: 0.0, True: 0.0}
+        ticks = 0
+        logged = 0
+        for i in range(games):
+            for logging in (False, True):
+                path = os.path.join(directory, f"game-{i}{EVENT_EXTENSION}")
+                events = EventLog(path) if logging else None
+                result = simulate(seed=seed + i, agent=RandomAgent(seed + i), max_ticks=max_ticks,
+                                  layout=layout, events=events)
+                elapsed[logging] += result.elapsed
+                if events is None:
+                    ticks += result.ticks
+                    continue
+                events.close()
+                columns = read_events(path)
+                logged += len(columns["tick"])
+                points = sum(value for kind, value in zip(columns["kind"], columns["value"])
+                             if kind in (EVENT_PELLET, EVENT_POWER_PELLET, EVENT_GHOST_EATEN))
+                deaths = sum(1 for kind in columns["kind"] if kind == EVENT_DEATH)
+                if points != result.score or deaths != result.lives_lost:
+                    print(f"game {i}: log has {points} points and {deaths} deaths, "
+                          f"game had {result.score} and {result.lives_lost}")
+                    ok = False
+        print(f"{games} games, {ticks} ticks: {ticks / elapsed[False]:.0f} ticks/s without events, "
+              f"{ticks / elapsed[True]:.0f} ticks/s logging {logged} events")
+        
+        path = os.path.join(directory, f"stream{EVENT_EXTENSION}")
+        start = time.perf_counter()
+        with EventLog(path) as events:
+            for i in range(stream_events):
+                events.emit(i, EVENT_PELLET, 0, i & 63, i & 31, 10)
+        written = time.perf_counter() - start
+        start = time.perf_counter()
+        columns = read_events(path)
+        read = time.perf_counter() - start
+        if len(columns["tick"]) != stream_events or int(columns["tick"][-1]) != stream_events - 1:
+            print("stream read back wrong")
+            ok = False
+        print(f"{stream_events} events: emit+write {written / stream_events * 1e9:.0f}ns/event, "
+              f"read {stream_events / read / 1e6:.1f}M events/s, {os.path.getsize(path) / stream_events:.1f} bytes/event")
+    return ok
+
+def run_headless(games: int, seed: int, max_ticks: int, layout: Optional[MazeLayout] = None,
+                 events_dir: Optional[str] = None, scores: Optional[ScoreStore] = None):
+    maze = layout.digest() if layout is not None else ""
+    total_ticks = 0
+    total_time = 0.0
+    for i in range(games):
+        events = None
+        if events_dir is not None:
+            events = EventLog(os.path.join(events_dir, f"game-{seed + i}{EVENT_EXTENSION}"))
+        result = simulate(seed=seed + i, agent=RandomAgent(seed + i), max_ticks=max_ticks, layout=layout,
+                          events=events)
+        if events is not None:
+            events.close()
+        if scores is not None:
+            scores.add_result(result, seed + i, maze=maze)
+        total_ticks += result.ticks
+        total_time += result.elapsed
+        print(f"Game {i + 1}: {result}")
+    
+    if total_time > 0:
+        print(f"Total: {total_ticks} ticks in {total_time:.2f}s ({total_ticks / total_time:.0f} ticks/s)")
+
+def run_batch(games: int, seed: int, max_ticks: int, layout: Optional[MazeLayout] = None):
+    batch = BatchSimulator(games, seed=seed, layout=layout)
+    inputs = np.random.default_rng(seed + 1)
+    
+    start = time.perf_counter()
+    for _ in range(max_ticks):
+        if not (batch.result == BatchSimulator.PLAYING).any():
+            break
+        batch.step(np.where(inputs.random(games) < 0.05, inputs.integers(0, 4, games), -1))
+    elapsed = time.perf_counter() - start
+    
+    total_ticks = int(batch.ticks.sum())
+    print(f"{games} games, mean score {batch.score.mean():.0f}, "
+          f"{(batch.result == BatchSimulator.GAME_OVER).sum()} game over, "
+          f"{(batch.result == BatchSimulator.LEVEL_COMPLETE).sum()} complete")
+    print(f"Total: {total_ticks} game ticks in {elapsed:.2f}s ({total_ticks / elapsed:.0f} ticks/s)")
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Pac Pro")
+    parser.add_argument("--headless", action="store_true",
+                        help="simulate games without a window and report ticks per second")
+    parser.add_argument("--games", type=int, default=1, help="number of headless games")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the first headless game")
+    parser.add_argument("--ticks", type=int, default=5 * 60 * FPS, help="tick limit per headless game")
+    parser.add_argument("--batch", type=int, metavar="N",
+                        help="step N games at once with the NumPy batch simulator")
+    parser.add_argument("--batch-check", action="store_true",
+                        help="check the batch simulator against scalar Levels and exit")
+    parser.add_argument("--rollouts", type=int, metavar="N",
+                        help="play N seeded headless games on a process pool and summarise them")
+    parser.add_argument("--workers", type=int, help="process pool size (default: CPU count)")
+    parser.add_argument("--scaling", action="store_true",
+                        help="with --rollouts, report throughput for increasing worker counts")
+    parser.add_argument("--bench", action="store_true", help="run the engine benchmark suite and exit")
+    parser.add_argument("--bench-quick", action="store_true", help="with --bench, only the smallest cases")
+    parser.add_argument("--bench-save", metavar="FILE", help="with --bench, write results as a JSON baseline")
+    parser.add_argument("--bench-baseline", metavar="FILE",
+                        help="with --bench, compare against a baseline and fail on regressions")
+    parser.add_argument("--bench-threshold", type=float, default=0.25,
+                        help="allowed slowdown against the baseline before failing (default 0.25)")
+    parser.add_argument("--env", type=int, metavar="K",
+                        help="step K training environments with random actions for --ticks steps and report steps/s")
+    parser.add_argument("--capture", type=int, metavar="FRAMES",
+                        help="play and capture FRAMES offscreen pixel observations and report frames/s")
+    parser.add_argument("--capture-scale", type=int, default=1, metavar="K",
+                        help="with --capture, downscale frames by K")
+    parser.add_argument("--capture-gray", action="store_true", help="with --capture, convert frames to grayscale")
+    parser.add_argument("--mcts", type=int, metavar="ITERATIONS",
+                        help="play --games headless games with the tree search autopilot and compare with random play")
+    parser.add_argument("--swarm", type=int, nargs="*", metavar="GHOSTS",
+                        help="stress test with many ghosts on a large maze and report ticks/s per count "
+                             f"(default {' '.join(map(str, SWARM_GHOSTS))})")
+    parser.add_argument("--serve", type=int, nargs="?", const=NET_PORT, metavar="PORT",
+                        help=f"host multiplayer sessions (default port {NET_PORT})")
+    parser.add_argument("--players", type=int, default=2, metavar="N",
+                        help="with --serve or --net-load, Pac-Men per session (default 2)")
+    parser.add_argument("--connect", metavar="HOST[:PORT]", help="join a session on a --serve server")
+    parser.add_argument("--session", default="default", metavar="NAME",
+                        help="with --connect, the session to join; it starts once every player is in")
+    parser.add_argument("--net-load", type=int, metavar="SESSIONS",
+                        help="play SESSIONS bot sessions against a localhost server and report "
+                             "bandwidth and server CPU")
+    parser.add_argument("--net-seconds", type=float, default=10.0, metavar="S",
+                        help="with --net-load, how long to play (default 10)")
+    parser.add_argument("--maze", action="append", default=[], metavar="FILE",
+                        help="play this maze file instead of the built-in one (repeat to play several in turn)")
+    parser.add_argument("--compile-mazes", nargs="+", metavar="FILE",
+                        help="compile maze files to their binary caches and exit")
+    parser.add_argument("--generated", action="store_true",
+                        help="play procedurally generated mazes, one per level (other modes use the one for --seed)")
+    parser.add_argument("--maze-cache", default=MAZE_CACHE_DIR, metavar="DIR",
+                        help="where generated mazes are cached ('' to keep them in memory only)")
+    parser.add_argument("--maze-check", type=int, metavar="N",
+                        help="generate N seeds at every difficulty, check they are playable and time the cache")
+    parser.add_argument("--export-maze", metavar="FILE", help="write the built-in maze as a maze file and exit")
+    parser.add_argument("--events", metavar="DIR",
+                        help="log game events to DIR, one file per game (the game and --headless)")
+    parser.add_argument("--events-bench", action="store_true",
+                        help="check event logs against --games headless games and time logging and reading")
+    parser.add_argument("--scores", metavar="FILE",
+                        help=f"high score database; the game uses {SCORE_DB_PATH} by default, and "
+                             "--headless and --rollouts runs (but not --scaling) are only recorded when this is given")
+    parser.add_argument("--no-scores", action="store_true", help="don't record or show high scores")
+    parser.add_argument("--top", type=int, metavar="K", help="print the K best recorded runs and exit")
+    parser.add_argument("--top-level", type=int, metavar="N", help="with --top, only runs of level N")
+    parser.add_argument("--top-seed", type=int, metavar="SEED", help="with --top, only runs with this seed")
+    parser.add_argument("--scores-bench", type=int, metavar="ROWS",
+                        help="time top-K queries on a scratch store of ROWS random runs")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="report import time and latency to the first menu and level frames")
+    parser.add_argument("--render-fps", type=int, default=FPS,
+                        help="frames drawn per second, independent of the simulation rate (0 = no cap)")
+    parser.add_argument("--profile", action="store_true",
+                        help="start with the frame profiler and its graph on (toggle with F3, F4 exports CSV)")
+    parser.add_argument("--profile-out", metavar="FILE",
+                        help="write per-frame timings to FILE (.csv or .json) on exit")
+    parser.add_argument("--record", metavar="PATH", help="record each level played to a replay file")
+    parser.add_argument("--replay", metavar="FILE", help="re-run a replay headlessly and exit")
+    parser.add_argument("--checkpoint", type=int, action="append", default=[], metavar="TICK",
+                        help="with --replay, print (and optionally save) the state at TICK")
+    parser.add_argument("--snapshot-dir", metavar="DIR", help="with --replay, save checkpoint frames here")
+    args = parser.parse_args()
+    
+    if args.compile_mazes:
+        for path in args.compile_mazes:
+            try:
+                target = compile_maze(path)
+            except (OSError, ValueError) as e:
+                parser.error(str(e))
+            layout = map_compiled_maze(target)
+            print(f"{path}: {layout.width}x{layout.height}, {len(layout.ghost_spawns)} ghost spawn(s) -> {target}")
+        return
+    
+    if args.export_maze:
+        with open(args.export_maze, "w") as f:
+            f.write(MazeLayout.from_level(Level()).to_text())
+        return
+    
+    if args.startup_time:
+        run_startup_time()
+        return
+    
+    if args.scores_bench:
+        raise SystemExit(0 if run_score_benchmark(args.scores_bench, args.seed) else 1)
+    
+    if args.top:
+        # --top-level and --top-seed boards are for the first --maze, else the built-in one
+        try:
+            top_maze = load_maze(args.maze[0]).digest() if args.maze else ""
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        with ScoreStore(args.scores or SCORE_DB_PATH) as store:
+            for i, entry in enumerate(store.top(args.top, args.top_level, args.top_seed, top_maze)):
+                print(f"{i + 1:>3}. {entry}")
+        return
+    
+    # Interactive games keep scores by default, headless runs when asked
+    # (the store is only opened by the modes that record to it)
+    record_scores = args.scores if not args.no_scores else None
+    
+    if args.maze_check:
+        raise SystemExit(0 if run_maze_check(args.maze_check, args.seed) else 1)
+    
+    # Modes other than the game itself play the first --maze only. Every
+    # one is loaded now, so a bad file is reported before anything starts.
+    maze = args.maze[0] if args.maze else None
+    try:
+        for path in args.maze:
+            load_maze(path)
+        layout = load_maze(maze) if maze else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    maze_cache = MazeCache(args.maze_cache or None) if args.generated else None
+    if maze_cache is not None and layout is None and not args.replay:
+        layout = maze_cache.get(args.seed)
+        # Rollout workers map the cached file if there is one, and otherwise
+        # generate the same maze from its key
+        key = (args.seed, 0, GRID_WIDTH, GRID_HEIGHT)
+        maze = key
+        if maze_cache.directory is not None and os.path.exists(maze_cache.path(key)):
+            maze = maze_cache.path(key)
+    
+    if args.bench:
+        ok = run_bench_suite(args.bench_quick, args.bench_save, args.bench_baseline, args.bench_threshold)
+        raise SystemExit(0 if ok else 1)
+    
+    if args.env:
+        run_env_benchmark(args.env, args.ticks, args.seed, layout)
+        return
+    
+    if args.capture:
+        run_capture_benchmark(args.capture, args.capture_scale, args.capture_gray, args.seed, layout)
+        return
+    
+    if args.mcts:
+        run_mcts_demo(args.mcts, args.games, args.seed, args.ticks, layout)
+        return
+    
+    if args.swarm is not None:
+        run_swarm(tuple(args.swarm) or SWARM_GHOSTS, args.seed, layout=layout)
+        return
+    
+    if args.players < 1 or args.players > 255:
+        parser.error("--players must be between 1 and 255")
+    
+    if args.net_load or args.serve is not None or args.connect:
+        import asyncio
+        import netplay
+        try:
+            netplay.check_net_layout(layout)
+        except ValueError as e:
+            parser.error(str(e))
+        
+    if args.net_load:
+        ok = asyncio.run(netplay.run_netplay_load(args.net_load, args.players, args.net_seconds, args.seed, layout))
+        raise SystemExit(0 if ok else 1)
+    
+    if args.serve is not None:
+        try:
+            asyncio.run(netplay.serve_netplay(args.serve, args.players, layout))
+        except KeyboardInterrupt:
+            pass
+        return
+    
+    if args.connect:
+        host, port = netplay.net_address(args.connect)
+        try:
+            asyncio.run(netplay.play_netplay(host, port, args.session, args.render_fps or FPS))
+        except (OSError, ConnectionError) as e:
+            parser.exit(1, f"{args.connect}: {e}\n")
+        except KeyboardInterrupt:
+            pass
+        return
+    
+    if args.replay:
+        try:
+            replay = Replay.load(args.replay)
+            if (maze_cache is not None and layout is None and
+                    (replay.maze_kind == Replay.MAZE_GENERATED or replay.maze_digest is None)):
+                layout = maze_cache.get(replay.seed, maze_difficulty(replay.level_num), replay.width,
+                                        replay.height)
+            layout = replay_layout(replay, layout)
+        except (OSError, ValueError) as e:
+            parser.error(f"{args.replay}: {e}")
+        start = time.perf_counter()
+        level = play_replay(replay, tuple(args.checkpoint), args.snapshot_dir, layout)
+        elapsed = time.perf_counter() - start
+        print(f"Replayed {level.ticks} ticks in {elapsed:.3f}s: score {level.pacman.score}, "
+              f"lives {level.pacman.lives}")
+        return
+    
+    if args.rollouts:
+        if args.scaling:
+            measure_scaling(args.rollouts, args.seed, args.ticks, args.workers, maze)
+        else:
+            with RolloutRunner(args.workers) as runner:
+                report = runner.run(args.rollouts, args.seed, max_ticks=args.ticks, maze=maze)
+            print(report)
+            if record_scores:
+                # Workers play `maze`, which is `layout`
+                with ScoreStore(record_scores) as scores:
+                    for i, result in enumerate(report.results):
+                        scores.add_result(result, args.seed + i, source="rollout",
+                                          maze=layout.digest() if layout is not None else "")
+        return
+    
+    if args.batch_check:
+        ok = check_batch_equivalence(seed=args.seed, layout=layout)
+        print("Batch simulator matches Level" if ok else "Batch simulator diverged from Level")
+        raise SystemExit(0 if ok else 1)
+        
+    if args.batch:
+        run_batch(args.batch, args.seed, args.ticks, layout)
+        return
+    
+    if args.events_bench:
+        raise SystemExit(0 if run_event_benchmark(args.games, args.seed, args.ticks, layout) else 1)
+    
+    if args.events:
+        os.makedirs(args.events, exist_ok=True)
+    
+    if args.headless:
+        if record_scores:
+            with ScoreStore(record_scores) as scores:
+                run_headless(args.games, args.seed, args.ticks, layout, args.events, scores)
+        else:
+            run_headless(args.games, args.seed, args.ticks, layout, args.events)
+        return
+    
+    scores = None if args.no_scores else ScoreStore(args.scores or SCORE_DB_PATH)
+    game = Game(ReplayRecorder(args.record) if args.record else None, args.render_fps, args.maze, maze_cache,
+                args.events, scores)
+    if args.profile or args.profile_out:
+        game.set_profiling(True)
+        game.profiler.show_overlay = args.profile
+    game.profile_path = args.profile_out
     game.run()
+
+if __name__ == "__main__":
+    main()
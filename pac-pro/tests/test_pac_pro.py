@@ -0,0 +1,114 @@
+import importlib.util
+import os
+import random
+import sys
+
+import pytest
+
+# The game is a script with a dash in its name, so it's loaded from its path.
+# It's registered as pac_pro_game, the name netplay.py imports it under.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+HERE = os.path.dirname(os.path.abspath(__file__))
+GAME_DIR = os.path.dirname(HERE)
+CLASSIC = os.path.join(GAME_DIR, "mazes", "classic.maze")
+
+if "pac_pro_game" not in sys.modules:
+    spec = importlib.util.spec_from_file_location("pac_pro_game", os.path.join(GAME_DIR, "pac-pro-game.py"))
+    sys.modules["pac_pro_game"] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules["pac_pro_game"])
+game = sys.modules["pac_pro_game"]
+
+def record_game(path, layout=None, maze_kind=game.Replay.MAZE_BUILTIN, seed=3, ticks=1500):
+    # Plays a level with random turns through a ReplayRecorder, returning
+    # the finished Level and the replay file written for it
+    level = game.Level(seed=seed, layout=layout)
+    recorder = game.ReplayRecorder(path)
+    recorder.start(level, seed, maze_kind)
+    turns = random.Random(seed)
+    while level.ticks < ticks:
+        if turns.random() < 0.05:
+            direction = turns.choice(game.DIRECTIONS)
+            recorder.record(level, direction)
+            level.pacman.next_direction = direction
+        if level.update() != "PLAYING":
+            break
+    return level, recorder.finish(level)
+
+def assert_same_game(replayed, level):
+    assert replayed.ticks == level.ticks
+    assert replayed.pacman.score == level.pacman.score
+    assert replayed.pacman.lives == level.pacman.lives
+    assert (replayed.pacman.x, replayed.pacman.y) == (level.pacman.x, level.pacman.y)
+    assert bytes(replayed.pellets.live) == bytes(level.pellets.live)
+
+@pytest.mark.skipif(game.load_numpy() is None, reason="BatchSimulator requires NumPy")
+@pytest.mark.parametrize("maze", ["builtin", "classic"])
+def test_batch_simulator_matches_level(maze):
+    layout = game.load_maze(CLASSIC) if maze == "classic" else None
+    assert game.check_batch_equivalence(num_games=8, ticks=1500, layout=layout)
+
+def test_replay_round_trip_builtin(tmp_path):
+    level, path = record_game(str(tmp_path / "run.pprp"))
+    replay = game.Replay.load(path)
+    assert replay.maze_kind == game.Replay.MAZE_BUILTIN
+    assert replay.end_tick == level.ticks
+    assert game.replay_layout(replay) is None
+    assert_same_game(game.play_replay(replay), level)
+
+def test_replay_round_trip_maze_file(tmp_path):
+    layout = game.load_maze(CLASSIC)
+    level, path = record_game(str(tmp_path / "run.pprp"), layout, game.Replay.MAZE_FILE)
+    replay = game.Replay.load(path)
+    assert replay.maze_digest == layout.digest()
+    assert_same_game(game.play_replay(replay, layout=game.replay_layout(replay, layout)), level)
+
+def test_replay_round_trip_generated(tmp_path):
+    layout = game.generate_maze(3, game.maze_difficulty(1))
+    level, path = record_game(str(tmp_path / "run.pprp"), layout, game.Replay.MAZE_GENERATED)
+    replay = game.Replay.load(path)
+    # Rebuilt from the replay's seed when no maze is given
+    rebuilt = game.replay_layout(replay)
+    assert rebuilt.digest() == layout.digest()
+    assert_same_game(game.play_replay(replay, layout=rebuilt), level)
+
+def test_replay_refuses_the_wrong_maze(tmp_path):
+    classic = game.load_maze(CLASSIC)
+    _, builtin_path = record_game(str(tmp_path / "builtin.pprp"), ticks=100)
+    _, file_path = record_game(str(tmp_path / "file.pprp"), classic, game.Replay.MAZE_FILE, ticks=100)
+    builtin, on_file = game.Replay.load(builtin_path), game.Replay.load(file_path)
+    with pytest.raises(ValueError, match="built-in maze"):
+        game.replay_layout(builtin, classic)
+    with pytest.raises(ValueError, match="pass it with --maze"):
+        game.replay_layout(on_file)
+    with pytest.raises(ValueError, match="not "):
+        game.replay_layout(on_file, game.generate_maze(1))
+
+def test_replay_rejects_corrupt_files(tmp_path):
+    _, path = record_game(str(tmp_path / "run.pprp"), ticks=300)
+    with open(path, "rb") as f:
+        data = f.read()
+    with pytest.raises(ValueError, match="truncated"):
+        game.Replay.from_bytes(data[:-1])
+    with pytest.raises(ValueError, match="truncated"):
+        game.Replay.from_bytes(data[:10])
+    with pytest.raises(ValueError, match="Not a Pac Pro replay"):
+        game.Replay.from_bytes(b"XXXX" + data[4:])
+
+def test_maze_digest_follows_the_maze_not_its_source(tmp_path):
+    with open(CLASSIC) as f:
+        text = f.read()
+    parsed = game.MazeLayout.parse(text, CLASSIC)
+    mapped = game.load_maze(CLASSIC)
+    digest = parsed.digest()
+    assert len(digest) == 16 and int(digest, 16) >= 0
+    assert mapped.digest() == digest
+    assert game.MazeLayout.from_buffer(parsed.to_bytes()).digest() == digest
+    copy = tmp_path / "classic.maze"
+    copy.write_text(text)
+    assert game.map_compiled_maze(game.compile_maze(str(copy))).digest() == digest
+
+def test_maze_digest_tells_mazes_apart():
+    assert game.generate_maze(7).digest() == game.generate_maze(7).digest()
+    assert game.generate_maze(7).digest() != game.generate_maze(8).digest()
+    level = game.Level()
+    assert game.MazeLayout.from_level(level).digest() != game.load_maze(CLASSIC).digest()
@@ -1,3 +1,6 @@
+import contextlib
+import io
+import os
 import random
 import time
 import sys
@@ -11,6 +14,63 @@ Type = Enum('Type', [
     'BUG', 'ROCK', 'GHOST', 'DRAGON', 'DARK', 'STEEL', 'FAIRY'
 ])
 
+# Attacking type: (super effective against, not very effective against, no effect on)
+TYPE_CHART_SOURCE = {
+    Type.NORMAL: ((), (Type.ROCK, Type.STEEL), (Type.GHOST,)),
+    Type.FIRE: ((Type.GRASS, Type.ICE, Type.BUG, Type.STEEL),
+                (Type.FIRE, Type.WATER, Type.ROCK, Type.DRAGON), ()),
+    Type.WATER: ((Type.FIRE, Type.GROUND, Type.ROCK), (Type.WATER, Type.GRASS, Type.DRAGON), ()),
+    Type.ELECTRIC: ((Type.WATER, Type.FLYING), (Type.ELECTRIC, Type.GRASS, Type.DRAGON), (Type.GROUND,)),
+    Type.GRASS: ((Type.WATER, Type.GROUND, Type.ROCK),
+                 (Type.FIRE, Type.GRASS, Type.POISON, Type.FLYING, Type.BUG, Type.DRAGON, Type.STEEL), ()),
+    Type.ICE: ((Type.GRASS, Type.GROUND, Type.FLYING, Type.DRAGON),
+               (Type.FIRE, Type.WATER, Type.ICE, Type.STEEL), ()),
+    Type.FIGHTING: ((Type.NORMAL, Type.ICE, Type.ROCK, Type.DARK, Type.STEEL),
+                    (Type.POISON, Type.FLYING, Type.PSYCHIC, Type.BUG, Type.FAIRY), (Type.GHOST,)),
+    Type.POISON: ((Type.GRASS, Type.FAIRY), (Type.POISON, Type.GROUND, Type.ROCK, Type.GHOST), (Type.STEEL,)),
+    Type.GROUND: ((Type.FIRE, Type.ELECTRIC, Type.POISON, Type.ROCK, Type.STEEL),
+                  (Type.GRASS, Type.BUG), (Type.FLYING,)),
+    Type.FLYING: ((Type.GRASS, Type.FIGHTING, Type.BUG), (Type.ELECTRIC, Type.ROCK, Type.STEEL), ()),
+    Type.PSYCHIC: ((Type.FIGHTING, Type.POISON), (Type.PSYCHIC, Type.STEEL), (Type.DARK,)),
+    Type.BUG: ((Type.GRASS, Type.PSYCHIC, Type.DARK),
+               (Type.FIRE, Type.FIGHTING, Type.POISON, Type.FLYING, Type.GHOST, Type.STEEL, Type.FAIRY), ()),
+    Type.ROCK: ((Type.FIRE, Type.ICE, Type.FLYING, Type.BUG), (Type.FIGHTING, Type.GROUND, Type.STEEL), ()),
+    Type.GHOST: ((Type.PSYCHIC, Type.GHOST), (Type.DARK,), (Type.NORMAL,)),
+    Type.DRAGON: ((Type.DRAGON,), (Type.STEEL,), (Type.FAIRY,)),
+    Type.DARK: ((Type.PSYCHIC, Type.GHOST), (Type.FIGHTING, Type.DARK, Type.FAIRY), ()),
+    Type.STEEL: ((Type.ICE, Type.ROCK, Type.FAIRY), (Type.FIRE, Type.WATER, Type.ELECTRIC, Type.STEEL), ()),
+    Type.FAIRY: ((Type.FIGHTING, Type.DRAGON, Type.DARK), (Type.FIRE, Type.POISON, Type.STEEL), ()),
+}
+
+def build_type_chart() -> List[List[float]]:
+    # TYPE_CHART[attack][defend], both indexed by Type.value - 1
+    chart = [[1.0] * len(Type) for _ in Type]
+    for attack, groups in TYPE_CHART_SOURCE.items():
+        row = chart[attack.value - 1]
+        for multiplier, defenders in zip((2.0, 0.5, 0.0), groups):
+            for defend in defenders:
+                row[defend.value - 1] = multiplier
+    return chart
+
+TYPE_CHART = build_type_chart()
+
+# Defending type combination -> multiplier against each attacking type,
+# filled in as combinations turn up; Pokémon of the same types share a row
+_defense_rows: Dict[Tuple[Type, ...], Tuple[float, ...]] = {}
+
+def defense_row(types: List[Type]) -> Tuple[float, ...]:
+    key = tuple(types)
+    row = _defense_rows.get(key)
+    if row is None:
+        multipliers = []
+        for attack_row in TYPE_CHART:
+            product = 1.0
+            for t in key:
+                product *= attack_row[t.value - 1]
+            multipliers.append(product)
+        row = _defense_rows[key] = tuple(multipliers)
+    return row
+
 class Stats:
     def __init__(self, hp: int, attack: int, defense: int, sp_attack: int, sp_defense: int, speed: int):
         self.hp = hp
@@ -35,6 +95,7 @@ class Move:
                  category: str = 'physical', effect: Optional[callable] = None):
         self.name = name
         self.move_type = move_type
+        self.type_index = move_type.value - 1
         self.power = power
         self.accuracy = accuracy
         self.pp = pp
@@ -57,6 +118,7 @@ class Pokemon:
                  moves: List[Move]):
         self.name = name
         self.types = pokemon_type
+        self.defense_row = defense_row(pokemon_type)
         self.level = level
         self.base_stats = base_stats
         self.current_hp = self.calculate_stat(base_stats.hp)
@@ -222,25 +284,27 @@ class Battle:
             
             # Get player action
             player_action = self.get_player_action()
-            
-            # Get opponent action (AI)
-            opponent_action = self.get_ai_action()
-            
-            # Determine turn order based on speed
-            player_first = (
-                self.player.current_pokemon.stats['speed'] >=
-                self.opponent.current_pokemon.stats['speed']
-            )
-            
-            # Execute actions in speed order
-            if player_first:
-                self.execute_action(self.player, self.opponent, player_action)
-                if not self.opponent.current_pokemon.is_fainted():
-                    self.execute_action(self.opponent, self.player, opponent_action)
-            else:
+            self.play_turn(player_action)
+    
+    def play_turn(self, player_action: str) -> None:
+        # Get opponent action (AI)
+        opponent_action = self.get_ai_action()
+        
+        # Determine turn order based on speed
+        player_first = (
+            self.player.current_pokemon.stats['speed'] >=
+            self.opponent.current_pokemon.stats['speed']
+        )
+        
+        # Execute actions in speed order
+        if player_first:
+            self.execute_action(self.player, self.opponent, player_action)
+            if not self.opponent.current_pokemon.is_fainted():
                 self.execute_action(self.opponent, self.player, opponent_action)
-                if not self.player.current_pokemon.is_fainted():
-                    self.execute_action(self.player, self.opponent, player_action)
+        else:
+            self.execute_action(self.opponent, self.player, opponent_action)
+            if not self.player.current_pokemon.is_fainted():
+                self.execute_action(self.player, self.opponent, player_action)
     
     def get_player_action(self) -> str:
         while True:
@@ -388,21 +452,8 @@ class Battle:
         # STAB (Same Type Attack Bonus)
         stab = 1.5 if move.move_type in attacker.types else 1.0
         
-        # Type effectiveness (simplified)
-        effectiveness = 1.0
-        for t in defender.types:
-            # This is a simplified type chart
-            if (move.move_type == Type.FIRE and t in [Type.GRASS, Type.ICE, Type.BUG]) or \
-               (move.move_type == Type.WATER and t in [Type.FIRE, Type.GROUND, Type.ROCK]) or \
-               (move.move_type == Type.ELECTRIC and t in [Type.WATER, Type.FLYING]):
-                effectiveness *= 2.0
-            elif (move.move_type == Type.FIRE and t in [Type.WATER, Type.ROCK, Type.DRAGON]) or \
-                 (move.move_type == Type.WATER and t in [Type.WATER, Type.GRASS, Type.DRAGON]) or \
-                 (move.move_type == Type.ELECTRIC and t in [Type.ELECTRIC, Type.GRASS, Type.DRAGON]):
-                effectiveness *= 0.5
-            elif (move.move_type == Type.NORMAL and t == Type.ROCK) or \
-                 (move.move_type == Type.FIGHTING and t == Type.GHOST):
-                effectiveness = 0
+        # Type effectiveness, both types included
+        effectiveness = defender.defense_row[move.type_index]
         
         if effectiveness == 0:
             print("It had no effect!")
@@ -430,67 +481,108 @@ class Battle:
         if move.effect:
             move.effect(attacker, defender)
 
-# Create some moves
-tackle = Move("Tackle", Type.NORMAL, 40, 100, 35)
-ember = Move("Ember", Type.FIRE, 40, 100, 25)
-water_gun = Move("Water Gun", Type.WATER, 40, 100, 25)
-thunder_shock = Move("Thunder Shock", Type.ELECTRIC, 40, 100, 30)
-vine_whip = Move("Vine Whip", Type.GRASS, 45, 100, 25)
-flamethrower = Move("Flamethrower", Type.FIRE, 90, 100, 15)
-surf = Move("Surf", Type.WATER, 90, 100, 15)
-thunderbolt = Move("Thunderbolt", Type.ELECTRIC, 90, 100, 15)
-solar_beam = Move("Solar Beam", Type.GRASS, 120, 100, 10)
-
-# Create some Pokémon
-charmander = Pokemon(
-    "Charmander",
-    [Type.FIRE],
-    10,
-    Stats(39, 52, 43, 60, 50, 65),
-    [tackle, ember, flamethrower]
-)
-
-squirtle = Pokemon(
-    "Squirtle",
-    [Type.WATER],
-    10,
-    Stats(44, 48, 65, 50, 64, 43),
-    [tackle, water_gun, surf]
-)
-
-bulbasaur = Pokemon(
-    "Bulbasaur",
-    [Type.GRASS, Type.POISON],
-    10,
-    Stats(45, 49, 49, 65, 65, 45),
-    [tackle, vine_whip, solar_beam]
-)
-
-pikachu = Pokemon(
-    "Pikachu",
-    [Type.ELECTRIC],
-    10,
-    Stats(35, 55, 40, 50, 50, 90),
-    [tackle, thunder_shock, thunderbolt]
-)
+def create_trainers() -> Tuple[Trainer, Trainer]:
+    # The demo roster is built on demand rather than at import, so tools
+    # that only want the battle classes don't pay for it (or its output)
+    # Create some moves
+    tackle = Move("Tackle", Type.NORMAL, 40, 100, 35)
+    ember = Move("Ember", Type.FIRE, 40, 100, 25)
+    water_gun = Move("Water Gun", Type.WATER, 40, 100, 25)
+    thunder_shock = Move("Thunder Shock", Type.ELECTRIC, 40, 100, 30)
+    vine_whip = Move("Vine Whip", Type.GRASS, 45, 100, 25)
+    flamethrower = Move("Flamethrower", Type.FIRE, 90, 100, 15)
+    surf = Move("Surf", Type.WATER, 90, 100, 15)
+    thunderbolt = Move("Thunderbolt", Type.ELECTRIC, 90, 100, 15)
+    solar_beam = Move("Solar Beam", Type.GRASS, 120, 100, 10)
+    
+    # Create some Pokémon
+    charmander = Pokemon(
+        "Charmander",
+        [Type.FIRE],
+        10,
+        Stats(39, 52, 43, 60, 50, 65),
+        [tackle, ember, flamethrower]
+    )
+    
+    squirtle = Pokemon(
+        "Squirtle",
+        [Type.WATER],
+        10,
+        Stats(44, 48, 65, 50, 64, 43),
+        [tackle, water_gun, surf]
+    )
+    
+    bulbasaur = Pokemon(
+        "Bulbasaur",
+        [Type.GRASS, Type.POISON],
+        10,
+        Stats(45, 49, 49, 65, 65, 45),
+        [tackle, vine_whip, solar_beam]
+    )
+    
+    pikachu = Pokemon(
+        "Pikachu",
+        [Type.ELECTRIC],
+        10,
+        Stats(35, 55, 40, 50, 50, 90),
+        [tackle, thunder_shock, thunderbolt]
+    )
+    
+    # Create trainers
+    player = Trainer("Ash")
+    player.add_pokemon(charmander)
+    player.add_pokemon(squirtle)
+    player.add_pokemon(bulbasaur)
+    
+    rival = Trainer("Gary")
+    rival.add_pokemon(pikachu)
+    
+    # Add some items to the rival
+    rival.items = {
+        'potion': 2,
+        'super potion': 1,
+        'revive': 1
+    }
+    
+    return player, rival
 
-# Create trainers
-player = Trainer("Ash")
-player.add_pokemon(charmander)
-player.add_pokemon(squirtle)
-player.add_pokemon(bulbasaur)
+STARTUP_RUNS = 5
 
-rival = Trainer("Gary")
-rival.add_pokemon(pikachu)
+def time_import(path: str, runs: int = STARTUP_RUNS) -> float:
+    # Best of `runs` imports of the module in a fresh interpreter, in seconds.
+    # subprocess and argparse are imported where used to keep import cheap.
+    import subprocess
+    code = ("import importlib.util, sys, time\n"
+            "start = time.perf_counter()\n"
+            "spec = importlib.util.spec_from_file_location('startup_probe', sys.argv[1])\n"
+            "spec.loader.exec_module(importlib.util.module_from_spec(spec))\n"
+            "print(time.perf_counter() - start)\n")
+    return min(float(subprocess.run([sys.executable, "-c", code, path], check=True, capture_output=True,
+                                    text=True).stdout) for _ in range(runs))
 
-# Add some items to the rival
-rival.items = {
-    'potion': 2,
-    'super potion': 1,
-    'revive': 1
-}
+def run_startup_time() -> None:
+    # Cold import, then building the roster and playing the first turn with
+    # the first move; battle output is swallowed
+    print(f"import: {time_import(os.path.abspath(__file__)) * 1e3:.1f}ms (best of {STARTUP_RUNS})")
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        player, rival = create_trainers()
+        created = time.perf_counter()
+        battle = Battle(player, rival)
+        battle.play_turn(f"move {player.current_pokemon.moves[0].name}")
+    turn = time.perf_counter()
+    print(f"roster: {(created - start) * 1e3:.2f}ms, first turn: {(turn - created) * 1e3:.2f}ms")
 
 def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Pokémon battle")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="report import time and latency to the first turn")
+    args = parser.parse_args()
+    if args.startup_time:
+        run_startup_time()
+        return
+    
     print("Welcome to Pokémon!")
     print("1. Start New Game")
     print("2. Exit")
@@ -499,6 +591,7 @@ def main():
         choice = input("Choose an option (1-2): ")
         
         if choice == '1':
+            player, rival = create_trainers()
             battle = Battle(player, rival)
             battle.start_battle()
             break